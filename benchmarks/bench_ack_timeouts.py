@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""Cost of scheduling and cancelling subscription ack timeouts.
+
+Usage: python benchmarks/bench_ack_timeouts.py [subscriptions]
+
+Compares the TimingWheel used by PatchedAckTimeoutRegistry with one reactor.callLater
+per subscription. The callLater column is a lower bound for the previous registry,
+which also crossed the Tornado-on-Twisted bridge for every call.
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import sys
+import timeit
+
+from twisted.internet import reactor
+
+from deepstreampy_twisted.timing import TimingWheel
+
+
+def noop(*args):
+    pass
+
+
+def run_call_later(count):
+    calls = [reactor.callLater(15, noop, i) for i in range(count)]
+    for call in calls:
+        call.cancel()
+
+
+def run_wheel(count):
+    wheel = TimingWheel(reactor)
+    timers = [wheel.add(15, noop, i) for i in range(count)]
+    for timer in timers:
+        timer.cancel()
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 100000
+    print('add + cancel of %d ack timeouts' % count)
+    for name, func in (('reactor.callLater', run_call_later), ('TimingWheel', run_wheel)):
+        best = min(timeit.repeat(lambda: func(count), number=1, repeat=3))
+        print('%-20s %10.1f ms %10.0f ns/timeout' % (name, best * 1e3, best / count * 1e9))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
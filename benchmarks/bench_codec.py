@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""Typed payload encode/decode throughput for each installed JSON codec.
+
+Usage: python benchmarks/bench_codec.py [iterations]
+
+Encodes with message_builder.typed() and decodes with message_parser.convert_typed(), the
+calls made for every event, RPC and record payload, for a small event payload and a larger
+record snapshot. Codecs whose package is not installed are skipped.
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import sys
+import time
+
+from deepstreampy.message import message_builder, message_parser
+from deepstreampy_twisted import codec
+
+EVENT = {'symbol': 'ACME', 'price': 101.25, 'volume': 300, 'side': 'buy', 'ts': 1500000000123}
+RECORD = {
+    'owner': 'bench',
+    'status': 'active',
+    'items': [{'id': i, 'name': 'item-%d' % i, 'price': i * 1.5, 'tags': ['a', 'b', 'c'],
+               'stock': {'warehouse': i % 7, 'count': i * 3}} for i in range(200)],
+}
+
+
+def run(payload, iterations):
+    typed, convert = message_builder.typed, message_parser.convert_typed
+    encoded = typed(payload)
+    start = time.time()
+    for _ in range(iterations):
+        typed(payload)
+    encode = time.time() - start
+    start = time.time()
+    for _ in range(iterations):
+        convert(encoded, None)
+    decode = time.time() - start
+    return encode, decode
+
+
+def main(argv):
+    iterations = int(argv[1]) if len(argv) > 1 else 20000
+    print('%-8s %-8s %14s %14s' % ('codec', 'payload', 'encodes/s', 'decodes/s'))
+    for name in ('json', 'ujson', 'orjson'):
+        try:
+            codec.install(name)
+        except ImportError:
+            print('%-8s (not installed)' % name)
+            continue
+        for label, payload, count in (('event', EVENT, iterations), ('record', RECORD, iterations // 100 or 1)):
+            encode, decode = run(payload, count)
+            print('%-8s %-8s %14d %14d' % (name, label, count / encode, count / decode))
+    codec.install('json')
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""Bytes saved against CPU spent by permessage-deflate on record traffic.
+
+Usage: python benchmarks/bench_compression.py [messages]
+
+Streams record reads and patches through Autobahn's permessage-deflate, as a server sends
+them to a client, for each set of compression options WSDeepstreamFactory can negotiate. Sizes
+are frame payloads; times are per message, for compressing and decompressing.
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import json
+import random
+import sys
+import time
+
+from autobahn.websocket.compress import PerMessageDeflate
+
+_rng = random.Random(1)
+_WORDS = ('alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike november oscar papa '
+          'quebec romeo sierra tango uniform victor whiskey xray yankee zulu').split()
+
+
+def _text(words):
+    return ' '.join(_rng.choice(_WORDS) for _ in range(words))
+
+
+def profile(i):
+    return {'id': 'user/%d' % i, 'name': _text(2).title(), 'email': 'user%d@example.com' % i,
+            'age': _rng.randint(18, 90), 'verified': _rng.random() < 0.5,
+            'address': {'street': '%d %s' % (_rng.randint(1, 999), _text(2).title()), 'city': _text(1).title(),
+                        'country': _rng.choice(['PT', 'DE', 'US', 'JP', 'BR'])},
+            'tags': [_rng.choice(_WORDS) for _ in range(5)], 'bio': _text(40)}
+
+
+def order(i):
+    return {'id': 'order/%d' % i, 'customer': 'user/%d' % _rng.randint(1, 10000), 'status': 'open',
+            'lines': [{'sku': 'SKU-%05d' % _rng.randint(0, 99999), 'title': _text(4), 'qty': _rng.randint(1, 5),
+                       'price': round(_rng.uniform(1, 500), 2)} for _ in range(40)]}
+
+
+def dashboard(i):
+    return {'id': 'dashboard/%d' % i, 'series': [
+        {'name': _text(2), 'points': [[1500000000 + 60 * t, round(_rng.gauss(100, 15), 3)] for t in range(300)]}
+        for _ in range(8)]}
+
+
+def read(name, version, data):
+    return ('R\x1fR\x1f%s\x1f%d\x1f%s\x1e' % (name, version, json.dumps(data, separators=(',', ':')))).encode()
+
+
+def patch(name, version, i):
+    return ('R\x1fP\x1f%s\x1f%d\x1fstatus\x1fS%s\x1e' % (name, version, _rng.choice(_WORDS))).encode()
+
+
+def workloads(count):
+    return [
+        ('profile reads', [read('user/%d' % i, 1, profile(i)) for i in range(count)]),
+        ('order reads', [read('order/%d' % i, 3, order(i)) for i in range(count // 4 or 1)]),
+        ('dashboards', [read('dashboard/%d' % i, 9, dashboard(i)) for i in range(count // 20 or 1)]),
+        ('patches', [patch('order/%d' % i, i, i) for i in range(count)]),
+    ]
+
+
+# (label, window bits, no context takeover, mem level)
+CONFIGS = [
+    ('default', 15, False, 8),
+    ('no takeover', 15, True, 8),
+    ('window 10', 10, False, 8),
+    ('window 9, mem 4', 9, False, 4),
+    ('window 9, no tk', 9, True, 4),
+]
+
+
+def run(messages, window_bits, no_context_takeover, mem_level, min_bytes):
+    sender = PerMessageDeflate(True, no_context_takeover, no_context_takeover, window_bits, window_bits, mem_level)
+    receiver = PerMessageDeflate(False, no_context_takeover, no_context_takeover, window_bits, window_bits,
+                                 mem_level)
+    frames = []
+    start = time.time()
+    for message in messages:
+        if len(message) < min_bytes:
+            frames.append((False, message))
+            continue
+        sender.start_compress_message()
+        frames.append((True, sender.compress_message_data(message) + sender.end_compress_message()))
+    compressed = time.time() - start
+    start = time.time()
+    for is_compressed, frame in frames:
+        if is_compressed:
+            receiver.start_decompress_message()
+            receiver.decompress_message_data(frame)
+            receiver.end_decompress_message()
+    decompressed = time.time() - start
+    return sum(len(frame) for _, frame in frames), compressed, decompressed
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 400
+    print('%-16s %-17s %10s %8s %12s %14s' % ('workload', 'options', 'bytes/msg', 'ratio', 'compress us',
+                                             'decompress us'))
+    for workload, messages in workloads(count):
+        raw = sum(len(message) for message in messages) / len(messages)
+        print('%-16s %-17s %10d %8s %12s %14s' % (workload, 'off', raw, '1.00', '-', '-'))
+        for label, window_bits, no_context_takeover, mem_level in CONFIGS:
+            size, compressed, decompressed = run(messages, window_bits, no_context_takeover, mem_level, 0)
+            per = len(messages)
+            print('%-16s %-17s %10d %8.2f %12.1f %14.1f' % (
+                '', label, size / per, size / per / raw, compressed / per * 1e6, decompressed / per * 1e6))
+        if workload == 'patches':
+            size, compressed, decompressed = run(messages, 15, False, 8, 256)
+            print('%-16s %-17s %10d %8.2f %12.1f %14.1f' % (
+                '', 'min_bytes 256', size / len(messages), size / len(messages) / raw,
+                compressed / len(messages) * 1e6, decompressed / len(messages) * 1e6))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""Messages per second through incoming-message dispatch.
+
+Usage: python benchmarks/bench_dispatch.py [messages]
+
+Compares the dispatch table (with the EVENT/EVT fast path) against the previous
+if/elif chain followed by the upstream Client._on_message topic lookup.
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import sys
+import timeit
+
+from deepstreampy import constants
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from twisted.internet import task
+
+URL = "ws://localhost:7777/deepstream"
+
+MESSAGES = {
+    'event': {'topic': 'E', 'action': 'EVT', 'data': ['bench', 'N1']},
+    'event ack': {'topic': 'E', 'action': 'A', 'data': ['S', 'bench']},
+    'rpc request': {'topic': 'P', 'action': 'REQ', 'data': ['unprovided', '1', 'N1']},
+}
+
+
+def legacy_dispatch(proto, client, msg):
+    if msg['topic'] == constants.topic.CONNECTION:
+        proto._handle_connection_response(msg)
+    elif msg['topic'] == constants.topic.AUTH:
+        proto._handle_auth_response(msg)
+    else:
+        client._on_message(msg)
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 200000
+    reactor = task.Clock()
+    client = DeepstreamClient(URL, reactor=reactor, factory=DeepstreamFactory)
+    client.on('error', lambda *args: None)
+    client.event.subscribe('bench', lambda data: None)
+    proto = client._factory.buildProtocol(('localhost', 0))
+    client._factory.send = lambda raw_message: None
+    dispatch = client._factory.dispatcher.dispatch
+
+    print('%-12s %16s %16s' % ('message', 'table msg/s', 'legacy msg/s'))
+    for name, message in sorted(MESSAGES.items()):
+        table = min(timeit.repeat(lambda: dispatch(dict(message)), number=count, repeat=3))
+        legacy = min(timeit.repeat(lambda: legacy_dispatch(proto, client, dict(message)),
+                                   number=count, repeat=3))
+        print('%-12s %16d %16d' % (name, count / table, count / legacy))
+    for call in reactor.getDelayedCalls():
+        call.cancel()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Per-byte cost of reassembling one large message delivered in many frames.
+
+Usage: python benchmarks/bench_framing.py [frame_size]
+
+The incremental framer should report a flat ns/byte figure from 1 KB to 10 MB.
+The legacy column reproduces the old concatenate-and-rsplit approach, which grows
+with the message size; it is skipped above 1 MB because it becomes quadratic.
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import sys
+import timeit
+
+from deepstreampy import constants
+from deepstreampy_twisted.framing import MessageFramer
+
+SIZES = [1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20]
+LEGACY_LIMIT = 1 << 20
+
+
+def make_frames(size, frame_size):
+    body = b'R' + b'\x1f' + b'R' + b'\x1f' + b'big' + b'\x1f' + b'1' + b'\x1f'
+    body += b'x' * (size - len(body) - 1) + constants.message.MESSAGE_SEPERATOR.encode('ascii')
+    return [body[i:i + frame_size] for i in range(0, len(body), frame_size)]
+
+
+def run_framer(frames):
+    framer = MessageFramer()
+    for frame in frames:
+        framer.feed(frame)
+
+
+def run_legacy(frames):
+    separator = constants.message.MESSAGE_SEPERATOR.encode('ascii')
+    buf = b''
+    for frame in frames:
+        full_buffer = buf + frame
+        split_buffer = full_buffer.rsplit(separator, 1)
+        buf = split_buffer[1] if len(split_buffer) > 1 else full_buffer
+
+
+def measure(func, frames, size):
+    number = max(1, (4 << 20) // size)
+    best = min(timeit.repeat(lambda: func(frames), number=number, repeat=3))
+    return best / number / size * 1e9
+
+
+def main(argv):
+    frame_size = int(argv[1]) if len(argv) > 1 else 4096
+    print('frame size: %d bytes' % frame_size)
+    print('%12s %16s %16s' % ('message', 'framer ns/byte', 'legacy ns/byte'))
+    for size in SIZES:
+        frames = make_frames(size, frame_size)
+        framer = measure(run_framer, frames, size)
+        if size <= LEGACY_LIMIT:
+            legacy = '%16.3f' % measure(run_legacy, frames, size)
+        else:
+            legacy = '%16s' % '-'
+        print('%12d %16.3f %s' % (size, framer, legacy))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
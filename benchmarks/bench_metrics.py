@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""Cost of metrics on the receive and send paths.
+
+Usage: python benchmarks/bench_metrics.py [frames]
+
+Receives frames of ten event messages through onMessage and emits events, with metrics off
+(the default) and on.
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import sys
+import time
+
+from deepstreampy.constants import connection_state
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+URL = "ws://localhost:7777/deepstream"
+FRAME = b''.join(b'E\x1fEVT\x1fbench\x1fN%d\x1e' % i for i in range(10))
+
+
+def run(frames, metrics):
+    reactor = task.Clock()
+    client = DeepstreamClient(URL, reactor=reactor, factory=DeepstreamFactory, metrics=metrics)
+    client.on('error', lambda *args: None)
+    client.event.subscribe('bench', lambda data: None)
+    proto = client._factory.buildProtocol(('localhost', 0))
+    client._factory._protocol_instance = proto
+    proto.makeConnection(proto_helpers.StringTransport())
+    proto.sendMessage = lambda payload: None
+    client._factory._set_state(connection_state.OPEN)
+
+    start = time.time()
+    for _ in range(frames):
+        proto.onMessage(FRAME, False)
+    received = time.time() - start
+    emit = client.event.emit
+    start = time.time()
+    for i in range(frames):
+        emit('bench', i)
+    sent = time.time() - start
+    for call in reactor.getDelayedCalls():
+        call.cancel()
+    return received, sent
+
+
+def main(argv):
+    frames = int(argv[1]) if len(argv) > 1 else 20000
+    print('%-8s %16s %16s' % ('metrics', 'received msg/s', 'sent msg/s'))
+    for label, metrics in (('off', None), ('on', True)):
+        received, sent = run(frames, metrics)
+        print('%-8s %16d %16d' % (label, frames * 10 / received, frames / sent))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
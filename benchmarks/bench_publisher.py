@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""Events emitted per second through event.emit and an event.publisher handle.
+
+Usage: python benchmarks/bench_publisher.py [events]
+
+Both paths run through the factory and protocol send path down to sendMessage, which
+discards the bytes.
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import sys
+import timeit
+
+from deepstreampy.constants import connection_state
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from twisted.internet import task
+
+URL = "ws://localhost:7777/deepstream"
+PAYLOADS = {
+    'number': 0.42,
+    'object': {'host': 'web-1', 'cpu': 0.42, 'load': [0.5, 0.4, 0.3]},
+}
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 200000
+    reactor = task.Clock()
+    client = DeepstreamClient(URL, reactor=reactor, factory=DeepstreamFactory)
+    proto = client._factory.buildProtocol(('localhost', 0))
+    client._factory._protocol_instance = proto
+    proto.sendMessage = lambda payload: None
+    client._factory._set_state(connection_state.OPEN)
+    publisher = client.event.publisher('telemetry.cpu')
+
+    print('%-8s %14s %14s' % ('payload', 'emit/s', 'publisher/s'))
+    for name, data in sorted(PAYLOADS.items()):
+        emit = min(timeit.repeat(lambda: client.event.emit('telemetry.cpu', data),
+                                 number=count, repeat=3))
+        publish = min(timeit.repeat(lambda: publisher.emit(data), number=count, repeat=3))
+        print('%-8s %14d %14d' % (name, count / emit, count / publish))
+    for call in reactor.getDelayedCalls():
+        call.cancel()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""RPC and event round-trip latency on the default reactor, the asyncio reactor and uvloop.
+
+Usage: python benchmarks/bench_reactors.py [round trips]
+
+Each reactor runs in its own process, with the in-process server and two clients over
+loopback WebSockets. One client makes RPCs that the other provides, then emits events the
+other is subscribed to, one at a time. On asyncio reactors the RPCs are also made through
+aio.AsyncDeepstreamClient, to show what the coroutine layer adds. uvloop is skipped unless
+it is installed.
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import json
+import subprocess
+import sys
+import time
+
+REACTORS = ('default', 'asyncio', 'uvloop')
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(int(q * len(samples)), len(samples) - 1)] * 1e6
+    return {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99),
+            'per_sec': len(samples) / sum(samples)}
+
+
+def measure(reactor_name, count):
+    if reactor_name != 'default':
+        from deepstreampy_twisted import aio
+        aio.install_reactor(use_uvloop=reactor_name == 'uvloop')
+    from twisted.internet import defer, reactor
+    from deepstreampy_twisted import DeepstreamClient, server
+
+    results = {}
+
+    @defer.inlineCallbacks
+    def connect(url, username):
+        client = DeepstreamClient(url, reactor=reactor)
+        connected = defer.Deferred()
+        client.connect(lambda: connected.callback(None))
+        yield connected
+        yield client.login({'username': username})
+        defer.returnValue(client)
+
+    @defer.inlineCallbacks
+    def wait_until(predicate):
+        while not predicate():
+            d = defer.Deferred()
+            reactor.callLater(0.01, d.callback, None)
+            yield d
+
+    @defer.inlineCallbacks
+    def run():
+        factory, port = server.listen(reactor=reactor)
+        url = 'ws://127.0.0.1:%d/deepstream' % port.getHost().port
+        caller = yield connect(url, 'caller')
+        provider = yield connect(url, 'provider')
+        provider.rpc.provide('echo', lambda data, response: response.send(data))
+        yield wait_until(lambda: factory.providers.get('echo'))
+
+        samples = []
+        for i in range(count):
+            start = time.time()
+            yield caller.rpc.make('echo', i)
+            samples.append(time.time() - start)
+        results['rpc'] = percentiles(samples)
+
+        waiting = []
+        yield provider.event.subscribe('bench', lambda data: waiting.pop().callback(data))
+        samples = []
+        for i in range(count):
+            received = defer.Deferred()
+            waiting.append(received)
+            start = time.time()
+            caller.event.emit('bench', i)
+            yield received
+            samples.append(time.time() - start)
+        results['event'] = percentiles(samples)
+
+        if reactor_name != 'default':
+            import asyncio
+            from deepstreampy_twisted import aio
+            client = aio.AsyncDeepstreamClient(client=caller)
+
+            async def awaited():
+                samples = []
+                for i in range(count):
+                    start = time.time()
+                    await client.rpc.make('echo', i)
+                    samples.append(time.time() - start)
+                return samples
+            samples = yield defer.Deferred.fromFuture(asyncio.ensure_future(awaited()))
+            results['rpc (await)'] = percentiles(samples)
+
+    def done(result):
+        reactor.stop()
+        return result
+
+    reactor.callWhenRunning(lambda: run().addBoth(done))
+    reactor.run()
+    return results
+
+
+def main(argv):
+    if len(argv) > 2 and argv[1] == '--child':
+        print(json.dumps(measure(argv[2], int(argv[3]))))
+        return
+    count = int(argv[1]) if len(argv) > 1 else 2000
+    print('%-9s %-12s %10s %10s %10s %12s' % ('reactor', 'round trip', 'p50 us', 'p90 us', 'p99 us', 'per sec'))
+    for name in REACTORS:
+        if name == 'uvloop':
+            try:
+                import uvloop  # noqa: F401
+            except ImportError:
+                print('%-9s (not installed)' % name)
+                continue
+        output = subprocess.check_output([sys.executable, __file__, '--child', name, str(count)])
+        results = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        for kind in ('rpc', 'rpc (await)', 'event'):
+            if kind in results:
+                stats = results[kind]
+                print('%-9s %-12s %10.1f %10.1f %10.1f %12.0f' % (
+                    name, kind, stats['p50'], stats['p90'], stats['p99'], stats['per_sec']))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
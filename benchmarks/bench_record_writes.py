@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Messages and bytes sent for bursts of record.set() calls.
+
+Usage: python benchmarks/bench_record_writes.py [ticks] [sets_per_tick]
+
+Each tick sets sets_per_tick paths, spread over a handful of fields, on one record.
+Compares unbatched writes with recordWriteBatchWindow=0 (one flush per reactor iteration).
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import sys
+import time
+
+from deepstreampy.constants import connection_state
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from twisted.internet import task
+
+URL = "ws://localhost:7777/deepstream"
+FIELDS = ['position.x', 'position.y', 'position.z', 'status', 'speed']
+INITIAL = '{"position":{"x":0,"y":0,"z":0},"status":"idle","speed":0,"owner":"bench"}'
+
+
+def run(ticks, sets_per_tick, **options):
+    reactor = task.Clock()
+    client = DeepstreamClient(URL, reactor=reactor, factory=DeepstreamFactory, **options)
+    client.on('error', lambda *args: None)
+    sent = []
+    client._factory.send = sent.append
+    client._factory._set_state(connection_state.OPEN)
+    client.record.get_record('bench')
+    record = client.record._records['bench']
+    client.record.handle({'topic': 'R', 'action': 'R', 'data': ['bench', '1', INITIAL]})
+    del sent[:]
+
+    start = time.time()
+    value = 0
+    for _ in range(ticks):
+        for i in range(sets_per_tick):
+            value += 1
+            record.set(value, FIELDS[i % len(FIELDS)])
+        reactor.advance(0)
+    elapsed = time.time() - start
+    for call in reactor.getDelayedCalls():
+        call.cancel()
+    return len(sent), sum(len(message) for message in sent), elapsed
+
+
+def main(argv):
+    ticks = int(argv[1]) if len(argv) > 1 else 2000
+    sets_per_tick = int(argv[2]) if len(argv) > 2 else 20
+    print('%-10s %10s %12s %10s' % ('mode', 'messages', 'bytes', 'seconds'))
+    for mode, options in (('unbatched', {}), ('batched', {'recordWriteBatchWindow': 0})):
+        messages, size, elapsed = run(ticks, sets_per_tick, **options)
+        print('%-10s %10d %12d %10.3f' % (mode, messages, size, elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
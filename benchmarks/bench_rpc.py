@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""RPC round trips per second: Deferred-native rpc.make against wrapped Tornado futures.
+
+Usage: python benchmarks/bench_rpc.py [calls]
+
+Each round trip makes an RPC and dispatches its response. The native path resolves a Deferred
+straight from dispatch; the wrapped path is the upstream coroutine, whose Tornado future is
+converted into a Deferred and only resolves once the IOLoop runs.
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import itertools
+import sys
+import time
+
+from deepstreampy import rpc, utils
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from tornado import gen, ioloop
+from twisted.internet import defer, task
+
+URL = "ws://localhost:7777/deepstream"
+
+
+def response(uid):
+    return {'topic': 'P', 'action': 'RES', 'data': ['bench', uid, 'N2']}
+
+
+def to_deferred(future):
+    d = defer.Deferred()
+    future.add_done_callback(lambda f: d.callback(f.result()))
+    return d
+
+
+def native(client, calls, last_uid):
+    dispatch = client._factory.dispatcher.dispatch
+    results = []
+    start = time.time()
+    for _ in range(calls):
+        client.rpc.make('bench', 1).addCallback(results.append)
+        dispatch(response(last_uid[0]))
+    elapsed = time.time() - start
+    assert len(results) == calls
+    return elapsed
+
+
+def wrapped(client, calls, last_uid):
+    dispatch = client._factory.dispatcher.dispatch
+    results = []
+
+    @gen.coroutine
+    def run():
+        for _ in range(calls):
+            d = to_deferred(rpc.RPCHandler.make(client.rpc, 'bench', 1))
+            d.addCallback(results.append)
+            dispatch(response(last_uid[0]))
+            yield gen.moment
+
+    start = time.time()
+    ioloop.IOLoop.current().run_sync(run)
+    elapsed = time.time() - start
+    assert len(results) == calls
+    return elapsed
+
+
+def main(argv):
+    calls = int(argv[1]) if len(argv) > 1 else 20000
+    # Record each correlation id so that responses can be dispatched without a server.
+    uids = itertools.count()
+    last_uid = [None]
+    def get_uid():
+        last_uid[0] = str(next(uids))
+        return last_uid[0]
+    utils.get_uid = get_uid
+
+    reactor = task.Clock()
+    client = DeepstreamClient(URL, reactor=reactor, factory=DeepstreamFactory)
+    client.on('error', lambda *args: None)
+    client._factory.send = lambda raw_message: None
+
+    print('%-10s %14s' % ('path', 'round trips/s'))
+    for name, run in (('native', native), ('wrapped', wrapped)):
+        elapsed = run(client, calls, last_uid)
+        print('%-10s %14d' % (name, calls / elapsed))
+    for call in reactor.getDelayedCalls():
+        call.cancel()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Cost of tracing on the receive and send paths.
+
+Usage: python benchmarks/bench_tracing.py [frames]
+
+Receives frames of ten event messages through onMessage and emits events with tracing off (the
+default), on for every frame, and on with one frame in 100 sampled. Each is the best of three runs;
+the last column is the extra time per frame against tracing off.
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import sys
+import time
+
+from deepstreampy.constants import connection_state
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from deepstreampy_twisted.tracing import Tracer
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+URL = "ws://localhost:7777/deepstream"
+FRAME = b''.join(b'E\x1fEVT\x1fbench\x1fN%d\x1e' % i for i in range(10))
+
+
+def run(frames, tracer):
+    reactor = task.Clock()
+    client = DeepstreamClient(URL, reactor=reactor, factory=DeepstreamFactory, trace=tracer)
+    client.on('error', lambda *args: None)
+    client.event.subscribe('bench', lambda data: None)
+    proto = client._factory.buildProtocol(('localhost', 0))
+    client._factory._protocol_instance = proto
+    proto.makeConnection(proto_helpers.StringTransport())
+    proto.sendMessage = lambda payload: None
+    client._factory._set_state(connection_state.OPEN)
+
+    start = time.time()
+    for _ in range(frames):
+        proto.onMessage(FRAME, False)
+    received = time.time() - start
+    emit = client.event.emit
+    start = time.time()
+    for i in range(frames):
+        emit('bench', i)
+    sent = time.time() - start
+    for call in reactor.getDelayedCalls():
+        call.cancel()
+    return received, sent
+
+
+def main(argv):
+    frames = int(argv[1]) if len(argv) > 1 else 20000
+    print('%-10s %16s %16s %18s' % ('tracing', 'received msg/s', 'sent msg/s', 'ns/frame extra'))
+    run(frames, None)  # warm-up
+    base = None
+    for label, tracer in (('off', None), ('every', Tracer()), ('1 in 100', Tracer(sample=100))):
+        runs = [run(frames, tracer) for _ in range(3)]
+        received = min(r for r, _ in runs)
+        sent = min(s for _, s in runs)
+        if base is None:
+            base = received + sent
+        extra = (received + sent - base) / (frames * 2) * 1e9
+        print('%-10s %16d %16d %18.0f' % (label, frames * 10 / received, frames / sent, extra))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
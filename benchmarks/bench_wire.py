@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Bytes parsing against the old decode-then-parse text path.
+
+Usage: python benchmarks/bench_wire.py [frames]
+
+Each workload is a frame of ten messages. "text" decodes the frame and runs upstream's
+message_parser.parse, as onMessage used to; "bytes" runs wire.parse on the frame as received.
+"read" then touches every message's data; "skip" does not, as for messages whose handler only
+looks at topic and action, or records nobody has subscribed to.
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import json
+import sys
+import timeit
+
+from deepstreampy.message import message_parser
+from deepstreampy_twisted import wire
+
+
+class Client(object):
+    def _on_error(self, *args):
+        pass
+
+
+def frame(messages):
+    return b''.join(message.encode('utf-8') + b'\x1e' for message in messages)
+
+
+WORKLOADS = [
+    ('events', frame('E\x1fEVT\x1fticker\x1fO{"price":%d.25,"qty":%d}' % (i, i) for i in range(10))),
+    ('acks', frame('E\x1fA\x1fS\x1fticker.%d' % i for i in range(10))),
+    ('record patches', frame('R\x1fP\x1forder/%d\x1f%d\x1fstatus\x1fSshipped' % (i, i) for i in range(10))),
+    ('record reads 4k', frame('R\x1fR\x1fdoc/%d\x1f1\x1f%s' % (
+        i, json.dumps({'body': 'lorem ipsum dolor sit amet ' * 150, 'id': i})) for i in range(10))),
+    ('record reads 64k', frame('R\x1fR\x1fdoc/%d\x1f1\x1f%s' % (
+        i, json.dumps({'rows': [[j, 'value %d' % j] for j in range(4000)]})) for i in range(10))),
+]
+
+
+def text(raw, client, read):
+    for message in message_parser.parse(raw.decode('utf-8'), client):
+        if read:
+            message['data']
+
+
+def bytes_(raw, client, read):
+    for message in wire.parse(raw, client):
+        if read:
+            message['data']
+
+
+def measure(func, raw, read, number):
+    client = Client()
+    return min(timeit.repeat(lambda: func(raw, client, read), number=number, repeat=5)) / number / 10 * 1e9
+
+
+def main(argv):
+    frames = int(argv[1]) if len(argv) > 1 else 2000
+    print('%-18s %-6s %14s %14s %8s' % ('workload', 'data', 'text ns/msg', 'bytes ns/msg', 'speedup'))
+    for name, raw in WORKLOADS:
+        number = max(1, frames * 1000 // len(raw)) if len(raw) > 1000 else frames
+        for read in (True, False):
+            before = measure(text, raw, read, number)
+            after = measure(bytes_, raw, read, number)
+            print('%-18s %-6s %14.0f %14.0f %7.2fx' % (name, 'read' if read else 'skip', before, after,
+                                                      before / after))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
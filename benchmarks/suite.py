@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""Event, RPC, record and parsing benchmarks over in-memory transports, with baseline comparison.
+
+Usage: python benchmarks/suite.py [--quick] [--save FILE] [--compare FILE] [--tolerance FRACTION]
+
+Every benchmark drives a real client through the protocol's onMessage and send paths on a
+StringTransport and task.Clock, so no server is needed. Throughputs are the best of three
+runs. --save writes the results as JSON. --compare reads such a file, prints the change for
+every result and exits with status 1 if any is worse than the baseline by more than the
+tolerance (default 0.15, i.e. 15%).
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import argparse
+import gc
+import itertools
+import json
+import sys
+import time
+
+from deepstreampy import utils
+from deepstreampy.constants import connection_state
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory, wire
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+URL = "ws://localhost:7777/deepstream"
+timer = getattr(time, 'perf_counter', time.time)
+
+# name -> (unit, True if higher is better)
+RESULTS = {
+    'events_in': ('msg/s', True),
+    'events_out': ('msg/s', True),
+    'rpc_round_trips': ('calls/s', True),
+    'rpc_latency_p50': ('us', False),
+    'rpc_latency_p99': ('us', False),
+    'record_patches_in': ('msg/s', True),
+    'record_sets_out': ('msg/s', True),
+    'parse': ('msg/s', True),
+    'subscription_memory': ('bytes', False),
+}
+
+
+def frame(*messages):
+    return b''.join(message.replace(b'|', b'\x1f') + b'\x1e' for message in messages)
+
+
+class Harness(object):
+    '''A client whose protocol is connected to a StringTransport and whose writes are discarded.'''
+    def __init__(self, **options):
+        self.reactor = task.Clock()
+        self.client = DeepstreamClient(URL, reactor=self.reactor, factory=DeepstreamFactory, **options)
+        self.client.on('error', lambda *args: None)
+        factory = self.client._factory
+        self.proto = factory.buildProtocol(('localhost', 0))
+        factory._protocol_instance = self.proto
+        self.proto.makeConnection(proto_helpers.StringTransport())
+        self.proto.sendMessage = lambda payload: None
+        factory._set_state(connection_state.OPEN)
+        self.receive = lambda payload: self.proto.onMessage(payload, False)
+
+    def close(self):
+        for call in self.reactor.getDelayedCalls():
+            call.cancel()
+
+
+def best_of(runs, func, *args):
+    return min(func(*args) for _ in range(runs))
+
+
+def events_in(count):
+    harness = Harness()
+    harness.client.event.subscribe('bench', lambda data: None)
+    payload = frame(*[b'E|EVT|bench|N%d' % i for i in range(10)])
+    receive = harness.receive
+    start = timer()
+    for _ in range(count // 10):
+        receive(payload)
+    elapsed = timer() - start
+    harness.close()
+    return elapsed / (count // 10 * 10)
+
+
+def events_out(count):
+    harness = Harness()
+    emit = harness.client.event.emit
+    start = timer()
+    for i in range(count):
+        emit('bench', i)
+    elapsed = timer() - start
+    harness.close()
+    return elapsed / count
+
+
+def rpc(count):
+    harness = Harness()
+    # Predictable correlation ids, so that responses can be fed without a server.
+    uids = itertools.count()
+    get_uid, utils.get_uid = utils.get_uid, lambda: str(next(uids))
+    make = harness.client.rpc.make
+    receive = harness.receive
+    results = []
+    latencies = []
+    try:
+        start = timer()
+        for i in range(count):
+            sent = timer()
+            make('bench', i).addCallback(results.append)
+            receive(frame(b'P|A|REQ|bench|%d' % i, b'P|RES|bench|%d|N%d' % (i, i)))
+            latencies.append(timer() - sent)
+        elapsed = timer() - start
+    finally:
+        utils.get_uid = get_uid
+        harness.close()
+    assert len(results) == count
+    latencies.sort()
+    return (elapsed / count,
+            latencies[int(0.5 * (count - 1))] * 1e6,
+            latencies[int(0.99 * (count - 1))] * 1e6)
+
+
+def record_harness():
+    harness = Harness()
+    harness.client.record.get_record('bench')
+    harness.receive(frame(b'R|A|S|bench', b'R|R|bench|1|{"a":0,"b":{"c":"x"}}'))
+    return harness, harness.client.record._records['bench']
+
+
+def record_patches_in(count):
+    harness, record = record_harness()
+    receive = harness.receive
+    start = timer()
+    for version in range(2, count + 2):
+        receive(frame(b'R|P|bench|%d|a|N%d' % (version, version)))
+    elapsed = timer() - start
+    assert record.version == count + 1
+    harness.close()
+    return elapsed / count
+
+
+def record_sets_out(count):
+    harness, record = record_harness()
+    start = timer()
+    for i in range(count):
+        record.set(i, 'a')
+    elapsed = timer() - start
+    harness.close()
+    return elapsed / count
+
+
+def parse(count):
+    raw = ''.join(message + '\x1e' for message in (
+        'E\x1fEVT\x1fbench\x1fO{"price":101.25,"volume":300}',
+        'R\x1fP\x1fbench\x1f12\x1fa.b\x1fN3',
+        'P\x1fRES\x1fbench\x1f1234\x1fSok',
+        'E\x1fA\x1fS\x1fbench',
+    )).encode('utf-8') * 25
+    messages = len(wire.parse(raw, None))
+    start = timer()
+    for _ in range(count // messages):
+        wire.parse(raw, None)
+    return (timer() - start) / (count // messages * messages)
+
+
+def subscription_memory(count):
+    if tracemalloc is None:
+        return None
+    harness = Harness()
+    subscribe = harness.client.event.subscribe
+    callback = lambda data: None
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(count):
+        subscribe('bench-%d' % i, callback)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    harness.close()
+    return sum(stat.size_diff for stat in after.compare_to(before, 'filename')) / count
+
+
+def run(quick=False):
+    scale = 10 if quick else 1
+    results = {}
+    results['events_in'] = 1 / best_of(3, events_in, 200000 // scale)
+    results['events_out'] = 1 / best_of(3, events_out, 100000 // scale)
+    per_call, p50, p99 = min(rpc(20000 // scale) for _ in range(3))
+    results['rpc_round_trips'] = 1 / per_call
+    results['rpc_latency_p50'] = p50
+    results['rpc_latency_p99'] = p99
+    results['record_patches_in'] = 1 / best_of(3, record_patches_in, 50000 // scale)
+    results['record_sets_out'] = 1 / best_of(3, record_sets_out, 50000 // scale)
+    results['parse'] = 1 / best_of(3, parse, 400000 // scale)
+    results['subscription_memory'] = subscription_memory(5000 // scale)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''Prints each result against the baseline; returns the names that regressed.'''
+    regressions = []
+    print('%-20s %14s %14s %8s' % ('benchmark', 'baseline', 'current', 'change'))
+    for name in sorted(RESULTS):
+        unit, higher_is_better = RESULTS[name]
+        value, reference = results.get(name), baseline.get(name)
+        if value is None or not reference:
+            print('%-20s %14s %14s %8s' % (name, reference, value, '-'))
+            continue
+        change = value / reference - 1
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > tolerance:
+            regressions.append(name)
+            flag = ' REGRESSION'
+        print('%-20s %14.1f %14.1f %+7.1f%%%s' % (name, reference, value, change * 100, flag))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help="a tenth of the iterations, for smoke tests")
+    parser.add_argument('--save', metavar='FILE', help="write the results to FILE as JSON")
+    parser.add_argument('--compare', metavar='FILE', help="compare against results saved with --save")
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    args = parser.parse_args(argv[1:])
+
+    results = run(args.quick)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.tolerance) else 0
+    for name in sorted(RESULTS):
+        value = results[name]
+        print('%-20s %14s %s' % (name, '-' if value is None else '%.1f' % value, RESULTS[name][0]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
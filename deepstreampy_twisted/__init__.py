@@ -2,8 +2,6 @@
 from __future__ import absolute_import, division, print_function, with_statement
 from __future__ import unicode_literals
 
-from tornado.platform.twisted import TwistedIOLoop
-TwistedIOLoop().install() # Incompatible with alternative reactors.
 from twisted.logger import Logger
 log = Logger()
 import txaio
@@ -13,10 +11,11 @@ import deepstreampy_twisted
 from deepstreampy_twisted import protocol
 from deepstreampy_twisted.protocol import DeepstreamFactory, DeepstreamProtocol, WSDeepstreamProtocol, WSDeepstreamFactory
 from deepstreampy_twisted.interface import DeepstreamClient
+from deepstreampy_twisted.pool import DeepstreamClientPool
 
 
 
-__all__ = ["DeepstreamClient, WSDeepstreamFactory, WSDeepstreamProtocol"]
+__all__ = ["DeepstreamClient", "DeepstreamClientPool", "WSDeepstreamFactory", "WSDeepstreamProtocol"]
 
 
 version = "0.2.0"
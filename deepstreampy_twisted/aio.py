@@ -0,0 +1,354 @@
+"""An async/await interface to DeepstreamClient for applications running Twisted on asyncio (Python 3 only)."""
+import asyncio
+import inspect
+from collections import deque
+
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from deepstreampy_twisted.interface import DeepstreamClient
+
+_END = object()
+
+
+def install_reactor(eventloop=None, use_uvloop=None):
+    '''
+    Install Twisted's asyncio reactor on eventloop; by default on the running loop, if called
+    from a coroutine, or else on a new loop. Call it before anything imports
+    twisted.internet.reactor.
+
+    For a new loop, use_uvloop=None uses uvloop when it is installed, True requires it and False
+    never uses it. A running loop is always used as it is; start it with uvloop to get uvloop.
+    Returns the reactor.
+    '''
+    if eventloop is None:
+        try:
+            eventloop = asyncio.get_running_loop()
+        except RuntimeError:
+            eventloop = _new_event_loop(use_uvloop)
+            asyncio.set_event_loop(eventloop)
+    from twisted.internet import asyncioreactor
+    asyncioreactor.install(eventloop)
+    from twisted.internet import reactor
+    return reactor
+
+
+def _new_event_loop(use_uvloop):
+    if use_uvloop is not False:
+        try:
+            import uvloop
+        except ImportError:
+            if use_uvloop:
+                raise
+        else:
+            return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def _event_loop(reactor):
+    eventloop = getattr(reactor, '_asyncioEventloop', None)
+    if eventloop is None:
+        raise TypeError("The async API needs Twisted's asyncio reactor; call aio.install_reactor() "
+                        "before importing twisted.internet.reactor")
+    return eventloop
+
+
+class Subscription(object):
+    '''
+    Async iterator over the updates of a subscription:
+
+        async with client.event.subscribe('news') as news:
+            async for data in news:
+                ...
+
+    Awaiting the subscription waits for the server's acknowledgement and returns the subscription
+    itself. Updates are queued until read; once maxsize are waiting (0 for no limit), the oldest is
+    dropped and counted in dropped. close() ends the iteration and unsubscribes.
+    '''
+    def __init__(self, eventloop, maxsize=0):
+        self._loop = eventloop
+        self._maxsize = maxsize
+        self._items = deque()
+        self._waiter = None
+        self._unsubscribe = None
+        self._acked = eventloop.create_future()
+        self.closed = False
+        self.dropped = 0
+
+    def _put(self, item):
+        if self.closed:
+            return
+        if self._maxsize and len(self._items) >= self._maxsize:
+            self._items.popleft()
+            self.dropped += 1
+        self._append(item)
+
+    def _append(self, item):
+        self._items.append(item)
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _ack(self, result):
+        if not self._acked.done():
+            self._acked.set_result(result)
+
+    def _fail(self, failure):
+        if not self._acked.done():
+            self._acked.set_exception(failure.value)
+
+    @property
+    def acked(self):
+        '''A future firing with True once the server acknowledged the subscription, False if that timed out.'''
+        return self._acked
+
+    def __await__(self):
+        yield from asyncio.shield(self._acked).__await__()
+        return self
+
+    def __len__(self):
+        return len(self._items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._items:
+            if self.closed:
+                raise StopAsyncIteration
+            self._waiter = self._loop.create_future()
+            await self._waiter
+        item = self._items.popleft()
+        if item is _END:
+            raise StopAsyncIteration
+        return item
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self._append(_END)
+        self.closed = True
+        unsubscribe, self._unsubscribe = self._unsubscribe, None
+        if unsubscribe is not None:
+            unsubscribe()
+
+
+class _AsyncHandler(object):
+    def __init__(self, client):
+        self._client = client
+        self._loop = client._loop
+
+    def _await(self, deferred):
+        return deferred.asFuture(self._loop)
+
+
+class AsyncEventHandler(_AsyncHandler):
+    def emit(self, name, data):
+        self._client.client.event.emit(name, data)
+
+    def publisher(self, name):
+        return self._client.client.event.publisher(name)
+
+    def subscribe(self, name, maxsize=0):
+        '''A Subscription yielding the data of every event emitted on name.'''
+        events = self._client.client.event
+        subscription = Subscription(self._loop, maxsize)
+        callback = subscription._put
+        events.subscribe(name, callback).addCallbacks(subscription._ack, subscription._fail)
+        subscription._unsubscribe = lambda: events.unsubscribe(name, callback)
+        return subscription
+
+
+class AsyncRPCHandler(_AsyncHandler):
+    async def make(self, name, data):
+        '''The RPC's result; raises RPCException if it fails.'''
+        return await self._await(self._client.client.rpc.make(name, data))
+
+    def provide(self, name, handler, max_concurrency=None, max_queue=None):
+        '''
+        Provide name with handler(data), a coroutine function (or a plain function) whose return
+        value is sent as the response. If it raises, the exception's text is sent as the error.
+        '''
+        eventloop = self._loop
+
+        def respond(future, response):
+            if future.cancelled():
+                response.error('cancelled')
+            elif future.exception() is not None:
+                response.error(str(future.exception()))
+            else:
+                response.send(future.result())
+
+        def provider(data, response):
+            result = handler(data)
+            if inspect.isawaitable(result):
+                future = asyncio.ensure_future(result, loop=eventloop)
+                future.add_done_callback(lambda future: respond(future, response))
+            else:
+                response.send(result)
+
+        self._client.client.rpc.provide(name, provider, max_concurrency=max_concurrency, max_queue=max_queue)
+
+    def unprovide(self, name):
+        self._client.client.rpc.unprovide(name)
+
+    def provider_stats(self, name=None):
+        return self._client.client.rpc.provider_stats(name)
+
+
+class AsyncRecordHandler(_AsyncHandler):
+    async def get_record(self, name):
+        '''The record, once it has been read from the server.'''
+        record = await self._await(self._client.client.record.get_record(name))
+        ready = self._loop.create_future()
+        record.when_ready(lambda record: ready.done() or ready.set_result(None))
+        await ready
+        return record
+
+    async def get_list(self, name):
+        return await self._await(self._client.client.record.get_list(name))
+
+    async def snapshot(self, name):
+        '''The record's current data, without subscribing; raises SnapshotError if that fails.'''
+        return await self._await(self._client.client.record.snapshot(name))
+
+    async def subscribe(self, name, path=None, maxsize=0):
+        '''
+        A Subscription yielding the record's data (or the value at path) on every change. The record
+        is subscription.record; closing the subscription only removes its callback.
+        '''
+        record = await self.get_record(name)
+        subscription = Subscription(self._loop, maxsize)
+        callback = subscription._put
+        record.subscribe(callback, path)
+        subscription.record = record
+        subscription._unsubscribe = lambda: record.unsubscribe(callback, path)
+        subscription._ack(True)
+        return subscription
+
+
+class AsyncPresenceHandler(_AsyncHandler):
+    def subscribe(self, users=None, maxsize=0):
+        '''A Subscription yielding a (username, online) tuple whenever a user logs in or out.'''
+        presence = self._client.client.presence
+        subscription = Subscription(self._loop, maxsize)
+        callback = lambda user, online: subscription._put((user, online))
+        presence.subscribe(callback, users)
+        subscription._unsubscribe = lambda: presence.unsubscribe(callback, users)
+        subscription._ack(True)
+        return subscription
+
+    async def get_all(self):
+        '''The usernames of every other logged-in client.'''
+        return await self._await(self._client.client.presence.get_all())
+
+    async def get(self, users):
+        '''Those of users who are logged in.'''
+        return await self._await(self._client.client.presence.get(users))
+
+
+class AsyncDeepstreamClient(object):
+    '''
+    The DeepstreamClient interface with coroutines in place of Deferreds and async iterators in
+    place of subscription callbacks. It needs Twisted's asyncio reactor (see install_reactor);
+    the wrapped DeepstreamClient is client.
+
+        client = AsyncDeepstreamClient('ws://localhost:6020/deepstream')
+        await client.login({'username': 'alice'})
+        result = await client.rpc.make('add', {'a': 1, 'b': 2})
+        async with client.event.subscribe('news') as news:
+            async for data in news:
+                ...
+        await client.close()
+
+    Takes the same arguments as DeepstreamClient, or an existing client=.
+    '''
+    def __init__(self, url=None, client=None, **options):
+        if client is None:
+            client = DeepstreamClient(url, **options)
+        self.client = client
+        self._loop = _event_loop(client.reactor)
+        self._connected = None
+        self._event = AsyncEventHandler(self)
+        self._rpc = AsyncRPCHandler(self)
+        self._record = AsyncRecordHandler(self)
+        self._presence = AsyncPresenceHandler(self)
+
+    async def connect(self):
+        '''Connect to the server; returns once it is awaiting authentication.'''
+        if self._connected is None or (self._connected.done() and not self.client._service.running):
+            self._connected = self._loop.create_future()
+            connected = self._connected
+            self.client.connect(lambda: connected.done() or connected.set_result(None))
+        await asyncio.shield(self._connected)
+
+    async def login(self, auth_params=None):
+        '''
+        Connect if needed and authenticate; returns {'success': ..., 'error': ..., 'message': ...}
+        as DeepstreamClient.login does.
+        '''
+        await self.connect()
+        return await self.client.login(auth_params or {}).asFuture(self._loop)
+
+    async def close(self):
+        '''Disconnect from the server; returns once the connection is closed.'''
+        self._connected = None
+        await self.client.disconnect().asFuture(self._loop)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def on(self, event, callback=None):
+        return self.client.on(event, callback)
+
+    @property
+    def connection_state(self):
+        return self.client.connection_state
+
+    @property
+    def event(self):
+        return self._event
+
+    @property
+    def rpc(self):
+        return self._rpc
+
+    @property
+    def record(self):
+        return self._record
+
+    @property
+    def presence(self):
+        return self._presence
+
+
+def run(main, use_uvloop=None):
+    '''
+    Install the asyncio reactor, run the coroutine function main(reactor) to completion with the
+    reactor running, and return its result.
+    '''
+    reactor = install_reactor(use_uvloop=use_uvloop)
+    outcome = []
+
+    def start():
+        d = defer.Deferred.fromFuture(asyncio.ensure_future(main(reactor)))
+        d.addBoth(outcome.append)
+        d.addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(start)
+    reactor.run()
+    if not outcome:
+        raise RuntimeError("The reactor stopped before main finished")
+    result = outcome[0]
+    if isinstance(result, Failure):
+        result.raiseException()
+    return result
@@ -0,0 +1,118 @@
+"""Selectable JSON codecs for message payloads."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import json
+
+from deepstreampy import presence, record
+from deepstreampy.message import message_builder, message_parser
+
+# Upstream modules that serialize payloads through their module-level json.
+_MODULES = (message_parser, message_builder, record, presence)
+_COMPACT = (',', ':')
+
+
+class ORJSONCodec(object):
+    '''
+    orjson for compact dumps and all loads.
+
+    Anything orjson rejects or formats differently (integers beyond 64 bits, non-string keys,
+    non-compact separators, extra json.dumps arguments) goes through the stdlib, so results and
+    errors match it. The output differs only in writing non-ASCII text unescaped and NaN or
+    Infinity as null.
+    '''
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def loads(self, s):
+        try:
+            return self._orjson.loads(s)
+        except ValueError:
+            return json.loads(s)
+
+    def dumps(self, obj, separators=None, sort_keys=False, **kwargs):
+        if separators == _COMPACT and not kwargs:
+            try:
+                option = self._orjson.OPT_SORT_KEYS if sort_keys else 0
+                return self._orjson.dumps(obj, option=option).decode('utf-8')
+            except TypeError:
+                pass
+        return json.dumps(obj, separators=separators, sort_keys=sort_keys, **kwargs)
+
+
+class UJSONCodec(object):
+    '''ujson, with the same stdlib fallback as ORJSONCodec; output is escaped as by the stdlib.'''
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def loads(self, s):
+        try:
+            return self._ujson.loads(s)
+        except ValueError:
+            return json.loads(s)
+
+    def dumps(self, obj, separators=None, sort_keys=False, **kwargs):
+        if separators == _COMPACT and not kwargs:
+            try:
+                return self._ujson.dumps(obj, sort_keys=sort_keys, escape_forward_slashes=False)
+            except (TypeError, ValueError, OverflowError):
+                pass
+        return json.dumps(obj, separators=separators, sort_keys=sort_keys, **kwargs)
+
+
+CODECS = {
+    'json': lambda: json,
+    'orjson': ORJSONCodec,
+    'ujson': UJSONCodec,
+}
+
+_installed = json
+
+
+def get_codec(name='auto'):
+    '''
+    Returns the codec called name: 'json' (the stdlib module), 'orjson' or 'ujson', raising
+    ImportError if its package is missing. 'auto' picks the fastest one installed.
+    '''
+    if name == 'auto':
+        for candidate in ('orjson', 'ujson'):
+            try:
+                return CODECS[candidate]()
+            except ImportError:
+                pass
+        return json
+    if name not in CODECS:
+        raise ValueError("Unknown JSON codec %r; expected one of %s" % (name, ', '.join(sorted(CODECS))))
+    return CODECS[name]()
+
+
+def install(codec):
+    '''
+    Make codec (a name or a codec object) the JSON implementation for every payload this process
+    encodes or decodes, upstream included. Returns the codec.
+    '''
+    global _installed
+    if not hasattr(codec, 'loads'):
+        codec = get_codec(codec)
+    for module in _MODULES:
+        module.json = codec
+    _installed = codec
+    return codec
+
+
+def installed():
+    return _installed
+
+
+def loads(s):
+    return _installed.loads(s)
+
+
+def dumps(obj):
+    '''obj as compact JSON text, through the installed codec.'''
+    return _installed.dumps(obj, separators=_COMPACT)
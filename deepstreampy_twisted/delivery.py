@@ -0,0 +1,213 @@
+"""Running subscriber callbacks off the reactor thread."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import multiprocessing
+import signal
+import sys
+from collections import deque
+
+from twisted.internet import defer, threads
+
+
+def _init_worker():
+    # Workers forked while the reactor is running inherit its SIGTERM/SIGINT handlers, which
+    # would make them ignore Pool.terminate().
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _call_in_worker(func, args):
+    # Runs in the worker process. Exceptions are returned rather than raised so that every
+    # submission produces exactly one result, whatever the Python version's Pool does.
+    try:
+        return True, func(*args)
+    except Exception as e:
+        return False, e
+
+
+class DeliveryClosed(Exception):
+    pass
+
+
+class ProcessPoolDelivery(object):
+    '''
+    Runs callbacks in a multiprocessing pool and returns their results as Deferreds.
+
+    At most max_in_flight calls are handed to the pool at once. Further calls wait in order,
+    and while they wait the client's connection stops reading (protocol.pauseReading), so
+    a slow pool pushes back on the server instead of piling up work in memory. The heartbeat
+    check is suspended meanwhile, since the server's pings are not read either.
+
+    Callbacks and their arguments are pickled, so callbacks must be module-level functions.
+    Use client.event.subscribe(name, callback, delivery=pool) or wrap a record callback with
+    pool.wrap(callback).
+    '''
+    def __init__(self, client=None, processes=None, max_in_flight=64, reactor=None):
+        if reactor is None:
+            if client is not None:
+                reactor = client.reactor
+            else:
+                from twisted.internet import reactor
+        self._reactor = reactor
+        self._client = client
+        self.max_in_flight = max_in_flight
+        self._in_flight = 0
+        self._pending = deque()
+        self._running = set()
+        self._paused_protocol = None
+        self._pool = multiprocessing.Pool(processes, _init_worker)
+        if hasattr(reactor, 'addSystemEventTrigger'):
+            reactor.addSystemEventTrigger('before', 'shutdown', self.close)
+
+    def wrap(self, callback, key=None):
+        '''Returns a callable that submits callback to the pool and returns a Deferred.'''
+        def deliver(*args):
+            return self.submit(callback, *args)
+        return deliver
+
+    def submit(self, func, *args):
+        if self._pool is None:
+            raise DeliveryClosed("ProcessPoolDelivery is closed")
+        d = defer.Deferred()
+        if self._in_flight < self.max_in_flight:
+            self._start(func, args, d)
+        else:
+            self._pending.append((func, args, d))
+            self._pause()
+        return d
+
+    def _start(self, func, args, d):
+        self._in_flight += 1
+        self._running.add(d)
+        def on_result(result):
+            self._reactor.callFromThread(self._finished, d, result)
+        kwargs = {'callback': on_result}
+        if sys.version_info[0] >= 3:
+            # Errors raised by the pool itself, e.g. an unpicklable callback.
+            kwargs['error_callback'] = lambda e: on_result((False, e))
+        self._pool.apply_async(_call_in_worker, (func, args), **kwargs)
+
+    def _finished(self, d, result):
+        if d not in self._running:
+            # Failed by close() while the worker was finishing.
+            return
+        self._running.discard(d)
+        self._in_flight -= 1
+        while self._pending and self._in_flight < self.max_in_flight:
+            self._start(*self._pending.popleft())
+        if not self._pending:
+            self._resume()
+        success, value = result
+        if success:
+            d.callback(value)
+        else:
+            d.errback(value)
+
+    def _pause(self):
+        if self._paused_protocol is not None or self._client is None:
+            return
+        protocol = self._client._factory._protocol_instance
+        if protocol is not None and protocol.transport is not None:
+            self._paused_protocol = protocol
+            protocol.pauseReading()
+
+    def _resume(self):
+        if self._paused_protocol is not None:
+            protocol, self._paused_protocol = self._paused_protocol, None
+            protocol.resumeReading()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def close(self):
+        '''Stop the worker processes. Calls still running or waiting fail with DeliveryClosed.'''
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        pool.terminate()
+        pool.join()
+        unfinished = list(self._running) + [d for _, _, d in self._pending]
+        self._running.clear()
+        self._pending.clear()
+        self._in_flight = 0
+        self._resume()
+        for d in unfinished:
+            d.errback(DeliveryClosed("ProcessPoolDelivery was closed"))
+
+
+class ThreadPoolDelivery(object):
+    '''
+    Runs callbacks on a Twisted thread pool, one serial lane per key.
+
+    Calls for the same key (the event or record name when used through subscribe or wrap)
+    run one at a time in the order they were submitted; calls for different keys run in
+    parallel. This keeps blocking callbacks off the reactor thread, so heartbeats and pings
+    are still answered, without reordering the updates for any one name.
+
+    By default the reactor's own thread pool is used (see reactor.suggestThreadPoolSize).
+    '''
+    def __init__(self, client=None, threadpool=None, reactor=None):
+        if reactor is None:
+            if client is not None:
+                reactor = client.reactor
+            else:
+                from twisted.internet import reactor
+        self._reactor = reactor
+        self._threadpool = threadpool
+        self._lanes = {}
+
+    def wrap(self, callback, key=None):
+        '''Returns a callable that queues callback on key's lane and returns a Deferred.'''
+        def deliver(*args):
+            return self.submit(key, callback, *args)
+        return deliver
+
+    def submit(self, key, func, *args):
+        d = defer.Deferred()
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = deque()
+            lane.append((func, args, d))
+            self._run(key, lane)
+        else:
+            lane.append((func, args, d))
+        return d
+
+    def _run(self, key, lane):
+        # The head of the lane is the call currently running; it is removed once it completes.
+        func, args, d = lane[0]
+        threadpool = self._threadpool
+        if threadpool is None:
+            threadpool = self._reactor.getThreadPool()
+        running = threads.deferToThreadPool(self._reactor, threadpool, func, *args)
+        running.addBoth(self._finished, key, lane, d)
+
+    def _finished(self, result, key, lane, d):
+        lane.popleft()
+        if lane:
+            self._run(key, lane)
+        elif self._lanes.get(key) is lane:
+            del self._lanes[key]
+        d.callback(result)
+
+    def lane_depth(self, key):
+        '''Number of calls queued or running for key.'''
+        lane = self._lanes.get(key)
+        return len(lane) if lane is not None else 0
+
+    def lane_depths(self):
+        '''Queue depth of every busy lane, keyed on the lane's key.'''
+        return dict((key, len(lane)) for key, lane in self._lanes.items())
+
+    def stats(self):
+        depths = [len(lane) for lane in self._lanes.values()]
+        return {
+            'lanes': len(depths),
+            'queued': sum(depths),
+            'max_depth': max(depths) if depths else 0,
+        }
@@ -0,0 +1,40 @@
+"""Routing of parsed messages to their handlers."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+
+class Dispatcher(object):
+    '''
+    Dispatch table keyed on (topic, action).
+
+    A handler registered without an action receives every message for its topic. A handler
+    registered for a specific action takes precedence, which lets hot paths such as
+    EVENT/EVT skip the topic handler's generic routing. Messages with no matching entry
+    go to the default handler.
+    '''
+    def __init__(self, default=None):
+        self._routes = {}
+        self._default = default
+
+    def register(self, topic, handler, action=None):
+        if not callable(handler):
+            raise TypeError("handler must be a callable")
+        self._routes[(topic, action)] = handler
+
+    def unregister(self, topic, action=None):
+        self._routes.pop((topic, action), None)
+
+    def lookup(self, topic, action=None):
+        routes = self._routes
+        handler = routes.get((topic, action))
+        if handler is None:
+            handler = routes.get((topic, None), self._default)
+        return handler
+
+    def dispatch(self, message):
+        routes = self._routes
+        topic = message['topic']
+        handler = routes.get((topic, message['action']))
+        if handler is None:
+            handler = routes.get((topic, None), self._default)
+        if handler is not None:
+            handler(message)
@@ -0,0 +1,46 @@
+"""Incremental splitting of the inbound byte stream into deepstream messages."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+from deepstreampy import constants
+
+
+class MessageFramer(object):
+    '''
+    Accumulates WebSocket payloads and hands back every complete message.
+
+    Data is appended to a single bytearray. Each call to feed() only scans the bytes
+    it has not scanned before, so a large message spread over many frames costs
+    O(total size) rather than O(frames * size).
+    '''
+    def __init__(self, separator=constants.message.MESSAGE_SEPERATOR):
+        self._separator = bytearray(separator.encode('ascii'))
+        self._buffer = bytearray()
+        self._scan_offset = 0
+
+    def feed(self, payload):
+        '''
+        Add a payload to the buffer.
+
+        Returns the complete messages received so far (separators included, as
+        message_parser.parse expects), or None if no message has been completed yet.
+        '''
+        buf = self._buffer
+        buf.extend(payload)
+        end = buf.rfind(self._separator, self._scan_offset)
+        if end < 0:
+            self._scan_offset = len(buf)
+            return None
+        end += 1
+        complete = memoryview(buf)[:end].tobytes()
+        del buf[:end]
+        # Anything left over has already been scanned and holds no separator.
+        self._scan_offset = len(buf)
+        return complete
+
+    def clear(self):
+        '''Discard any partially received message.'''
+        del self._buffer[:]
+        self._scan_offset = 0
+
+    def __len__(self):
+        return len(self._buffer)
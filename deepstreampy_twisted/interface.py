@@ -4,27 +4,29 @@
 from __future__ import absolute_import, division, print_function, with_statement
 from __future__ import unicode_literals
 
-from tornado import ioloop
-
 from deepstreampy import constants
-from deepstreampy.record import RecordHandler
 
 from deepstreampy_twisted.patch import PatchedEventHandler as EventHandler, \
     PatchedPresenceHandler as PresenceHandler, \
-    PatchedRPCHandler as RPCHandler
+    PatchedRPCHandler as RPCHandler, \
+    PatchedRecordHandler as RecordHandler
 from deepstreampy_twisted.protocol import WSDeepstreamFactory, WSDeepstreamProtocol
-from deepstreampy_twisted import log
+from deepstreampy_twisted.timing import TimingWheel
+from deepstreampy_twisted.loop import ReactorLoop, install_tornado_bridge
+from deepstreampy_twisted import codec, log
 
 from pyee import EventEmitter
 
 from deepstreampy.client import Client
-from deepstreampy.event import EventHandler
 from deepstreampy.message import connection
 from twisted.application.internet import ClientService
 from twisted.internet.endpoints import clientFromString
 from twisted.internet import defer
 
-from urlparse import urlparse
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
 
 
 class DeepstreamClient(Client):
@@ -37,10 +39,18 @@ class DeepstreamClient(Client):
     def __init__(self, url=None, conn_string=None, authParams=None, reactor=None, **options):
         ''' Creates the client, but does not connect to the server automatically.
         Optional keyword parameters (**options) for...
-           Client: url (required), authParams, reactor, conn_string, debug, factory
-           protocol: url (required), authParams, heartbeat_interval
+           Client: url (required), authParams, reactor, conn_string, debug, factory,
+                   tornado_bridge (install Tornado's TwistedIOLoop instead of scheduling on the reactor),
+                   json_codec ('json', 'orjson', 'ujson' or 'auto'; applies to the whole process)
+           protocol: url (required), authParams, heartbeat_interval, heartbeat_tolerance, heartbeat_check_interval,
+                     rtt_probe_interval, rtt_window, metrics, trace, trace_size, trace_sample, coalesce_writes,
+                     coalesce_max_bytes, coalesce_max_delay, queue_max_messages, queue_max_bytes, queue_overflow,
+                     queue_max_blocked, compression, compression_window_bits, compression_no_context_takeover,
+                     compression_mem_level, compression_min_bytes
+           ack timeouts: ackTimeoutResolution (seconds per timing wheel tick)
            rpc: rpcAckTimeout, rpcResponseTimeout, subscriptionTimeout
            record: recordReadAckTimeout, merge_strategy, recordReadTimeout, recordDeleteTimeout, recordDeepCopy,
+                   recordWriteBatchWindow (seconds to batch set() calls), record_cache (a RecordCache)
            presence: subscriptionTimeout
         '''
 
@@ -68,17 +78,21 @@ class DeepstreamClient(Client):
         if not reactor or reactor is None:
             from twisted.internet import reactor
         self.reactor = reactor
+        json_codec = options.pop('json_codec', None)
+        if json_codec is not None:
+            codec.install(json_codec)
         factory = options.pop('factory', WSDeepstreamFactory)
         self._factory = factory(url, self, debug=options.pop('debug', False), reactor=reactor, **options)
         self._endpoint = clientFromString(reactor, conn_string)
         self._service = ClientService(self._endpoint, self._factory) # Handles reconnection for us
 
         EventEmitter.__init__(self)
-        self._connection = ConnectionInterface(self, url)
+        self._timer_wheel = TimingWheel(reactor, resolution=options.pop('ackTimeoutResolution', 0.1))
+        self._connection = ConnectionInterface(self, url, tornado_bridge=options.pop('tornado_bridge', False))
         self._presence = PresenceHandler(self._connection, self, **options)
         self._event = EventHandler(self._connection, self, **options)
         self._rpc = RPCHandler(self._connection, self, **options)
-        self._record = RecordHandler(self._connection, self, **options)
+        self._record = RecordHandler(self._connection, self, cache=options.pop('record_cache', None), **options)
         self._message_callbacks = dict()
 
         self._message_callbacks[
@@ -92,6 +106,20 @@ class DeepstreamClient(Client):
         self._message_callbacks[
             constants.topic.ERROR] = self._on_error
 
+        dispatcher = self._factory.dispatcher
+        for topic, handler in self._message_callbacks.items():
+            dispatcher.register(topic, handler)
+        dispatcher.register(constants.topic.EVENT, self._event.handle_event, constants.actions.EVENT)
+
+    def _on_error(self, topic, event, msg=None):
+        metrics = self._factory.metrics
+        if metrics is not None:
+            metrics.incr('errors_total', topic=topic, event=event)
+        tracer = self._factory.tracer
+        if tracer is not None:
+            tracer.error(topic, event, msg)
+        return super(DeepstreamClient, self)._on_error(topic, event, msg)
+
     def login(self, auth_params):
         '''
         Submit authentication credentials to the server once state is "Awaiting Authentication."
@@ -125,10 +153,17 @@ class DeepstreamClient(Client):
         '''Legacy method: disconnect from the server.'''
         return self.disconnect()
     def disconnect(self):
-        '''Terminate our connection to the server.'''
+        '''Terminate our connection to the server. Returns a Deferred that fires once it is closed.'''
         # TODO: Say goodbye; clear message queue?
         self._factory._deliberate_close = True
-        self._service.stopService()
+        return self._service.stopService()
+    def whenQueueHasSpace(self):
+        '''
+        Returns a Deferred that fires once the offline send queue can take another message.
+
+        Producers using the 'block' queue_overflow policy should wait on this before sending more.
+        '''
+        return self._factory._queued_messages.wait_for_space()
     def whenAuthenticated(self, callback, *args):
         '''Execute a callback once authentication has succeeded.'''
         if self._factory._state == constants.connection_state.OPEN:
@@ -142,6 +177,45 @@ class DeepstreamClient(Client):
     def connection_state(self):
         return self._connection.state
 
+    @property
+    def dispatcher(self):
+        '''
+        The (topic, action) dispatch table for incoming messages.
+
+        Register a handler with dispatcher.register(topic, handler, action=None); a handler for a
+        specific action bypasses the topic's generic handler.
+        '''
+        return self._factory.dispatcher
+
+    @property
+    def queue_stats(self):
+        '''Depth, byte size and drop/reject counters of the offline send queue.'''
+        return self._factory._queued_messages.stats()
+
+    @property
+    def metrics(self):
+        '''
+        The client's metrics.Metrics, or None unless it was created with metrics=True (or a Metrics).
+
+        metrics.snapshot() returns every counter, gauge and histogram; see also
+        metrics.prometheus_text, metrics.MetricsResource and metrics.StatsDExporter.
+        '''
+        return self._factory.metrics
+
+    @property
+    def tracer(self):
+        '''
+        The client's tracing.Tracer, or None unless it was created with trace=True (or a Tracer).
+
+        tracer.dump() returns the recent frames and state changes as text; tracer.log_dump() logs them.
+        '''
+        return self._factory.tracer
+
+    @property
+    def rtt(self):
+        '''Histogram of recent round-trip times to the server, in seconds; see rtt_probe_interval.'''
+        return self._factory.rtt
+
     @property
     def record(self):
         return self._record
@@ -163,7 +237,12 @@ class ConnectionInterface(connection.Connection):
     Interaction with this interface should be largely unnecessary; the Client implements an interface to the
     functions an end-user is likely to need to use.'''
     def __init__(self, client, url, **options):
-        self._io_loop = ioloop.IOLoop.current()
+        # The upstream handlers schedule through self._io_loop. By default that goes straight to
+        # the reactor; tornado_bridge restores the previous Tornado-on-Twisted IOLoop.
+        if options.get('tornado_bridge'):
+            self._io_loop = install_tornado_bridge()
+        else:
+            self._io_loop = ReactorLoop(client.reactor)
         self._client = client
     @property
     def state(self):
@@ -202,7 +281,7 @@ class ConnectionInterface(connection.Connection):
     def connect(self, callback):
         return self._client.connect(callback)
     def authenticate(self, auth_params):
-        self.factory.authenticate(auth_params)
+        return self.factory.authenticate(auth_params)
     def close(self):
         self._client.disconnect()
 
@@ -0,0 +1,360 @@
+"""Load generator: many DeepstreamClients running a configurable mix of operations."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+
+from twisted.internet import defer, task
+
+from deepstreampy_twisted.metrics import Histogram, timer
+
+EVENT_PREFIX = 'loadgen.event.'
+RPC_NAME = 'loadgen.echo'
+RECORD_PREFIX = 'loadgen/record/'
+OPERATIONS = ('emit', 'subscribe', 'rpc', 'record')
+# Latency samples kept per measurement; percentiles are over these.
+WINDOW = 100000
+
+
+def parse_mix(text):
+    '''"emit=70,rpc=20,record=10" -> [('emit', 70), ('rpc', 20), ('record', 10)]'''
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError("unknown operation %r; expected %s" % (name, ', '.join(OPERATIONS)))
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+class ConnectTimeout(Exception):
+    pass
+
+
+class Stats(object):
+    '''Counts and latency histograms for one process.'''
+    def __init__(self):
+        self.latencies = {}
+        self.counts = {}
+        self.errors = {}
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def error(self, name):
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def observe(self, name, seconds):
+        histogram = self.latencies.get(name)
+        if histogram is None:
+            histogram = self.latencies[name] = Histogram(WINDOW)
+        histogram.add(seconds)
+        self.count(name)
+
+    def timed(self, name, d):
+        '''Observe how long Deferred d takes; failures and False results count as errors.'''
+        start = timer()
+        def done(result):
+            if result is False:
+                self.error(name)
+            else:
+                self.observe(name, timer() - start)
+        def failed(failure):
+            self.error(name)
+        return d.addCallbacks(done, failed)
+
+    def to_dict(self):
+        return {'counts': self.counts, 'errors': self.errors,
+                'latencies': dict((name, list(histogram._samples)) for name, histogram in self.latencies.items())}
+
+    def merge(self, other):
+        for name, n in other['counts'].items():
+            self.counts[name] = self.counts.get(name, 0) + n
+        for name, n in other['errors'].items():
+            self.errors[name] = self.errors.get(name, 0) + n
+        for name, samples in other['latencies'].items():
+            histogram = self.latencies.setdefault(name, Histogram(WINDOW))
+            for value in samples:
+                histogram._samples.append(value)
+                histogram.total += value
+            histogram.count += len(samples)
+
+
+class LoadClient(object):
+    '''One DeepstreamClient running operations at a fixed rate once authenticated.'''
+    def __init__(self, index, options, stats, reactor):
+        from deepstreampy_twisted import DeepstreamClient
+        self.index = index
+        self.options = options
+        self.stats = stats
+        self.reactor = reactor
+        self.client = DeepstreamClient(options.url, reactor=reactor)
+        self.client.on('error', self._on_error)
+        self.payload = 'x' * options.payload_bytes
+        self.subscribed = set()
+        self.record = None
+        self._getting_record = False
+        self._record_ready = None
+        self._looper = None
+        self._operations = [name for name, _ in options.mix]
+        self._weights = [weight for _, weight in options.mix]
+
+    def start(self, timeout=None):
+        '''
+        Connect and log in; the returned Deferred fires once authenticated (or failed). If that
+        takes longer than timeout seconds, it fails with ConnectTimeout and counts as a connect
+        error, or an auth error once connected.
+        '''
+        d = defer.Deferred()
+        started = timer()
+        stage = ['connect']
+        timeout_call = None
+        if timeout:
+            def timed_out():
+                self.stats.error(stage[0])
+                d.errback(ConnectTimeout("client %d: no %s after %.1fs" % (self.index, stage[0], timeout)))
+            timeout_call = self.reactor.callLater(timeout, timed_out)
+        def connected():
+            if d.called:
+                return
+            stage[0] = 'auth'
+            self.stats.observe('connect', timer() - started)
+            authenticating = timer()
+            login = self.client.login({'username': 'loadgen-%d' % self.index})
+            def authenticated(result):
+                if d.called:
+                    return
+                if timeout_call is not None:
+                    timeout_call.cancel()
+                if result.get('success'):
+                    self.stats.observe('auth', timer() - authenticating)
+                    self._ready()
+                else:
+                    self.stats.error('auth')
+                d.callback(result)
+            login.addCallback(authenticated)
+        self.client.connect(connected)
+        return d
+
+    def _ready(self):
+        if self.options.provide and any(name == 'rpc' for name in self._operations):
+            self.client.rpc.provide(RPC_NAME, lambda data, response: response.send(data))
+        if self.options.rate > 0:
+            self._looper = task.LoopingCall(self.step)
+            self._looper.clock = self.reactor
+            # Spread the clients' ticks over one interval rather than firing them together.
+            interval = 1.0 / self.options.rate
+            self.reactor.callLater(random.random() * interval, self._start_looper, interval)
+
+    def _start_looper(self, interval):
+        if self._looper is not None:
+            self._looper.start(interval, now=True)
+
+    def stop(self):
+        if self._looper is not None and self._looper.running:
+            self._looper.stop()
+        self._looper = None
+        self.client._factory._deliberate_close = True
+        return self.client._service.stopService()
+
+    def step(self):
+        getattr(self, 'do_' + _weighted_choice(self._operations, self._weights))()
+
+    def do_emit(self):
+        self.client.event.emit(EVENT_PREFIX + str(random.randrange(self.options.topics)), self.payload)
+        self.stats.count('emit')
+
+    def do_subscribe(self):
+        name = EVENT_PREFIX + str(random.randrange(self.options.topics))
+        if name in self.subscribed:
+            self.subscribed.discard(name)
+            self.client.event.unsubscribe(name, self._on_event)
+            self.stats.count('unsubscribe')
+        else:
+            self.subscribed.add(name)
+            self.stats.timed('subscribe', self.client.event.subscribe(name, self._on_event))
+
+    def do_rpc(self):
+        self.stats.timed('rpc', self.client.rpc.make(RPC_NAME, self.payload))
+
+    def do_record(self):
+        if self.record is None:
+            if not self._getting_record:
+                self._getting_record = True
+                self._record_ready = defer.Deferred()
+                self.stats.timed('record_get', self._record_ready)
+                record = self.client.record.get_record(RECORD_PREFIX + str(self.index))
+                record.addCallback(lambda record: record.when_ready(self._set_record))
+            return
+        d = defer.Deferred()
+        self.stats.timed('record_write', d)
+        self.record.set(self.payload + str(random.random()), 'value',
+                        callback=lambda error: d.errback(Exception(error)) if error else d.callback(None))
+
+    def _set_record(self, record):
+        self.record = record
+        self._record_ready.callback(record)
+
+    def _on_event(self, data):
+        self.stats.count('received')
+
+    def _on_error(self, message, event, topic):
+        self.stats.error(event)
+
+
+def _weighted_choice(items, weights):
+    point = random.random() * sum(weights)
+    for item, weight in zip(items, weights):
+        point -= weight
+        if point < 0:
+            return item
+    return items[-1]
+
+
+@defer.inlineCallbacks
+def run(options, clients, stats, reactor):
+    '''
+    Start clients, run for options.duration seconds once all are authenticated or have timed out,
+    stop them. Nothing runs if no client logged in.
+    '''
+    load_clients = []
+    logins = []
+    ramp = options.ramp / max(clients, 1)
+    for index in range(clients):
+        load_client = LoadClient(options.first_index + index, options, stats, reactor)
+        load_clients.append(load_client)
+        logins.append(load_client.start(options.connect_timeout))
+        if ramp:
+            yield task.deferLater(reactor, ramp, lambda: None)
+    results = yield defer.DeferredList(logins, consumeErrors=True)
+    elapsed = 0.0
+    if any(success and result.get('success') for success, result in results):
+        started = timer()
+        yield task.deferLater(reactor, options.duration, lambda: None)
+        elapsed = timer() - started
+        for load_client in load_clients:
+            if load_client._looper is not None and load_client._looper.running:
+                load_client._looper.stop()
+        yield task.deferLater(reactor, options.drain, lambda: None)
+    yield defer.DeferredList([load_client.stop() for load_client in load_clients])
+    defer.returnValue(elapsed)
+
+
+def _run_process(options, clients, queue=None):
+    from twisted.internet import reactor
+    stats = Stats()
+    result = {}
+    if options.local_server:
+        from deepstreampy_twisted import server
+        _, port = server.listen(0, reactor=reactor)
+        options.url = 'ws://127.0.0.1:%d/deepstream' % port.getHost().port
+    def finished(elapsed):
+        result['elapsed'] = elapsed
+    def failed(failure):
+        result['error'] = failure.getTraceback()
+    d = run(options, clients, stats, reactor)
+    d.addCallbacks(finished, failed)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+    result['stats'] = stats.to_dict()
+    if queue is not None:
+        queue.put(json.dumps(result))
+    return result
+
+
+def percentiles(histogram):
+    stats = histogram.stats()
+    return [stats[key] * 1000.0 if stats[key] is not None else 0.0 for key in ('p50', 'p90', 'p99', 'max')]
+
+
+def report(stats, elapsed, clients, out=sys.stdout):
+    print('%d clients, %.1f s' % (clients, elapsed), file=out)
+    print('%-14s %10s %10s %9s %9s %9s %9s %8s' % ('operation', 'count', 'per sec', 'p50 ms', 'p90 ms',
+                                                    'p99 ms', 'max ms', 'errors'), file=out)
+    for name in sorted(set(stats.counts) | set(stats.errors)):
+        count = stats.counts.get(name, 0)
+        histogram = stats.latencies.get(name)
+        latency = percentiles(histogram) if histogram is not None else ['', '', '', '']
+        rate = count / elapsed if elapsed and name not in ('connect', 'auth') else ''
+        print('%-14s %10d %10s %9s %9s %9s %9s %8d' % ((name, count, _fmt(rate)) + tuple(_fmt(v) for v in latency) +
+                                                        (stats.errors.get(name, 0),)), file=out)
+
+
+def _fmt(value):
+    return '%.1f' % value if isinstance(value, float) else str(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='deepstream-loadgen',
+        description="Drive many deepstream clients against a server and report throughput and latency.")
+    parser.add_argument('url', nargs='?', default='ws://localhost:6020/deepstream')
+    parser.add_argument('-c', '--clients', type=int, default=100, help="total number of clients (default 100)")
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                        help="split the clients over this many processes, each with its own reactor")
+    parser.add_argument('-d', '--duration', type=float, default=10, help="seconds to run once all are logged in")
+    parser.add_argument('-r', '--rate', type=float, default=1, help="operations per second per client")
+    parser.add_argument('-m', '--mix', type=parse_mix, default=parse_mix('emit=60,subscribe=10,rpc=20,record=10'),
+                        help="weighted operations, e.g. emit=60,subscribe=10,rpc=20,record=10")
+    parser.add_argument('--topics', type=int, default=10, help="number of distinct event names")
+    parser.add_argument('--payload-bytes', type=int, default=64)
+    parser.add_argument('--ramp', type=float, default=0, help="seconds over which to spread connecting")
+    parser.add_argument('--drain', type=float, default=1, help="seconds to wait for replies after stopping")
+    parser.add_argument('--connect-timeout', type=float, default=30,
+                        help="seconds a client may take to connect and log in before it counts as failed "
+                             "(default 30; 0 waits forever)")
+    parser.add_argument('--no-provide', dest='provide', action='store_false',
+                        help="don't provide the %s RPC from every client" % RPC_NAME)
+    parser.add_argument('--local-server', action='store_true',
+                        help="run against the in-process server stand-in instead of url (one process only)")
+    parser.add_argument('--json', action='store_true', help="print the raw results as JSON")
+    options = parser.parse_args(argv)
+    if options.local_server and options.processes > 1:
+        parser.error("--local-server runs in a single process")
+
+    processes = max(1, min(options.processes, options.clients))
+    shares = [options.clients // processes + (1 if i < options.clients % processes else 0) for i in range(processes)]
+    results = []
+    if processes == 1:
+        options.first_index = 0
+        results.append(_run_process(options, shares[0]))
+    else:
+        queue = multiprocessing.Queue()
+        workers = []
+        first = 0
+        for share in shares:
+            worker_options = argparse.Namespace(**vars(options))
+            worker_options.first_index = first
+            first += share
+            worker = multiprocessing.Process(target=_run_process, args=(worker_options, share, queue))
+            worker.start()
+            workers.append(worker)
+        results = [json.loads(queue.get()) for _ in workers]
+        for worker in workers:
+            worker.join()
+
+    stats = Stats()
+    elapsed = 0.0
+    failed = False
+    for result in results:
+        if 'error' in result:
+            failed = True
+            print(result['error'], file=sys.stderr)
+        elapsed = max(elapsed, result.get('elapsed', 0.0))
+        stats.merge(result['stats'])
+    if options.json:
+        print(json.dumps({'clients': options.clients, 'elapsed': elapsed, 'stats': stats.to_dict()}))
+    else:
+        report(stats, elapsed, options.clients)
+    if not stats.counts.get('auth'):
+        print("No client logged in", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
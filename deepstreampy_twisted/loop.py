@@ -0,0 +1,56 @@
+"""Scheduling for the upstream deepstreampy handlers."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import datetime
+
+
+class ReactorLoop(object):
+    '''
+    Implements the parts of Tornado's IOLoop interface that the upstream handlers use
+    (call_later, add_timeout, remove_timeout, add_callback) directly on a Twisted reactor.
+
+    This is the default; no Tornado IOLoop is installed or run.
+    '''
+    def __init__(self, reactor):
+        self._reactor = reactor
+
+    def time(self):
+        return self._reactor.seconds()
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        return self._reactor.callLater(delay, callback, *args, **kwargs)
+
+    def add_timeout(self, deadline, callback, *args, **kwargs):
+        if isinstance(deadline, datetime.timedelta):
+            delay = deadline.total_seconds()
+        else:
+            delay = deadline - self.time()
+        return self._reactor.callLater(max(0, delay), callback, *args, **kwargs)
+
+    def remove_timeout(self, timeout):
+        if timeout is not None and timeout.active():
+            timeout.cancel()
+
+    def add_callback(self, callback, *args, **kwargs):
+        self._reactor.callLater(0, callback, *args, **kwargs)
+
+    def close(self, all_fds=False):
+        pass
+
+
+_tornado_loop = None
+
+
+def install_tornado_bridge():
+    '''
+    Install Tornado's TwistedIOLoop and return it.
+
+    Only needed by code that relies on IOLoop.current() being driven by the Twisted reactor;
+    the reactor must support Tornado's bridge.
+    '''
+    global _tornado_loop
+    if _tornado_loop is None:
+        from tornado.platform.twisted import TwistedIOLoop
+        _tornado_loop = TwistedIOLoop()
+        _tornado_loop.install()
+    return _tornado_loop
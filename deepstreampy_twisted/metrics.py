@@ -0,0 +1,265 @@
+"""Client metrics: counters, gauges and rolling histograms, with Prometheus and StatsD exporters."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import time
+from collections import deque
+
+from twisted.internet import task
+from twisted.internet.protocol import DatagramProtocol
+from twisted.web import resource
+
+from deepstreampy_twisted import log
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class Histogram(object):
+    '''
+    Keeps the most recent window samples (e.g. round-trip times in seconds) for percentiles,
+    plus lifetime count and sum. add() is O(1); percentiles sort the window when asked for.
+    '''
+    def __init__(self, window=1024):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, value):
+        self._samples.append(value)
+        self.count += 1
+        self.total += value
+
+    @property
+    def last(self):
+        return self._samples[-1] if self._samples else None
+
+    def percentile(self, q):
+        '''The q-th percentile (0-100) of the window by nearest rank, or None if it is empty.'''
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = int(round(q / 100.0 * (len(ordered) - 1)))
+        return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+    def clear(self):
+        self._samples.clear()
+
+    def stats(self):
+        samples = self._samples
+        if not samples:
+            return {'count': self.count, 'window': 0, 'last': None, 'min': None, 'max': None,
+                    'mean': None, 'p50': None, 'p90': None, 'p99': None}
+        ordered = sorted(samples)
+        last = len(ordered) - 1
+        return {
+            'count': self.count,
+            'window': len(ordered),
+            'last': samples[-1],
+            'min': ordered[0],
+            'max': ordered[-1],
+            'mean': sum(ordered) / len(ordered),
+            'p50': ordered[int(round(0.5 * last))],
+            'p90': ordered[int(round(0.9 * last))],
+            'p99': ordered[int(round(0.99 * last))],
+        }
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    return '%s{%s}' % (name, ','.join('%s="%s"' % label for label in labels))
+
+
+class Metrics(object):
+    '''
+    Named counters, gauges and histograms, each optionally split by keyword labels such as
+    topic='E'.
+
+    Counters and histograms are updated where things happen. Gauges are functions called
+    only when a snapshot or export asks for them, so they cost nothing in between. Code that
+    records metrics keeps the Metrics object in an attribute that is None when metrics are
+    off and checks it before recording, so that disabled metrics cost one comparison.
+    '''
+    def __init__(self, window=1024):
+        self.window = window
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def incr(self, name, value=1, **labels):
+        key = _key(name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(self.window)
+        histogram.add(value)
+
+    def gauge(self, name, func, **labels):
+        '''Register func() as the current value of a gauge.'''
+        self._gauges[_key(name, labels)] = func
+
+    def add_histogram(self, name, histogram, **labels):
+        '''Publish a Histogram that is recorded elsewhere, e.g. factory.rtt.'''
+        self._histograms[_key(name, labels)] = histogram
+
+    def counter(self, name, **labels):
+        return self._counters.get(_key(name, labels), 0)
+
+    def histogram(self, name, **labels):
+        return self._histograms.get(_key(name, labels))
+
+    def counters(self):
+        return dict(self._counters)
+
+    def gauges(self):
+        values = {}
+        for key, func in self._gauges.items():
+            try:
+                values[key] = func()
+            except Exception:
+                log.failure("Metrics gauge {name} raised", name=key[0])
+        return values
+
+    def histograms(self):
+        return dict(self._histograms)
+
+    def snapshot(self):
+        '''Every metric as a plain dict keyed by Prometheus-style series name, e.g. messages_received_total{topic="E"}.'''
+        return {
+            'counters': dict((_series(*key), value) for key, value in self._counters.items()),
+            'gauges': dict((_series(*key), value) for key, value in self.gauges().items()),
+            'histograms': dict((_series(*key), histogram.stats())
+                               for key, histogram in self._histograms.items()),
+        }
+
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def prometheus_text(metrics, prefix='deepstream_'):
+    '''Render metrics in the Prometheus text exposition format; histograms become summaries.'''
+    lines = []
+    def family(kind, items):
+        seen = set()
+        for (name, labels), value in sorted(items, key=lambda item: item[0]):
+            if name not in seen:
+                seen.add(name)
+                lines.append('# TYPE %s%s %s' % (prefix, name, kind))
+            if kind == 'summary':
+                for q in QUANTILES:
+                    value_q = value.percentile(q * 100)
+                    if value_q is not None:
+                        lines.append('%s %r' % (_series(prefix + name, labels + (('quantile', str(q)),)),
+                                                float(value_q)))
+                lines.append('%s %r' % (_series(prefix + name + '_sum', labels), float(value.total)))
+                lines.append('%s %d' % (_series(prefix + name + '_count', labels), value.count))
+            else:
+                lines.append('%s %r' % (_series(prefix + name, labels), float(value)))
+    family('counter', metrics.counters().items())
+    family('gauge', metrics.gauges().items())
+    family('summary', metrics.histograms().items())
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsResource(resource.Resource):
+    '''A twisted.web resource serving prometheus_text(metrics) for scraping.'''
+    isLeaf = True
+
+    def __init__(self, metrics, prefix='deepstream_'):
+        resource.Resource.__init__(self)
+        self.metrics = metrics
+        self.prefix = prefix
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return prometheus_text(self.metrics, self.prefix).encode('utf-8')
+
+
+class StatsDExporter(DatagramProtocol):
+    '''
+    Pushes metrics to a StatsD daemon over UDP every interval seconds: counters as deltas,
+    gauges as values and new histogram samples as timings in milliseconds. Labels are
+    appended to the metric name, e.g. deepstream.messages_received_total.E. host must be an
+    IP address.
+    '''
+    max_packet = 512
+
+    def __init__(self, metrics, host='127.0.0.1', port=8125, prefix='deepstream.', interval=10, reactor=None):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.metrics = metrics
+        self.address = (host, port)
+        self.prefix = prefix
+        self.interval = interval
+        self._reactor = reactor
+        self._port = None
+        self._looper = None
+        self._sent_counters = {}
+        self._sent_counts = {}
+
+    def start(self):
+        self._port = self._reactor.listenUDP(0, self)
+        self._looper = task.LoopingCall(self.flush)
+        self._looper.clock = self._reactor
+        self._looper.start(self.interval, now=False)
+
+    def stop(self):
+        if self._looper is not None and self._looper.running:
+            self._looper.stop()
+        self._looper = None
+        if self._port is not None:
+            self.flush()
+            port, self._port = self._port, None
+            return port.stopListening()
+
+    def _name(self, key):
+        name, labels = key
+        return '.'.join([self.prefix + name] + [str(value).replace('.', '_') for _, value in labels])
+
+    def lines(self):
+        lines = []
+        for key, value in self.metrics.counters().items():
+            delta = value - self._sent_counters.get(key, 0)
+            if delta:
+                self._sent_counters[key] = value
+                lines.append('%s:%s|c' % (self._name(key), delta))
+        for key, value in self.metrics.gauges().items():
+            lines.append('%s:%s|g' % (self._name(key), value))
+        for key, histogram in self.metrics.histograms().items():
+            new = min(histogram.count - self._sent_counts.get(key, 0), len(histogram))
+            self._sent_counts[key] = histogram.count
+            if new > 0:
+                name = self._name(key)
+                for value in list(histogram._samples)[-new:]:
+                    lines.append('%s:%.3f|ms' % (name, value * 1000.0))
+        return lines
+
+    def flush(self):
+        if self.transport is None:
+            return
+        packet = []
+        size = 0
+        for line in self.lines():
+            if packet and size + len(line) + 1 > self.max_packet:
+                self._write(packet)
+                packet = []
+                size = 0
+            packet.append(line)
+            size += len(line) + 1
+        if packet:
+            self._write(packet)
+
+    def _write(self, lines):
+        try:
+            self.transport.write('\n'.join(lines).encode('utf-8'), self.address)
+        except Exception:
+            log.failure("Could not send metrics to StatsD at {address}", address=self.address)
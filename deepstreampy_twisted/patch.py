@@ -1,29 +1,155 @@
 from deepstreampy.event import EventHandler
 from deepstreampy.presence import PresenceHandler
-from deepstreampy.rpc import RPCHandler
-from deepstreampy.utils import AckTimeoutRegistry
-from functools import partial
+from deepstreampy.rpc import RPCHandler, RPCResponse, RPCException
+from deepstreampy.record import RecordHandler, Record, List, AnonymousRecord
+from deepstreampy.utils import AckTimeoutRegistry, SingleNotifier
+from deepstreampy import utils
 from deepstreampy.constants import topic as topic_constants
+from deepstreampy.constants import event as event_constants
+from deepstreampy.constants import actions as action_constants
+from deepstreampy_twisted.provider import RPCProvider, SENT, ERRORED, REJECTED
+from deepstreampy.message import message_parser, message_builder
+from deepstreampy.constants import message as message_constants
+from deepstreampy import jsonpath
+from collections import deque
+from functools import partial
+from twisted.internet import defer
+from deepstreampy_twisted import codec
 
 
 class PatchedAckTimeoutRegistry(AckTimeoutRegistry):
+    # Ack timeouts live on the client's TimingWheel rather than one io_loop.call_later each;
+    # see timing.TimingWheel.
+    def __init__(self, client, topic, timeout_duration):
+        super(PatchedAckTimeoutRegistry, self).__init__(client, topic, timeout_duration)
+        self._wheel = client._timer_wheel
+        self._waiters = {}
+
+    def when_acked(self, name, action=None):
+        '''Deferred firing with True once name is acknowledged, or False if the ack times out.'''
+        d = defer.Deferred()
+        self._waiters.setdefault((action or "") + name, []).append(d)
+        return d
+
+    def _notify(self, unique_name, acked):
+        waiters = self._waiters.pop(unique_name, None)
+        if waiters:
+            for d in waiters:
+                d.callback(acked)
+
     def add(self, name, action=None):
+        # A re-add restarts the timeout; waiters stay pending for the server's ack.
         unique_name = (action or "") + name
+        self._cancel(unique_name)
+        timeout = self._wheel.add(self._timeout_duration, self._on_timeout, unique_name, name)
+        self._register[unique_name] = timeout
+
+    def remove(self, name, action=None):
+        # Used when the server denies the request, so waiters fire with False.
+        unique_name = (action or "") + name
+        self._cancel(unique_name)
+        self._notify(unique_name, False)
+
+    def _cancel(self, unique_name):
+        timeout = self._register.pop(unique_name, None)
+        if timeout is not None:
+            timeout.cancel()
+        return timeout is not None
+
+    def clear(self, message):
+        # Only called for the server's ACK.
+        unique_name = "".join(message['data'][:2])
+        if self._cancel(unique_name):
+            self._notify(unique_name, True)
+        else:
+            self._client._on_error(self._topic,
+                                   event_constants.UNSOLICITED_MESSAGE,
+                                   message.get('raw', ''))
 
-        self.remove(name, action)
+    def _on_timeout(self, unique_name, name):
+        super(PatchedAckTimeoutRegistry, self)._on_timeout(unique_name, name)
+        self._notify(unique_name, False)
+
+class PatchedSingleNotifier(SingleNotifier):
+    # Calls back with the RESPONSE_TIMEOUT error when a request times out, so that Deferreds
+    # waiting on it fire, ignores responses to requests that already timed out, and resends
+    # request names (not callback lists) on reconnect.
+    def request(self, name, callback):
+        if name not in self._requests:
+            self._requests[name] = []
+            self._connection.send_message(self._topic, self._action, [name])
         timeout = self._client.io_loop.call_later(self._timeout_duration,
-                                        partial(self._on_timeout,
-                                                unique_name,
-                                                name))
-        self._register[unique_name] = timeout
+                                                  self._on_response_timeout, name)
+        self._requests[name].append({'timeout': timeout, 'callback': callback})
+    def receive(self, name, error, data):
+        self._complete(name, error, data)
+    def _on_response_timeout(self, name):
+        super(PatchedSingleNotifier, self)._on_response_timeout(name)
+        self._complete(name, event_constants.RESPONSE_TIMEOUT, None)
+    def _complete(self, name, error, data):
+        for entry in self._requests.pop(name, ()):
+            self._client.io_loop.remove_timeout(entry['timeout'])
+            entry['callback'](error, data)
+    def _resend_requests(self):
+        for name in self._requests:
+            self._connection.send_message(self._topic, self._action, [name])
+
+class EventPublisher(object):
+    # Emits a single event name. The "E|EVT|name|" prefix is built and encoded once, so each
+    # emit only serializes its payload.
+    def __init__(self, handler, name):
+        self.name = name
+        self._handler = handler
+        prefix = message_constants.MESSAGE_PART_SEPERATOR.join(
+            [topic_constants.EVENT, action_constants.EVENT, name, ''])
+        self._prefix = prefix.encode('utf-8')
+        self._separator = message_constants.MESSAGE_SEPERATOR.encode('utf-8')
+    def emit(self, data):
+        payload = message_builder.typed(data)
+        if not isinstance(payload, bytes):
+            payload = payload.encode('utf-8')
+        result = self._handler._connection.send(self._prefix + payload + self._separator)
+        self._handler._emitter.emit(self.name, data)
+        return result
+    __call__ = emit
 
 class PatchedEventHandler(EventHandler):
     def __init__(self, connection, client, **options):
-        super(PatchedAckTimeoutRegistry, self).__init__(connection, client, **options)
+        super(PatchedEventHandler, self).__init__(connection, client, **options)
         subscription_timeout = options.get("subscriptionTimeout", 15)
         self._ack_timeout_registry = PatchedAckTimeoutRegistry(client,
                                                         topic_constants.EVENT,
                                                         subscription_timeout)
+        self._delivered_callbacks = {}
+    def subscribe(self, name, callback, delivery=None):
+        # Returns a Deferred firing with True once the server acknowledges the subscription (at
+        # once if name already has subscribers), or False if the ack times out.
+        # delivery (a ProcessPoolDelivery or ThreadPoolDelivery) runs the callback off the reactor thread.
+        if delivery is not None:
+            wrapped = delivery.wrap(callback, name)
+            self._delivered_callbacks[(name, callback)] = wrapped
+            callback = wrapped
+        if self._emitter.listeners(name):
+            d = defer.succeed(True)
+        else:
+            self._ack_timeout_registry.add(name, action_constants.SUBSCRIBE)
+            d = self._ack_timeout_registry.when_acked(name, action_constants.SUBSCRIBE)
+            self._connection.send_message(topic_constants.EVENT, action_constants.SUBSCRIBE, [name])
+        self._emitter.on(name, callback)
+        return d
+    def unsubscribe(self, name, callback):
+        callback = self._delivered_callbacks.pop((name, callback), callback)
+        return super(PatchedEventHandler, self).unsubscribe(name, callback)
+    def publisher(self, name):
+        '''Returns an EventPublisher whose emit(data) behaves like emit(name, data), with less work per call.'''
+        return EventPublisher(self, name)
+    def handle_event(self, message):
+        # Fast path for EVENT/EVT messages, registered directly in the dispatch table.
+        data = message['data']
+        if len(data) == 2:
+            self._emitter.emit(data[0], message_parser.convert_typed(data[1], self._client))
+        else:
+            self._emitter.emit(data[0])
 
 class PatchedPresenceHandler(PresenceHandler):
     def __init__(self, connection, client, **options):
@@ -31,10 +157,366 @@ class PatchedPresenceHandler(PresenceHandler):
         subscription_timeout = options.get("subscriptionTimeout", 15)
         self._ack_timeout_registry = PatchedAckTimeoutRegistry(
             client, topic_constants.PRESENCE, subscription_timeout)
+        self._queries = deque()
+    # Upstream get_all and get are Tornado coroutines, which never resume without a running IOLoop.
+    # These return Deferreds fired straight from handle(); the server answers queries in order.
+    def get_all(self):
+        '''Returns a Deferred firing with the usernames of every other logged-in client.'''
+        return self._query([action_constants.QUERY])
+    def get(self, users):
+        '''Returns a Deferred firing with those of users who are logged in.'''
+        return self._query(users)
+    def _query(self, data):
+        d = defer.Deferred()
+        self._queries.append(d)
+        self._connection.send_message(topic_constants.PRESENCE, action_constants.QUERY, data)
+        return d
+    def handle(self, message):
+        if message['action'] == action_constants.QUERY:
+            if self._queries:
+                self._queries.popleft().callback(self._parse_query_response(message['data']))
+            return
+        return super(PatchedPresenceHandler, self).handle(message)
+    # Upstream registers the ack timeout with name and action swapped, so the server's ack never
+    # clears it, and sends the user list one character per message part.
+    def subscribe(self, callback, users=None):
+        if users is None:
+            self._callbacks[topic_constants.PRESENCE] = callback
+            users_str = topic_constants.PRESENCE
+        else:
+            for user in users:
+                self._callbacks[user] = callback
+            users_str = ",".join(users)
+        self._ack_timeout_registry.add(users_str, action_constants.SUBSCRIBE)
+        return self._connection.send_message(
+            topic_constants.PRESENCE, action_constants.SUBSCRIBE, [users_str])
+    def unsubscribe(self, callback, users=None):
+        users_str = ""
+        if users is None:
+            del self._callbacks[topic_constants.PRESENCE]
+        else:
+            for user in users:
+                del self._callbacks[user]
+            users_str = ",".join(users)
+        self._ack_timeout_registry.add(users_str, action_constants.UNSUBSCRIBE)
+        return self._connection.send_message(
+            topic_constants.PRESENCE, action_constants.UNSUBSCRIBE, [users_str])
+
+class PatchedRPCResponse(RPCResponse):
+    # Reports completion (send, error or reject) once, so that the provider can start the next request.
+    _on_complete = None
+    def _completed(self, outcome):
+        on_complete, self._on_complete = self._on_complete, None
+        if on_complete is not None:
+            on_complete(outcome)
+    def send(self, data):
+        result = super(PatchedRPCResponse, self).send(data)
+        self._completed(SENT)
+        return result
+    def error(self, error_str):
+        result = super(PatchedRPCResponse, self).error(error_str)
+        self._completed(ERRORED)
+        return result
+    def reject(self):
+        result = super(PatchedRPCResponse, self).reject()
+        self._completed(REJECTED)
+        return result
+
+class DeferredRPC(object):
+    # An RPC made by this client; it replaces deepstreampy.rpc.RPC, resolving a Deferred (or
+    # calling callback(error, result)) straight from message dispatch, with its timeouts on
+    # the client's TimingWheel.
+    def __init__(self, handler, correlation_id, client, callback=None, **options):
+        self._handler = handler
+        self._correlation_id = correlation_id
+        self._client = client
+        self._callback = callback
+        self.deferred = None if callback else defer.Deferred()
+        wheel = client._timer_wheel
+        self._ack_timeout = wheel.add(options.get('rpcAckTimeout', 6),
+                                      self._on_timeout, event_constants.ACK_TIMEOUT)
+        self._response_timeout = wheel.add(options.get('rpcResponseTimeout', 6),
+                                           self._on_timeout, event_constants.RESPONSE_TIMEOUT)
+    def ack(self):
+        self._ack_timeout.cancel()
+    def respond(self, data):
+        self._complete()
+        result = message_parser.convert_typed(data, self._client)
+        if self._callback:
+            self._callback(None, result)
+        else:
+            self.deferred.callback(result)
+    def error(self, error_msg):
+        self._complete()
+        if self._callback:
+            self._callback(error_msg, None)
+        else:
+            self.deferred.errback(RPCException(error_msg))
+    def _on_timeout(self, error_msg):
+        self._handler._rpcs.pop(self._correlation_id, None)
+        metrics = self._client._factory.metrics
+        if metrics is not None:
+            metrics.incr('errors_total', topic=topic_constants.RPC, event=error_msg)
+        self.error(error_msg)
+    def _complete(self):
+        self._ack_timeout.cancel()
+        self._response_timeout.cancel()
 
 class PatchedRPCHandler(RPCHandler):
     def __init__(self, connection, client, **options):
         super(PatchedRPCHandler, self).__init__(connection, client, **options)
         subscription_timeout = options.get("subscriptionTimeout", 15)
         self._ack_timeout_registry = PatchedAckTimeoutRegistry(
-            client, topic_constants.RPC, subscription_timeout)
\ No newline at end of file
+            client, topic_constants.RPC, subscription_timeout)
+    def provide(self, name, callback, max_concurrency=None, max_queue=None):
+        # Requests past max_concurrency wait in a queue of at most max_queue (both unlimited by
+        # default); once the queue is full, requests are rejected for the server to reroute.
+        provider = RPCProvider(name, callback, self._client.reactor, max_concurrency, max_queue)
+        result = super(PatchedRPCHandler, self).provide(name, callback)
+        self._providers[name] = provider
+        return result
+    def unprovide(self, name):
+        provider = self._providers.get(name)
+        result = super(PatchedRPCHandler, self).unprovide(name)
+        if provider is not None:
+            provider.reject_queued()
+        return result
+    def make(self, name, data, callback=None):
+        '''
+        Make an RPC. Returns a Deferred firing with the result, or failing with RPCException;
+        with a callback, callback(error, result) is called instead and None is returned.
+        '''
+        uid = utils.get_uid()
+        rpc = DeferredRPC(self, uid, self._client, callback, **self._options)
+        self._rpcs[uid] = rpc
+        self._connection.send_message(topic_constants.RPC, action_constants.REQUEST,
+                                      [name, uid, message_builder.typed(data)])
+        return rpc.deferred
+    def provider_stats(self, name=None):
+        '''In-flight, queued, completed, rejected and latency counters for one provider, or for all by name.'''
+        if name is not None:
+            return self._providers[name].stats()
+        return dict((name, provider.stats()) for name, provider in self._providers.items())
+    def _respond_to_rpc(self, message):
+        name, correlation_id = message['data'][:2]
+        provider = self._providers.get(name)
+        if provider is None or not provider.has_room():
+            if provider is not None:
+                provider.rejected += 1
+            self._connection.send_message(topic_constants.RPC, action_constants.REJECTION,
+                                          [name, correlation_id])
+            return
+        data = None
+        if message['data'][2]:
+            data = message_parser.convert_typed(message['data'][2], self._client)
+        provider.submit(data, PatchedRPCResponse(self._connection, name, correlation_id))
+class SnapshotError(Exception):
+    pass
+
+class _BatchedWrites(object):
+    # With the recordWriteBatchWindow option (seconds; 0 for the current reactor iteration),
+    # set() calls without a callback are applied locally at once but sent once per window:
+    # a single changed path as one PATCH, several as one UPDATE of the whole record unless
+    # the PATCHes would be smaller. Pending writes are sent before anything else the record
+    # sends or receives, so versions advance exactly as they would unbatched.
+    def __init__(self, *args):
+        super(_BatchedWrites, self).__init__(*args)
+        self._batch_call = None
+        self._batched_paths = []
+        self._batched_full = False
+    def _set_up_callback(self, current_version, callback):
+        # A write callback is keyed on the version its write will get.
+        self._flush_writes()
+        return super(_BatchedWrites, self)._set_up_callback(self.version, callback)
+    def discard(self):
+        self._flush_writes()
+        return super(_BatchedWrites, self).discard()
+    def delete(self):
+        self._flush_writes()
+        return super(_BatchedWrites, self).delete()
+    def _on_message(self, message):
+        self._flush_writes()
+        return super(_BatchedWrites, self)._on_message(message)
+    def _send_update(self, path, data, config):
+        window = self._options.get('recordWriteBatchWindow')
+        if window is None or config:
+            self._flush_writes()
+            return super(_BatchedWrites, self)._send_update(path, data, config)
+        if not path:
+            self._batched_full = True
+            self._batched_paths = []
+        elif not self._batched_full and path not in self._batched_paths:
+            self._batched_paths.append(path)
+        if self._batch_call is None:
+            self._batch_call = self._client.reactor.callLater(window, self._flush_writes)
+    def _flush_writes(self):
+        if self._batch_call is not None:
+            if self._batch_call.active():
+                self._batch_call.cancel()
+            self._batch_call = None
+        paths, full = self._batched_paths, self._batched_full
+        self._batched_paths, self._batched_full = [], False
+        if not (paths or full) or self._is_destroyed:
+            return
+        # Values are read from the record when sent, so later writes to overlapping paths win.
+        patches = [] if full else [(path, message_builder.typed(jsonpath.get(self._data, path, False)))
+                                   for path in paths]
+        if len(patches) == 1:
+            self._send_batched(action_constants.PATCH, list(patches[0]))
+            return
+        update = message_builder.get_message(topic_constants.RECORD, action_constants.UPDATE,
+                                             [self._data])
+        if full or len(update) <= sum(len(path) + len(value) + len(self.name) + 16
+                                      for path, value in patches):
+            self._send_batched(action_constants.UPDATE, [self._data])
+        else:
+            for patch in patches:
+                self._send_batched(action_constants.PATCH, list(patch))
+    def _send_batched(self, action, data):
+        self._version += 1
+        self._connection.send_message(topic_constants.RECORD, action,
+                                      [self.name, self.version] + data)
+    def _destroy(self):
+        if self._batch_call is not None and self._batch_call.active():
+            self._batch_call.cancel()
+        self._batch_call = None
+        return super(_BatchedWrites, self)._destroy()
+
+class PatchedRecord(_BatchedWrites, Record):
+    pass
+
+class PatchedList(_BatchedWrites, List):
+    pass
+
+class PatchedAnonymousRecord(AnonymousRecord):
+    # The upstream name setter is a Tornado coroutine yielding get_record(), which never resumes
+    # without a running IOLoop; this one switches records from the Deferred get_record returns.
+    @property
+    def name(self):
+        return self._name
+    @name.setter
+    def name(self, value):
+        self._name = value
+        if self._record is not None and not self._record.is_destroyed:
+            for subscription in self._subscriptions:
+                self._record.unsubscribe(*subscription)
+            self._record.discard()
+        self._record_handler.get_record(value).addCallback(self._switch_record, value)
+    def _switch_record(self, record, name):
+        if name != self._name:
+            return
+        self._record = record
+        for callback, path in self._subscriptions:
+            record.subscribe(callback, path, trigger_now=True)
+        record.when_ready(partial(self.emit, 'ready'))
+        self.emit('nameChanged', name)
+
+class PatchedRecordHandler(RecordHandler):
+    # With a cache (record_cache.RecordCache), records the cache holds are ready as soon as
+    # get_record/get_list return. The server's read still goes out; when it arrives the record
+    # takes the server's version and data, emitting change events only if they differ.
+    def __init__(self, connection, client, cache=None, **options):
+        super(PatchedRecordHandler, self).__init__(connection, client, **options)
+        self._cache = cache
+        self._warm = set()
+        self._snapshot_registry = PatchedSingleNotifier(
+            client, connection, topic_constants.RECORD, action_constants.SNAPSHOT,
+            options.get("recordReadTimeout", 15))
+        if cache is not None:
+            cache.add_source(self._update_cache)
+            cache.start(client.reactor)
+    def get_record(self, name):
+        '''Returns a Deferred firing with the record, creating it and sending a read if needed.'''
+        record = self._records.get(name)
+        if record is None:
+            record = self._records[name] = PatchedRecord(name, self._connection, self._options, self._client)
+            self._watch(name, record)
+            record.usages += 1
+        record._send_read()
+        self._warm_start(name)
+        return defer.succeed(record)
+    def get_list(self, name):
+        '''Returns a Deferred firing with the list, creating it and sending a read if needed.'''
+        _list = self._lists.get(name)
+        if _list is None:
+            _list = self._lists[name] = PatchedList(name, self._connection, self._options, self._client)
+        if name not in self._records:
+            self._records[name] = _list
+            self._watch(name, _list)
+        self._records[name].usages += 1
+        _list._send_read()
+        self._warm_start(name)
+        return defer.succeed(_list)
+    def get_anonymous_record(self):
+        '''Returns a Deferred firing with an AnonymousRecord; set its name to switch it to a record.'''
+        return defer.succeed(PatchedAnonymousRecord(self))
+    def _watch(self, name, record):
+        record.on('error', partial(self._on_record_error, name))
+        record.on('destroyPending', partial(self._on_destroy_pending, name))
+        record.on('delete', partial(self._remove_record, name))
+        record.on('discard', partial(self._remove_record, name))
+    def snapshot(self, name, callback=None):
+        '''
+        Current data of a record, without subscribing. Returns a Deferred firing with the data, or
+        failing with SnapshotError; with a callback, callback(error, data) is called instead.
+        '''
+        record = self._records.get(name)
+        if record is not None and record.is_ready:
+            if callback:
+                callback(None, record.get())
+                return None
+            return defer.succeed(record.get())
+        if callback:
+            self._snapshot_registry.request(name, callback)
+            return None
+        d = defer.Deferred()
+        def on_snapshot(error, data):
+            if error:
+                d.errback(SnapshotError(error))
+            else:
+                d.callback(data)
+        self._snapshot_registry.request(name, on_snapshot)
+        return d
+    def _warm_start(self, name):
+        record = self._records.get(name)
+        if self._cache is None or record is None or record.is_ready or record.version is not None:
+            return
+        cached = self._cache.get(name)
+        if cached is None:
+            return
+        record._version, record._data = cached
+        self._warm.add(name)
+        record._set_ready()
+    def handle(self, message):
+        action = message['action']
+        data = message['data']
+        if action == action_constants.READ and data and data[0] in self._warm:
+            self._reconcile(message)
+            return
+        if (self._cache is not None and action == action_constants.ACK
+                and data[0] == action_constants.DELETE):
+            self._cache.discard(data[1])
+        return super(PatchedRecordHandler, self).handle(message)
+    def _reconcile(self, message):
+        name, version, data = message['data'][:3]
+        self._warm.discard(name)
+        record = self._records.get(name)
+        if record is not None:
+            self._client.io_loop.remove_timeout(record._read_timeout)
+            version = int(version)
+            if version != record.version:
+                record._begin_change()
+                record._version = version
+                record._data = codec.loads(data)
+                record._complete_change()
+        self._process_message(message, name)
+    def _on_destroy_pending(self, record_name):
+        record = self._records.get(record_name)
+        if self._cache is not None and record is not None and record.version is not None:
+            self._cache.put(record_name, record.version, record._data)
+        self._warm.discard(record_name)
+        return super(PatchedRecordHandler, self)._on_destroy_pending(record_name)
+    def _update_cache(self):
+        for name, record in self._records.items():
+            if record.is_ready and record.version is not None:
+                self._cache.put(name, record.version, record._data)
@@ -0,0 +1,117 @@
+"""A pool of deepstream connections sharded by name."""
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+import bisect
+import hashlib
+
+from twisted.internet import defer
+
+from deepstreampy_twisted.interface import DeepstreamClient
+
+
+class HashRing(object):
+    '''Consistent hash ring mapping names onto a fixed set of nodes.'''
+    def __init__(self, nodes, replicas=100):
+        self._ring = []
+        for node in nodes:
+            for replica in range(replicas):
+                self._ring.append((self._hash('%s:%s' % (node, replica)), node))
+        self._ring.sort()
+        self._keys = [key for key, _ in self._ring]
+
+    @staticmethod
+    def _hash(name):
+        if not isinstance(name, bytes):
+            name = name.encode('utf-8')
+        return int(hashlib.md5(name).hexdigest()[:16], 16)
+
+    def get(self, name):
+        index = bisect.bisect(self._keys, self._hash(name)) % len(self._keys)
+        return self._ring[index][1]
+
+
+class _ShardedHandler(object):
+    # Forwards name-first calls such as subscribe(name, ...), provide(name, ...) or
+    # get_record(name) to the handler of the client that owns that name.
+    def __init__(self, pool, attribute):
+        self._pool = pool
+        self._attribute = attribute
+
+    def __getattr__(self, method):
+        pool = self._pool
+        attribute = self._attribute
+        def call(*args, **kwargs):
+            client = pool.client_for(args[0]) if args else pool.clients[0]
+            return getattr(getattr(client, attribute), method)(*args, **kwargs)
+        call.__name__ = str(method)
+        return call
+
+
+class DeepstreamClientPool(object):
+    '''
+    Spreads event, record and RPC traffic for one deepstream server across several connections.
+
+    Each name is assigned to one connection by consistent hashing, so all subscriptions, emits,
+    providers and records for that name share a connection (and keep their ordering), while
+    different names are handled in parallel. pool.event, pool.record and pool.rpc take the
+    same arguments as the single-client handlers.
+    '''
+    def __init__(self, url, size=4, **options):
+        ''' Creates size DeepstreamClients; options are passed to each, as for DeepstreamClient. '''
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.clients = [DeepstreamClient(url, **options) for _ in range(size)]
+        self._ring = HashRing(range(size))
+        self._event = _ShardedHandler(self, 'event')
+        self._record = _ShardedHandler(self, 'record')
+        self._rpc = _ShardedHandler(self, 'rpc')
+
+    def client_for(self, name):
+        '''The client that owns name.'''
+        return self.clients[self._ring.get(name)]
+
+    def connect(self, callback=None):
+        '''Connect every client; callback is called once per client, with the client, once connected.'''
+        for client in self.clients:
+            client.connect((lambda c=client: callback(c)) if callback else None)
+
+    def login(self, auth_params):
+        '''Log every client in. Returns a DeferredList of the individual login results.'''
+        return defer.DeferredList([defer.maybeDeferred(client.login, auth_params)
+                                   for client in self.clients])
+
+    def disconnect(self):
+        for client in self.clients:
+            client.disconnect()
+
+    def close(self):
+        return self.disconnect()
+
+    def whenAuthenticated(self, callback, *args):
+        '''Execute a callback once every client has authenticated.'''
+        remaining = [len(self.clients)]
+        def on_authenticated():
+            remaining[0] -= 1
+            if not remaining[0]:
+                callback(*args)
+        for client in self.clients:
+            client.whenAuthenticated(on_authenticated)
+
+    def on(self, event, f):
+        '''Register a listener for a client event (e.g. 'error') on every client.'''
+        for client in self.clients:
+            client.on(event, f)
+        return f
+
+    @property
+    def event(self):
+        return self._event
+
+    @property
+    def record(self):
+        return self._record
+
+    @property
+    def rpc(self):
+        return self._rpc
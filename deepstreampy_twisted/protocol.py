@@ -4,13 +4,26 @@
 from __future__ import print_function
 from twisted.internet import defer, task as twisted_task
 from twisted.internet.protocol import Protocol, ClientFactory
+from twisted.python.failure import Failure
 from deepstreampy import constants
-import time
+import sys
 from deepstreampy.message import message_parser, message_builder
-from deepstreampy_twisted import log
-from collections import deque
+from deepstreampy_twisted import log, wire
+from deepstreampy_twisted.dispatch import Dispatcher
+from deepstreampy_twisted.framing import MessageFramer
+from deepstreampy_twisted.metrics import Histogram, Metrics, timer
+from deepstreampy_twisted.send_queue import SendQueue, MessageDropped, REJECT
+from deepstreampy_twisted.timing import monotonic
+from deepstreampy_twisted.tracing import Tracer, RECEIVE, SEND, readable, redact
 import txaio
 from autobahn.twisted.websocket import WebSocketClientProtocol, WebSocketClientFactory
+from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateResponse, \
+    PerMessageDeflateResponseAccept
+
+
+_SEPARATOR = wire.SEPARATOR
+_PART_SEPARATOR = wire.PART_SEPARATOR
+_text_type = type(u'')
 
 
 class ErrorCatcher(object):
@@ -22,6 +35,12 @@ class DeepstreamProtocol(Protocol):
     # If reconnection occurs, a new protocol is created by the factory in use.
     def connectionMade(self):
         self.debugExec()
+        self._reading_paused = False
+        self._write_buffer = []
+        self._write_buffer_size = 0
+        self._write_waiters = []
+        self._flush_call = None
+        self._probe_sent = None
         if self.factory._state != constants.connection_state.AWAITING_CONNECTION:
             self.factory._set_state(constants.connection_state.AWAITING_CONNECTION)
     def onConnect(self, response):
@@ -31,37 +50,94 @@ class DeepstreamProtocol(Protocol):
     def onOpen(self):
         self.debugExec()
         self.debug("Connection opened.")
-        self._heartbeat_last = time.time()
+        factory = self.factory
+        factory._heartbeat_last = factory._now()
+        factory._protocol_instance = self
+        self._probe_sent = None
+        self._stop_heartbeat()
         l = twisted_task.LoopingCall(self._heartbeat)
-        self.factory._heartbeat_looper = l
-        self.factory._protocol_instance = self
+        l.clock = factory.reactor
+        l.start(factory._heartbeat_check_interval, now=False)
+        factory._heartbeat_looper = l
+        if factory._rtt_probe_interval:
+            probe = twisted_task.LoopingCall(self._probe)
+            probe.clock = factory.reactor
+            probe.start(factory._rtt_probe_interval, now=False)
+            factory._rtt_probe_looper = probe
     def onMessage(self, payload, isBinary):
-        self.debugExec()
         if isBinary:
             raise NotImplementedError("Received binary message; expected string")
-        self.debug("Received: " + payload)
-        full_buffer = self.factory._message_buffer + payload
-        split_buffer = full_buffer.rsplit(constants.message.MESSAGE_SEPERATOR, 1)
-        if len(split_buffer) > 1:
-            self.factory._message_buffer = split_buffer[1]
-        raw_messages = split_buffer[0]
-        parsed_messages = message_parser.parse(raw_messages, self.factory.client)
+        # Any traffic proves the connection is alive, not just PINGs.
+        self.factory._heartbeat_last = self.factory._now()
+        if self.factory.debug:
+            self.debug("Received: %s" % readable(payload))
+        if self.factory.tracer is not None:
+            self.factory.tracer.wire(RECEIVE, payload)
+        raw_messages = self.factory._framer.feed(payload)
+        if raw_messages is None:
+            return
+        if self.factory.metrics is not None:
+            return self._dispatch_measured(raw_messages, self.factory.metrics)
+        parsed_messages = wire.parse(raw_messages, self.factory.client)
+        dispatch = self.factory.dispatcher.dispatch
+        for msg in parsed_messages:
+            if msg is not None:
+                dispatch(msg)
+    def _dispatch_measured(self, raw_messages, metrics):
+        # onMessage with metrics on; kept apart so that the default path has no per-message checks.
+        start = timer()
+        parsed_messages = wire.parse(raw_messages, self.factory.client)
+        metrics.observe('parse_seconds', timer() - start)
+        dispatch = self.factory.dispatcher.dispatch
         for msg in parsed_messages:
             if msg is None:
+                metrics.incr('parse_errors_total')
                 continue
-            elif msg['topic'] == constants.topic.CONNECTION:
-                self._handle_connection_response(msg)
-            elif msg['topic'] == constants.topic.AUTH:
-                self._handle_auth_response(msg)
-            else:
-                self.factory.client._on_message(parsed_messages[0])
+            topic = msg['topic']
+            metrics.incr('messages_received_total', topic=topic)
+            metrics.incr('bytes_received_total', len(msg['raw']) + 1, topic=topic)
+            start = timer()
+            dispatch(msg)
+            metrics.observe('dispatch_seconds', timer() - start, topic=topic)
 
     def _heartbeat(self):
         self.debugExec()
-        elapsed = time.time() - self.factory._heartbeat_last
+        if self._reading_paused:
+            return
+        elapsed = self.factory._now() - self.factory._heartbeat_last
         if elapsed >= self.factory._heartbeat_tolerance:
-            self.log.error("Heartbeat missed. Closing connection.")
-            self.transport.loseConnection()
+            log.error("Heartbeat missed for {elapsed:.1f}s. Closing connection.", elapsed=elapsed)
+            if self.factory.tracer is not None:
+                self.factory.tracer.error(constants.topic.CONNECTION, 'HEARTBEAT_MISSED', elapsed)
+            self._stop_heartbeat()
+            # A dead peer never acknowledges a clean close, so don't wait for one.
+            abort = getattr(self.transport, 'abortConnection', self.transport.loseConnection)
+            abort()
+    def pauseReading(self):
+        # Stops reading from the server, e.g. while a ProcessPoolDelivery catches up. The server's
+        # pings go unread too, so the heartbeat check is suspended until resumeReading().
+        if not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pauseProducing()
+    def resumeReading(self):
+        if self._reading_paused:
+            self._reading_paused = False
+            self.factory._heartbeat_last = self.factory._now()
+            self.transport.resumeProducing()
+    def _probe(self):
+        # Client-initiated ping; the server's PONG gives a round-trip time sample. One probe is
+        # outstanding at a time, so a slow reply is never matched against a later ping.
+        if self._probe_sent is not None:
+            return
+        self._probe_sent = self.factory._now()
+        self.send(message_builder.get_message(constants.topic.CONNECTION, constants.actions.PING))
+    def _stop_heartbeat(self):
+        factory = self.factory
+        for name in ('_heartbeat_looper', '_rtt_probe_looper'):
+            looper = getattr(factory, name)
+            if looper is not None and looper.running:
+                looper.stop()
+            setattr(factory, name, None)
     def _send_auth_params(self):
         self.debugExec()
         self.factory._set_state(constants.connection_state.AUTHENTICATING)
@@ -96,30 +172,29 @@ class DeepstreamProtocol(Protocol):
                     constants.connection_state.AWAITING_AUTHENTICATION)
             auth_data = (self._get_auth_data(message_data[1]) if
                           data_size > 1 else None)
-            if self.factory._auth_deferred:
-                self.factory.reactor.callLater(0, self.factory._auth_deferred.callback,
-                                                {'success': False,
-                                                'error': message_data[0] if data_size else None,
-                                                'message': auth_data})
+            self.factory._resolve_auth({'success': False,
+                                        'error': message_data[0] if data_size else None,
+                                        'message': auth_data})
         elif message_action == constants.actions.ACK:
             self.factory._set_state(constants.connection_state.OPEN)
             auth_data = (self._get_auth_data(message_data[0]) if
                          data_size else None)
-            if self.factory._auth_deferred and self.factory._auth_deferred is not None:
-                self.factory.reactor.callLater(0, self.factory._auth_deferred.callback,
-                                                {'success': True,
-                                                'error': None,
-                                                'message': auth_data})
+            self.factory._resolve_auth({'success': True,
+                                        'error': None,
+                                        'message': auth_data})
         self.factory._send_queued_messages()
     def _handle_connection_response(self, message):
         self.debugExec()
         action = message['action']
         data = message['data']
         if action == constants.actions.PING:
-            self._heartbeat_last = time.time()
             ping_response = message_builder.get_message(
                 constants.topic.CONNECTION, constants.actions.PONG)
             self.send(ping_response)
+        elif action == constants.actions.PONG:
+            if self._probe_sent is not None:
+                self.factory.rtt.add(self.factory._now() - self._probe_sent)
+                self._probe_sent = None
         elif action == constants.actions.ACK:
             self.factory._set_state(constants.connection_state.AWAITING_AUTHENTICATION)
             if self.factory._connect_callback:
@@ -150,34 +225,94 @@ class DeepstreamProtocol(Protocol):
         if wasClean:
             self.factory._set_state(constants.connection_state.ERROR)
         self.factory._set_state(constants.connection_state.CLOSED)
-        self.log.info("WebSocket connection closed: {}".format(reason))
-        if self.factory._heartbeat_looper and self.factory._heartbeat_looper.running:
-            self.factory._heartbeat_looper.stop()
-        self.factory._heartbeat_looper = None
+        log.info("WebSocket connection closed: {reason}", reason=reason)
+        self._stop_heartbeat()
         self.factory._heartbeat_last = None
         self.factory._protocol_instance = None
-    def send(self, message):
-        self.debugExec()
-        if isinstance(message, unicode):
-            message = message.encode()
-        self.debug("Sending: %s" % message)
-        self.sendMessage(message)
+        # The framer lives on the factory; a message cut off by the close must not prefix the next connection's.
+        self.factory._framer.clear()
+        if self._flush_call is not None and self._flush_call.active():
+            self._flush_call.cancel()
+        self._flush_call = None
+        # Coalesced writes still buffered never reached the transport.
+        waiters, self._write_waiters = self._write_waiters, []
+        self._write_buffer = []
+        self._write_buffer_size = 0
+        for deferred in waiters:
+            deferred.errback(MessageDropped("The connection closed before the message was written"))
+    def send(self, message, waiters=()):
+        # waiters are Deferreds fired once message has been written to the transport, which with
+        # coalesce_writes is when the buffer is flushed.
+        if isinstance(message, _text_type):
+            message = message.encode('utf-8')
+        if self.factory.debug:
+            self.debug("Sending: %s" % readable(redact(message)))
+        if self.factory.tracer is not None:
+            self.factory.tracer.wire(SEND, message)
+        if self.factory.metrics is not None:
+            self._count_sent(message, self.factory.metrics)
+        if self.factory._coalesce_writes:
+            return self._coalesce(message, waiters)
+        return self._write(message, waiters)
+
+    def _count_sent(self, message, metrics):
+        # One send may carry several messages, e.g. a chunk of the offline queue.
+        for part in message.split(_SEPARATOR):
+            if part:
+                topic = part.split(_PART_SEPARATOR, 1)[0].decode('utf-8', 'replace')
+                metrics.incr('messages_sent_total', topic=topic)
+                metrics.incr('bytes_sent_total', len(part) + 1, topic=topic)
+
+    def _coalesce(self, message, waiters):
+        # Messages are already terminated by MESSAGE_SEPERATOR, so everything sent
+        # during one reactor iteration can go out as a single frame.
+        self._write_buffer.append(message)
+        self._write_buffer_size += len(message)
+        self._write_waiters.extend(waiters)
+        if self._write_buffer_size >= self.factory._coalesce_max_bytes:
+            return self.flush()
+        if self._flush_call is None:
+            self._flush_call = self.factory.reactor.callLater(
+                self.factory._coalesce_max_delay, self.flush)
+
+    def flush(self):
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+        if not self._write_buffer:
+            return
+        payload = b''.join(self._write_buffer)
+        waiters = self._write_waiters
+        self._write_buffer = []
+        self._write_buffer_size = 0
+        self._write_waiters = []
+        return self._write(payload, waiters)
+
+    def _write(self, payload, waiters):
+        try:
+            result = self.sendMessage(payload)
+        except Exception:
+            failure = Failure()
+            for deferred in waiters:
+                deferred.errback(failure)
+            raise
+        for deferred in waiters:
+            deferred.callback(None)
+        return result
 
     def sendMessage(self, payload):
-        self.debugExec()
         return self.transport.write(payload)
 
     def debug(self, message):
         if not self.factory.debug:
             return
-        if isinstance(message, str):
-            message = unicode(message, 'utf-8')
-        log.debug(message.replace(chr(31), '|').replace(chr(30), '+').replace('{', '{{').replace('}', '}}'))
+        log.debug("{message}", message=readable(message))
     def debugExec(self):
-        if not self.factory.debug:
-            return
+        # Logs the calling method's name in verbose mode. The hot paths (onMessage, send) don't call
+        # this; use a tracer for those.
         if self.factory.debug == 'verbose':
-            log.debug(inspect.stack()[1][3])
+            log.debug(sys._getframe(1).f_code.co_name)
     @property
     def _client(self):
         if hasattr(self.factory, 'client'):
@@ -190,8 +325,9 @@ class WSDeepstreamProtocol(DeepstreamProtocol, WebSocketClientProtocol):
         WebSocketClientProtocol.connectionMade(self)
         DeepstreamProtocol.connectionMade(self)
     def sendMessage(self, payload):
-        self.debugExec()
-        return WebSocketClientProtocol.sendMessage(self, payload)
+        # doNotCompress is ignored unless permessage-deflate was negotiated.
+        return WebSocketClientProtocol.sendMessage(
+            self, payload, doNotCompress=len(payload) < self.factory._compression_min_bytes)
 
 
 class DeepstreamFactory(ClientFactory):
@@ -202,7 +338,31 @@ class DeepstreamFactory(ClientFactory):
         # url: (str) the URL to connect to
         # reactor (IReactor) (optional) the reactor instance
         # debug: (bool or str) (optional) print debug messages, 'verbose' for more debug messages
-        # heartbeat_interval: (double) (optional) interval to check heartbeat
+        # heartbeat_interval: (double) (optional) seconds between the server's heartbeat pings
+        # heartbeat_tolerance: (double) (optional) seconds without any message from the server before the
+        #                      connection is considered dead and dropped; defaults to twice heartbeat_interval
+        # heartbeat_check_interval: (double) (optional) how often to check; defaults to a quarter of the tolerance
+        # rtt_probe_interval: (double) (optional) seconds between client pings whose PONGs are timed into
+        #                     factory.rtt; off by default, and needs a server that answers client pings
+        # rtt_window: (int) (optional) number of recent round-trip times kept in factory.rtt
+        # metrics: (bool or metrics.Metrics) (optional) record message, queue and connection metrics;
+        #          factory.metrics is None when off
+        # trace: (bool or tracing.Tracer) (optional) keep recent frames and state changes in a ring buffer,
+        #        logged on error; factory.tracer is None when off
+        # trace_size: (int) (optional) events kept in the ring buffer
+        # trace_sample: (int) (optional) keep one in every trace_sample frames sent or received
+        # coalesce_writes: (bool) (optional) buffer sends made during one reactor iteration
+        #                  and write them as a single frame
+        # coalesce_max_bytes: (int) (optional) flush the write buffer once it holds this many bytes
+        # coalesce_max_delay: (double) (optional) seconds to wait before flushing; 0 flushes on the
+        #                     next reactor iteration
+        # queue_max_messages: (int) (optional) cap on messages queued while the connection is not open
+        # queue_max_bytes: (int) (optional) cap on bytes queued while the connection is not open
+        # queue_overflow: (str) (optional) 'drop_oldest', 'drop_newest', 'reject' (default) or 'block';
+        #                 see send_queue.SendQueue
+        # queue_max_blocked: (int) (optional) cap on messages parked by the 'block' policy (1024); more are rejected
+        # queue_flush_chunk_bytes: (int) (optional) bytes of queued messages joined into each write on reconnect
+        # queue_flush_budget: (double) (optional) seconds spent draining the queue per reactor iteration
         # auth_params: (dict) (optional) e.g. {} or {'username': 'AzureDiamond', 'password': 'hunter2'}
         #              Providing auth_params will enable auto-auth on connect;
         #              otherwise, auth must be done manually with self.authenticate or client.login
@@ -218,19 +378,46 @@ class DeepstreamFactory(ClientFactory):
         kwargs['url'] = url
         self.debug = kwargs.pop('debug', False)
         if self.debug:
-            global inspect
-            import inspect
             txaio.start_logging(level='debug')
             print('Debug enabled.')
             if self.debug == 'verbose':
                 defer.setDebugging(on=True)
 
         self._heartbeat_interval = kwargs.pop('heartbeat_interval', 100)
-        self._heartbeat_tolerance = self._heartbeat_interval * 2
+        self._heartbeat_tolerance = kwargs.pop('heartbeat_tolerance', None) or self._heartbeat_interval * 2
+        self._heartbeat_check_interval = (kwargs.pop('heartbeat_check_interval', None) or
+                                          self._heartbeat_tolerance / 4.0)
         self._heartbeat_looper = None
         self._heartbeat_last = None
-        self._message_buffer = ''
-        self._queued_messages = deque()
+        self._rtt_probe_interval = kwargs.pop('rtt_probe_interval', None)
+        self._rtt_probe_looper = None
+        self.rtt = Histogram(kwargs.pop('rtt_window', 256))
+        self._now = monotonic
+        self.metrics = kwargs.pop('metrics', None) or None
+        if self.metrics is True:
+            self.metrics = Metrics()
+        self.tracer = kwargs.pop('trace', None) or None
+        trace_size = kwargs.pop('trace_size', 1024)
+        trace_sample = kwargs.pop('trace_sample', 1)
+        if self.tracer is True:
+            self.tracer = Tracer(trace_size, trace_sample)
+        self._was_open = False
+        self._coalesce_writes = kwargs.pop('coalesce_writes', False)
+        self._coalesce_max_bytes = kwargs.pop('coalesce_max_bytes', 65536)
+        self._coalesce_max_delay = kwargs.pop('coalesce_max_delay', 0)
+        self._framer = MessageFramer()
+        self._queued_messages = SendQueue(
+            max_messages=kwargs.pop('queue_max_messages', None),
+            max_bytes=kwargs.pop('queue_max_bytes', None),
+            policy=kwargs.pop('queue_overflow', REJECT),
+            max_blocked=kwargs.pop('queue_max_blocked', 1024))
+        self._queue_flush_chunk_bytes = kwargs.pop('queue_flush_chunk_bytes', 65536)
+        self._queue_flush_budget = kwargs.pop('queue_flush_budget', 0.01)
+        self._queue_flush_call = None
+        self._protocol_instance = None
+        self.dispatcher = Dispatcher(self._on_unrouted_message)
+        self.dispatcher.register(constants.topic.CONNECTION, self._on_connection_message)
+        self.dispatcher.register(constants.topic.AUTH, self._on_auth_message)
         self.authParams = kwargs.pop('authParams', None)
         self._auto_auth = False
         if self.authParams is not None:
@@ -246,6 +433,9 @@ class DeepstreamFactory(ClientFactory):
             else:
                 raise ValueError("authCallback must be a callable")
 
+        if self.metrics is not None:
+            self._register_metrics(self.metrics)
+
         self._deliberate_close = False
         self._too_many_auth_attempts = False
         self._challenge_denied = False
@@ -274,14 +464,35 @@ class DeepstreamFactory(ClientFactory):
                 self.client.connect(callback=lambda: self.authenticate(auth_params))
         elif self._state == constants.connection_state.AWAITING_AUTHENTICATION:
             self.reactor.callLater(0, self._protocol_instance._send_auth_params)
+        d = self._auth_deferred
         if result:
-            self.reactor.callLater(0,self._auth_deferred.callback, result)
-        return self._auth_deferred
+            self._resolve_auth(result)
+        return d
+    def _resolve_auth(self, result):
+        # Fires the pending login Deferred directly from message dispatch; the next login gets a new one.
+        d, self._auth_deferred = self._auth_deferred, None
+        if d is not None:
+            d.callback(result)
+    def _register_metrics(self, metrics):
+        queue = self._queued_messages
+        metrics.gauge('queue_depth', lambda: len(queue))
+        metrics.gauge('queue_bytes', lambda: queue.bytes)
+        metrics.gauge('queue_dropped', lambda: queue.dropped)
+        metrics.gauge('queue_rejected', lambda: queue.rejected)
+        metrics.add_histogram('rtt_seconds', self.rtt)
     def _set_state(self, state):
         # This state keeps track of the connection with Deepstream per the
         # Deepstream spec. This state is distinct from the state
         # handled by ReconnectingClientFactory.
         self._state = state
+        if self.tracer is not None:
+            self.tracer.state(state)
+        if self.metrics is not None:
+            self.metrics.incr('connection_state_changes_total', state=state)
+            if state == constants.connection_state.OPEN:
+                if self._was_open:
+                    self.metrics.incr('reconnects_total')
+                self._was_open = True
         if self.client:
             self.client.emit(constants.event.CONNECTION_STATE_CHANGED, state)
         log.info("Deepstream connection state set to " + str(state))
@@ -291,25 +502,66 @@ class DeepstreamFactory(ClientFactory):
     def startedConnecting(self, connector):
         self._set_state(constants.connection_state.AWAITING_CONNECTION)
     def send(self, raw_message):
-        if self._state == constants.connection_state.OPEN and self._protocol_instance:
+        is_open = self._state == constants.connection_state.OPEN and self._protocol_instance
+        if is_open and not self._queued_messages:
             return self._protocol_instance.send(raw_message)
-        else:
-            deferred = defer.Deferred()
-            self._queued_messages.append((raw_message, deferred))
-            return deferred
+        # While a backlog is being replayed, new messages wait behind it to keep ordering.
+        deferred = self._queued_messages.put(raw_message)
+        if is_open and self._queue_flush_call is None:
+            self._queue_flush_call = self.reactor.callLater(0, self._send_queued_messages)
+        return deferred
     def startFactory(self):
-        print("Starting DS factory")
+        log.debug("Starting DS factory")
+    def _on_connection_message(self, message):
+        self._protocol_instance._handle_connection_response(message)
+    def _on_auth_message(self, message):
+        self._protocol_instance._handle_auth_response(message)
+    def _on_unrouted_message(self, message):
+        # Anything the client has not registered a route for goes through the upstream
+        # topic lookup, which reports unknown topics.
+        if self.client:
+            self.client._on_message(message)
     def _send_queued_messages(self):
-        if self._state != constants.connection_state.OPEN:
+        # Replays the offline queue in joined chunks. Once queue_flush_budget is used up the
+        # rest is left for the next reactor iteration, so pings and auth are not starved.
+        if self._queue_flush_call is not None and self._queue_flush_call.active():
+            self._queue_flush_call.cancel()
+        self._queue_flush_call = None
+        if self._state != constants.connection_state.OPEN or not self._protocol_instance:
             return
-        while self._queued_messages:
-            raw_message, deferred = self._queued_messages.popleft()
-            r = defer.maybeDeferred(self._protocol_instance.send(raw_message))
-            r.chainDeferred(deferred)
+        queue = self._queued_messages
+        deadline = self._now() + self._queue_flush_budget
+        while queue:
+            chunk = []
+            deferreds = []
+            size = 0
+            while queue and size < self._queue_flush_chunk_bytes:
+                raw_message, deferred = queue.popleft()
+                if isinstance(raw_message, _text_type):
+                    raw_message = raw_message.encode('utf-8')
+                chunk.append(raw_message)
+                deferreds.append(deferred)
+                size += len(raw_message)
+            try:
+                self._protocol_instance.send(b''.join(chunk), deferreds)
+            except Exception:
+                # The chunk's Deferreds carry the failure.
+                pass
+            if queue and self._now() >= deadline:
+                self._queue_flush_call = self.reactor.callLater(0, self._send_queued_messages)
+                return
 
 class WSDeepstreamFactory(DeepstreamFactory, WebSocketClientFactory):
     protocol = WSDeepstreamProtocol
     def __init__(self, url, *args, **kwargs):
+        # compression: (bool) (optional) offer permessage-deflate; the server decides whether it is used
+        # compression_window_bits: (int) (optional) 8-15, LZ77 window for both directions; smaller uses less
+        #                          memory per connection and compresses less. Defaults to 15
+        # compression_no_context_takeover: (bool) (optional) reset the compressor after every message in both
+        #                                  directions, trading ratio for memory
+        # compression_mem_level: (int) (optional) 1-9, zlib memory level of this side's compressor
+        # compression_min_bytes: (int) (optional) frames smaller than this are sent uncompressed; worth
+        #                        setting with no context takeover, where small frames barely shrink
         DeepstreamFactory.__init__(self, url, *args, **kwargs)
         WebSocketClientFactory.__init__(self,
             url=url,
@@ -319,6 +571,30 @@ class WSDeepstreamFactory(DeepstreamFactory, WebSocketClientFactory):
             headers=kwargs.pop('headers', None),
             proxy=kwargs.pop('proxy', None),
         )
+        self._compression_window_bits = kwargs.pop('compression_window_bits', None)
+        self._compression_no_context_takeover = kwargs.pop('compression_no_context_takeover', False)
+        self._compression_mem_level = kwargs.pop('compression_mem_level', None)
+        self._compression_min_bytes = kwargs.pop('compression_min_bytes', 0)
+        if kwargs.pop('compression', False):
+            offer = PerMessageDeflateOffer(
+                accept_no_context_takeover=True,
+                accept_max_window_bits=True,
+                request_no_context_takeover=self._compression_no_context_takeover,
+                request_max_window_bits=self._compression_window_bits or 0)
+            self.setProtocolOptions(perMessageCompressionOffers=[offer],
+                                    perMessageCompressionAccept=self._accept_compression)
+    def _accept_compression(self, response):
+        if not isinstance(response, PerMessageDeflateResponse):
+            return None
+        window_bits = self._compression_window_bits
+        if window_bits and response.client_max_window_bits:
+            # The server may ask for a smaller window than ours, never a larger one.
+            window_bits = min(window_bits, response.client_max_window_bits)
+        return PerMessageDeflateResponseAccept(
+            response,
+            no_context_takeover=self._compression_no_context_takeover or None,
+            window_bits=window_bits or None,
+            mem_level=self._compression_mem_level)
 
 
 # The following code should only be used for testing and developing this library.
@@ -0,0 +1,115 @@
+"""Concurrency limits and statistics for RPC providers."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+from collections import deque
+from functools import partial
+
+from deepstreampy_twisted import log
+
+# How a request finished; see RPCProvider._complete.
+SENT = 'sent'
+ERRORED = 'errored'
+REJECTED = 'rejected'
+
+
+class RPCProvider(object):
+    '''
+    Runs an RPC provider callback with at most max_concurrency requests in flight.
+
+    Requests beyond that wait in order, up to max_queue of them; has_room() is False once the
+    queue is full, and the handler then rejects further requests so that the server can route
+    them to another provider. None means no limit. A request is in flight until its response
+    is sent, errored or rejected; stats() counts the three outcomes separately, and latency
+    covers responses that were sent or errored.
+    '''
+    def __init__(self, name, callback, clock, max_concurrency=None, max_queue=None):
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if max_queue is not None and max_queue < 0:
+            raise ValueError("max_queue must not be negative")
+        self.name = name
+        self.callback = callback
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._clock = clock
+        self._queue = deque()
+        self.in_flight = 0
+        self.completed = 0
+        self.errors = 0
+        self.rejected = 0
+        self._draining = False
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def has_room(self):
+        if self.max_concurrency is None or self.in_flight < self.max_concurrency:
+            return True
+        return self.max_queue is None or len(self._queue) < self.max_queue
+
+    def submit(self, data, response):
+        response._on_complete = partial(self._complete, self._clock.seconds())
+        if self.max_concurrency is None or self.in_flight < self.max_concurrency:
+            self._start(data, response)
+        else:
+            self._queue.append((data, response))
+
+    def _start(self, data, response):
+        self.in_flight += 1
+        try:
+            self.callback(data, response)
+        except Exception as e:
+            log.failure("RPC provider {name} raised", name=self.name)
+            if not response._is_complete:
+                response.error(str(e))
+
+    def _complete(self, started, outcome=SENT):
+        self.in_flight -= 1
+        if outcome == REJECTED:
+            self.rejected += 1
+        else:
+            if outcome == ERRORED:
+                self.errors += 1
+            else:
+                self.completed += 1
+            latency = self._clock.seconds() - started
+            self.latency_total += latency
+            if latency > self.latency_max:
+                self.latency_max = latency
+        self._drain()
+
+    def _drain(self):
+        # A handler that responds synchronously completes inside _start and re-enters here; only
+        # the outermost call drains, so the stack stays flat however long the queue is.
+        if self._draining:
+            return
+        self._draining = True
+        try:
+            while self._queue and (self.max_concurrency is None or self.in_flight < self.max_concurrency):
+                self._start(*self._queue.popleft())
+        finally:
+            self._draining = False
+
+    def reject_queued(self):
+        '''Reject every queued request, e.g. because the provider is going away.'''
+        queue, self._queue = self._queue, deque()
+        for _, response in queue:
+            response._on_complete = None
+            response.reject()
+            self.rejected += 1
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'queued': len(self._queue),
+            'completed': self.completed,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'latency_total': self.latency_total,
+            'latency_max': self.latency_max,
+            'latency_mean': (self.latency_total / (self.completed + self.errors)
+                             if self.completed + self.errors else 0.0),
+        }
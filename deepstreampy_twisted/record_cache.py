@@ -0,0 +1,218 @@
+"""Size-bounded LRU cache of record data, persisted to a memory-mapped snapshot file."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import mmap
+import os
+import struct
+from collections import OrderedDict
+
+from twisted.internet import task
+
+from deepstreampy_twisted import codec, log
+
+_MAGIC = b'DSRC'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('>4sBI')  # magic, format version, entry count
+_ENTRY = struct.Struct('>HIq')  # name length, payload length, record version
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class _Entry(object):
+    __slots__ = ('version', 'payload', 'offset', 'length')
+
+    def __init__(self, version, payload, offset=0, length=0):
+        self.version = version
+        # payload is the record data as JSON bytes, or None while it still lives in the snapshot
+        # mapping at offset/length; entries loaded from disk are only decoded when first read.
+        self.payload = payload
+        self.offset = offset
+        self.length = length
+
+    @property
+    def size(self):
+        return self.length if self.payload is None else len(self.payload)
+
+
+class RecordCache(object):
+    '''
+    Keeps the latest version and data of records, evicting the least recently used once the
+    encoded data exceeds max_bytes.
+
+    With a path, the cache is loaded from that file when created and written back by
+    snapshot(): periodically if snapshot_interval (seconds) is set, and when the reactor shuts
+    down. Snapshots are written to a memory-mapped temporary file and renamed into place, so a
+    crash never leaves a partial snapshot behind. Loaded entries are only decoded when they are
+    first read.
+
+    Pass the cache to DeepstreamClient as record_cache; records it holds are ready as soon as
+    get_record returns and are reconciled with the server's version when its read arrives.
+    '''
+    def __init__(self, path=None, max_bytes=16 * 1024 * 1024, snapshot_interval=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.snapshot_interval = snapshot_interval
+        self._entries = OrderedDict()
+        self._size = 0
+        self._map = None
+        self._sources = []
+        self._looper = None
+        self._reactor = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    @property
+    def size(self):
+        '''Total size of the cached data, in bytes of JSON.'''
+        return self._size
+
+    def get(self, name):
+        '''Returns (version, data) for name, or None, and marks name as recently used.'''
+        entry = self._entries.get(name)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(name, entry)
+        if entry.payload is None:
+            entry.payload = self._map[entry.offset:entry.offset + entry.length]
+        return entry.version, codec.loads(entry.payload.decode('utf-8'))
+
+    def version(self, name):
+        entry = self._entries.get(name)
+        return entry.version if entry is not None else None
+
+    def put(self, name, version, data):
+        payload = codec.dumps(data).encode('utf-8')
+        self.discard(name)
+        entry = _Entry(int(version), payload)
+        self._entries[name] = entry
+        self._size += entry.size
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+            self.evictions += 1
+
+    def discard(self, name):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def _touch(self, name, entry):
+        del self._entries[name]
+        self._entries[name] = entry
+
+    def add_source(self, func):
+        '''Register func to be called at the start of every snapshot, e.g. to flush live records.'''
+        self._sources.append(func)
+
+    def start(self, reactor):
+        '''Snapshot every snapshot_interval seconds and at reactor shutdown. Idempotent.'''
+        if self._reactor is not None or self.path is None:
+            return
+        self._reactor = reactor
+        if self.snapshot_interval:
+            self._looper = task.LoopingCall(self.snapshot)
+            self._looper.clock = reactor
+            self._looper.start(self.snapshot_interval, now=False)
+        if hasattr(reactor, 'addSystemEventTrigger'):
+            reactor.addSystemEventTrigger('before', 'shutdown', self.close)
+
+    def stop(self):
+        if self._looper is not None and self._looper.running:
+            self._looper.stop()
+        self._looper = None
+
+    def close(self):
+        '''Stop periodic snapshots and write a final one.'''
+        self.stop()
+        if self.path is not None:
+            self.snapshot()
+
+    def snapshot(self, path=None):
+        '''Write every entry, least recently used first, to path (default: the cache's path).'''
+        path = path or self.path
+        for source in self._sources:
+            source()
+        entries = []
+        total = _HEADER.size
+        for name, entry in self._entries.items():
+            if entry.payload is None:
+                entry.payload = self._map[entry.offset:entry.offset + entry.length]
+            encoded_name = name.encode('utf-8')
+            entries.append((encoded_name, entry))
+            total += _ENTRY.size + len(encoded_name) + len(entry.payload)
+
+        temporary = path + '.tmp'
+        with open(temporary, 'w+b') as f:
+            f.truncate(total)
+            mapping = mmap.mmap(f.fileno(), total)
+            try:
+                _HEADER.pack_into(mapping, 0, _MAGIC, _FORMAT_VERSION, len(entries))
+                offset = _HEADER.size
+                for encoded_name, entry in entries:
+                    _ENTRY.pack_into(mapping, offset, len(encoded_name), len(entry.payload), entry.version)
+                    offset += _ENTRY.size
+                    mapping[offset:offset + len(encoded_name)] = encoded_name
+                    offset += len(encoded_name)
+                    mapping[offset:offset + len(entry.payload)] = entry.payload
+                    offset += len(entry.payload)
+                mapping.flush()
+            finally:
+                mapping.close()
+        _replace(temporary, path)
+
+    def load(self, path=None):
+        '''Replace the cache's contents with the snapshot at path. A corrupt snapshot is ignored.'''
+        path = path or self.path
+        with open(path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            entries = self._read_entries(mapping)
+        except (ValueError, struct.error) as e:
+            mapping.close()
+            log.warn("Ignoring record cache snapshot {path}: {error}", path=path, error=e)
+            return
+        self.clear()
+        if self._map is not None:
+            self._map.close()
+        self._map = mapping
+        for name, entry in entries:
+            self._entries[name] = entry
+            self._size += entry.size
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+
+    @staticmethod
+    def _read_entries(mapping):
+        magic, format_version, count = _HEADER.unpack_from(mapping, 0)
+        if magic != _MAGIC or format_version != _FORMAT_VERSION:
+            raise ValueError("not a record cache snapshot")
+        entries = []
+        offset = _HEADER.size
+        for _ in range(count):
+            name_length, payload_length, version = _ENTRY.unpack_from(mapping, offset)
+            offset += _ENTRY.size
+            name = mapping[offset:offset + name_length].decode('utf-8')
+            offset += name_length
+            if offset + payload_length > len(mapping):
+                raise ValueError("snapshot is truncated")
+            entries.append((name, _Entry(version, None, offset, payload_length)))
+            offset += payload_length
+        return entries
@@ -0,0 +1,129 @@
+"""Bounded queue for messages sent while the connection is not open."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+from collections import deque
+
+from twisted.internet import defer
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+REJECT = 'reject'
+BLOCK = 'block'
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, REJECT, BLOCK)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class MessageDropped(Exception):
+    '''
+    A queued message was not sent: it was evicted, or never queued, under a drop policy, or the
+    connection closed while it was still buffered for a coalesced write.
+    '''
+
+
+class SendQueue(object):
+    '''
+    Holds (raw_message, Deferred) pairs until the connection can send them.
+
+    max_messages and max_bytes cap the queue; None means unlimited. When a message does
+    not fit, the overflow policy decides what happens:
+      drop_oldest: evict queued messages from the front until it fits
+      drop_newest: discard the new message
+      reject: errback the new message's Deferred with QueueFullError
+      block: park the message until space frees up; producers can wait on wait_for_space().
+             At most max_blocked messages are parked; past that, new messages are rejected as
+             under the reject policy
+    Dropped messages have their Deferred errbacked with MessageDropped.
+    An empty queue always accepts one message, however large.
+    '''
+    def __init__(self, max_messages=None, max_bytes=None, policy=REJECT, max_blocked=1024):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError("policy must be one of: " + ", ".join(OVERFLOW_POLICIES))
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.max_blocked = max_blocked
+        self.bytes = 0
+        self.dropped = 0
+        self.rejected = 0
+        self._messages = deque()
+        self._blocked = deque()
+        self._space_waiters = []
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __bool__(self):
+        return bool(self._messages)
+    __nonzero__ = __bool__
+
+    def _has_room(self, size):
+        if not self._messages:
+            return True
+        if self.max_messages is not None and len(self._messages) >= self.max_messages:
+            return False
+        if self.max_bytes is not None and self.bytes + size > self.max_bytes:
+            return False
+        return True
+
+    def _append(self, raw_message, deferred):
+        self._messages.append((raw_message, deferred))
+        self.bytes += len(raw_message)
+
+    def put(self, raw_message):
+        '''Queue a message. Returns a Deferred that fires once the message is written to the transport.'''
+        deferred = defer.Deferred()
+        size = len(raw_message)
+        if not self._blocked and self._has_room(size):
+            self._append(raw_message, deferred)
+        elif self.policy == DROP_OLDEST:
+            while self._messages and not self._has_room(size):
+                dropped_message, dropped_deferred = self._messages.popleft()
+                self.bytes -= len(dropped_message)
+                self.dropped += 1
+                dropped_deferred.errback(MessageDropped("Evicted from the send queue by a newer message"))
+            self._append(raw_message, deferred)
+        elif self.policy == DROP_NEWEST:
+            self.dropped += 1
+            deferred.errback(MessageDropped("Send queue is full ({0} messages, {1} bytes)".format(
+                len(self._messages), self.bytes)))
+        elif self.policy == REJECT or len(self._blocked) >= self.max_blocked:
+            self.rejected += 1
+            deferred.errback(QueueFullError(
+                "Send queue is full ({0} messages, {1} bytes, {2} blocked)".format(
+                    len(self._messages), self.bytes, len(self._blocked))))
+        else:
+            self._blocked.append((raw_message, deferred))
+        return deferred
+
+    def popleft(self):
+        raw_message, deferred = self._messages.popleft()
+        self.bytes -= len(raw_message)
+        self._on_space()
+        return raw_message, deferred
+
+    def wait_for_space(self):
+        '''Returns a Deferred that fires when the queue can accept a message without overflowing.'''
+        if not self._blocked and self._has_room(0):
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._space_waiters.append(d)
+        return d
+
+    def _on_space(self):
+        while self._blocked and self._has_room(len(self._blocked[0][0])):
+            self._append(*self._blocked.popleft())
+        if self._blocked or not self._has_room(0):
+            return
+        waiters, self._space_waiters = self._space_waiters, []
+        for d in waiters:
+            d.callback(None)
+
+    def stats(self):
+        return {'depth': len(self._messages),
+                'bytes': self.bytes,
+                'blocked': len(self._blocked),
+                'dropped': self.dropped,
+                'rejected': self.rejected}
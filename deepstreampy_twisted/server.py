@@ -0,0 +1,353 @@
+"""A small in-process deepstream server for tests and load generation."""
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+import itertools
+import json
+
+from autobahn.twisted.websocket import WebSocketServerFactory, WebSocketServerProtocol
+from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+from deepstreampy import constants, jsonpath
+from deepstreampy.constants import actions
+from deepstreampy.constants import topic as topics
+from deepstreampy.message import message_builder, message_parser
+from twisted.internet import task
+
+from deepstreampy_twisted import log
+
+_SEPARATOR = constants.message.MESSAGE_SEPERATOR
+_PART_SEPARATOR = constants.message.MESSAGE_PART_SEPERATOR
+
+
+def _dumps(data):
+    return json.dumps(data, separators=(',', ':'))
+
+
+class Session(object):
+    '''Per-connection state kept by the server.'''
+    __slots__ = ('protocol', 'username', 'auth_attempts')
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.username = None
+        self.auth_attempts = 0
+
+
+class DeepstreamServerProtocol(WebSocketServerProtocol):
+    def onOpen(self):
+        self.session = Session(self)
+        self.factory.sessions[self] = self.session
+        self.send(topics.CONNECTION, actions.CHALLENGE)
+
+    def onMessage(self, payload, isBinary):
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+        for raw in payload.split(_SEPARATOR):
+            if raw:
+                parts = raw.split(_PART_SEPARATOR)
+                if len(parts) >= 2:
+                    self.factory.handle(self.session, parts[0], parts[1], parts[2:])
+
+    def onClose(self, wasClean, code, reason):
+        session = getattr(self, 'session', None)
+        if session is not None:
+            self.factory.remove(session)
+
+    def send(self, topic, action, *data):
+        message = _PART_SEPARATOR.join((topic, action) + data) + _SEPARATOR
+        self.sendMessage(message.encode('utf-8'))
+
+
+class DeepstreamServerFactory(WebSocketServerFactory):
+    '''
+    Implements the connection, auth, event, RPC, record and presence flows that
+    DeepstreamClient uses, with all state in memory. Clients are served in the order their
+    messages arrive; there is no persistence, permissioning, clustering or listening (listen
+    requests are acknowledged but never matched).
+
+    authenticate(auth_data) decides logins: it returns a username (or True to use
+    auth_data['username']) to accept, or a false value to reject. By default everyone is
+    accepted. heartbeat_interval, if given, pings every client that often. With compression,
+    a client's permessage-deflate offer is accepted as made.
+    '''
+    protocol = DeepstreamServerProtocol
+    max_auth_attempts = 3
+
+    def __init__(self, url='ws://127.0.0.1/deepstream', authenticate=None, heartbeat_interval=None,
+                 reactor=None, compression=False):
+        WebSocketServerFactory.__init__(self, url)
+        if compression:
+            self.setProtocolOptions(perMessageCompressionAccept=self._accept_compression)
+        if reactor is None:
+            from twisted.internet import reactor
+        self.reactor = reactor
+        self.authenticate = authenticate
+        self.sessions = {}
+        self.events = {}
+        self.providers = {}
+        self.rpcs = {}
+        self.records = {}
+        self.record_subscribers = {}
+        self.presence_subscribers = set()
+        self._anonymous = itertools.count(1)
+        self._heartbeat = None
+        self._heartbeat_interval = heartbeat_interval
+        if heartbeat_interval:
+            self._heartbeat = task.LoopingCall(self.ping)
+            self._heartbeat.clock = reactor
+        self._handlers = {
+            topics.CONNECTION: self.handle_connection,
+            topics.AUTH: self.handle_auth,
+            topics.EVENT: self.handle_event,
+            topics.RPC: self.handle_rpc,
+            topics.RECORD: self.handle_record,
+            topics.PRESENCE: self.handle_presence,
+        }
+
+    def _accept_compression(self, offers):
+        for offer in offers:
+            if isinstance(offer, PerMessageDeflateOffer):
+                return PerMessageDeflateOfferAccept(offer)
+        return None
+
+    def startFactory(self):
+        if self._heartbeat is not None and not self._heartbeat.running:
+            self._heartbeat.start(self._heartbeat_interval, now=False)
+
+    def stopFactory(self):
+        if self._heartbeat is not None and self._heartbeat.running:
+            self._heartbeat.stop()
+
+    def ping(self):
+        for session in list(self.sessions.values()):
+            session.protocol.send(topics.CONNECTION, actions.PING)
+
+    def handle(self, session, topic, action, data):
+        if session.username is None and topic not in (topics.CONNECTION, topics.AUTH):
+            log.warn("Ignoring {topic}|{action} from an unauthenticated client", topic=topic, action=action)
+            return
+        handler = self._handlers.get(topic)
+        if handler is None:
+            session.protocol.send(topics.ERROR, actions.ERROR, constants.event.MESSAGE_PARSE_ERROR,
+                                  'Unknown topic ' + topic)
+            return
+        handler(session, action, data)
+
+    def remove(self, session):
+        '''Forget a closed connection: its subscriptions, providers and pending RPCs.'''
+        self.sessions.pop(session.protocol, None)
+        for subscribers in itertools.chain(self.events.values(), self.record_subscribers.values()):
+            subscribers.discard(session)
+        self.presence_subscribers.discard(session)
+        for providers in self.providers.values():
+            if session in providers:
+                providers.remove(session)
+        for key, rpc in list(self.rpcs.items()):
+            if rpc['requester'] is session:
+                del self.rpcs[key]
+            elif rpc['provider'] is session:
+                self._route_rpc(key)
+        if session.username is not None:
+            self._broadcast_presence(session, actions.PRESENCE_LEAVE)
+
+    # Connection and auth
+
+    def handle_connection(self, session, action, data):
+        send = session.protocol.send
+        if action == actions.CHALLENGE_RESPONSE:
+            send(topics.CONNECTION, actions.ACK)
+        elif action == actions.PING:
+            send(topics.CONNECTION, actions.PONG)
+
+    def handle_auth(self, session, action, data):
+        send = session.protocol.send
+        if action != actions.REQUEST:
+            return
+        try:
+            auth_data = json.loads(data[0]) if data else {}
+        except ValueError:
+            auth_data = None
+        username = self._check_auth(auth_data)
+        if not username:
+            session.auth_attempts += 1
+            if session.auth_attempts >= self.max_auth_attempts:
+                send(topics.AUTH, actions.ERROR, constants.event.TOO_MANY_AUTH_ATTEMPTS,
+                     message_builder.typed('too many authentication attempts'))
+                session.protocol.sendClose()
+            else:
+                send(topics.AUTH, actions.ERROR, 'INVALID_AUTHENTICATION_DETAILS',
+                     message_builder.typed('invalid authentication data'))
+            return
+        session.username = username
+        send(topics.AUTH, actions.ACK)
+        self._broadcast_presence(session, actions.PRESENCE_JOIN)
+
+    def _check_auth(self, auth_data):
+        if not isinstance(auth_data, dict):
+            return None
+        if self.authenticate is None:
+            result = True
+        else:
+            result = self.authenticate(auth_data)
+        if result is True:
+            return auth_data.get('username') or 'anonymous-%d' % next(self._anonymous)
+        return result
+
+    # Events
+
+    def handle_event(self, session, action, data):
+        send = session.protocol.send
+        if action == actions.SUBSCRIBE:
+            self.events.setdefault(data[0], set()).add(session)
+            send(topics.EVENT, actions.ACK, actions.SUBSCRIBE, data[0])
+        elif action == actions.UNSUBSCRIBE:
+            self.events.get(data[0], set()).discard(session)
+            send(topics.EVENT, actions.ACK, actions.UNSUBSCRIBE, data[0])
+        elif action == actions.EVENT:
+            for subscriber in list(self.events.get(data[0], ())):
+                if subscriber is not session:
+                    subscriber.protocol.send(topics.EVENT, actions.EVENT, *data)
+        elif action in (actions.LISTEN, actions.UNLISTEN):
+            send(topics.EVENT, actions.ACK, action, data[0])
+
+    # RPC
+
+    def handle_rpc(self, session, action, data):
+        send = session.protocol.send
+        if action == actions.SUBSCRIBE:
+            providers = self.providers.setdefault(data[0], [])
+            if session not in providers:
+                providers.append(session)
+            send(topics.RPC, actions.ACK, actions.SUBSCRIBE, data[0])
+        elif action == actions.UNSUBSCRIBE:
+            providers = self.providers.get(data[0], [])
+            if session in providers:
+                providers.remove(session)
+            send(topics.RPC, actions.ACK, actions.UNSUBSCRIBE, data[0])
+        elif action == actions.REQUEST:
+            name, correlation_id = data[0], data[1]
+            key = (name, correlation_id)
+            self.rpcs[key] = {'requester': session, 'provider': None, 'tried': set(),
+                              'data': data[2] if len(data) > 2 else ''}
+            self._route_rpc(key)
+        elif action == actions.ACK and data and data[0] == actions.REQUEST:
+            rpc = self.rpcs.get((data[1], data[2]))
+            if rpc is not None:
+                rpc['requester'].protocol.send(topics.RPC, actions.ACK, *data)
+        elif action == actions.RESPONSE:
+            rpc = self.rpcs.pop((data[0], data[1]), None)
+            if rpc is not None:
+                rpc['requester'].protocol.send(topics.RPC, actions.RESPONSE, *data)
+        elif action == actions.REJECTION:
+            if (data[0], data[1]) in self.rpcs:
+                self._route_rpc((data[0], data[1]))
+        elif action == actions.ERROR and len(data) >= 3:
+            rpc = self.rpcs.pop((data[1], data[2]), None)
+            if rpc is not None:
+                rpc['requester'].protocol.send(topics.RPC, actions.ERROR, *data)
+
+    def _route_rpc(self, key):
+        # Offers the request to the next provider that has not rejected it yet, round robin.
+        name, correlation_id = key
+        rpc = self.rpcs[key]
+        providers = self.providers.get(name, [])
+        for _ in range(len(providers)):
+            provider = providers.pop(0)
+            providers.append(provider)
+            if provider not in rpc['tried']:
+                rpc['tried'].add(provider)
+                rpc['provider'] = provider
+                provider.protocol.send(topics.RPC, actions.REQUEST, name, correlation_id, rpc['data'])
+                return
+        del self.rpcs[key]
+        rpc['requester'].protocol.send(topics.RPC, actions.ERROR, constants.event.NO_RPC_PROVIDER,
+                                       name, correlation_id)
+
+    # Records
+
+    def handle_record(self, session, action, data):
+        send = session.protocol.send
+        name = data[0] if data else None
+        record = self.records.get(name)
+        if action == actions.CREATEORREAD:
+            if record is None:
+                record = self.records[name] = [0, {}]
+            self.record_subscribers.setdefault(name, set()).add(session)
+            send(topics.RECORD, actions.ACK, actions.SUBSCRIBE, name)
+            send(topics.RECORD, actions.READ, name, str(record[0]), _dumps(record[1]))
+        elif action in (actions.UPDATE, actions.PATCH):
+            self._write_record(session, action, data)
+        elif action == actions.UNSUBSCRIBE:
+            self.record_subscribers.get(name, set()).discard(session)
+            send(topics.RECORD, actions.ACK, actions.UNSUBSCRIBE, name)
+        elif action == actions.DELETE:
+            self.records.pop(name, None)
+            for subscriber in self.record_subscribers.pop(name, set()) | set([session]):
+                subscriber.protocol.send(topics.RECORD, actions.ACK, actions.DELETE, name)
+        elif action == actions.SNAPSHOT:
+            if record is None:
+                send(topics.RECORD, actions.ERROR, actions.SNAPSHOT, name,
+                     constants.event.RECORD_NOT_FOUND)
+            else:
+                send(topics.RECORD, actions.READ, name, str(record[0]), _dumps(record[1]))
+        elif action == actions.HAS:
+            send(topics.RECORD, actions.HAS, name, message_builder.typed(record is not None))
+        elif action in (actions.LISTEN, actions.UNLISTEN):
+            send(topics.RECORD, actions.ACK, action, name)
+
+    def _write_record(self, session, action, data):
+        name, version = data[0], int(data[1])
+        record = self.records.setdefault(name, [0, {}])
+        if version != record[0] + 1:
+            session.protocol.send(topics.RECORD, actions.ERROR, constants.event.VERSION_EXISTS, name,
+                                  str(record[0]), _dumps(record[1]))
+            return
+        if action == actions.UPDATE:
+            record[1] = json.loads(data[2])
+            config = data[3] if len(data) > 3 else None
+        else:
+            value = message_parser.convert_typed(data[3], None)
+            record[1] = jsonpath.set(record[1], data[2], value, False)
+            config = data[4] if len(data) > 4 else None
+        record[0] = version
+        forward = data[:3] if action == actions.UPDATE else data[:4]
+        for subscriber in list(self.record_subscribers.get(name, ())):
+            if subscriber is not session:
+                subscriber.protocol.send(topics.RECORD, action, *forward)
+        if config and json.loads(config).get('writeSuccess'):
+            session.protocol.send(topics.RECORD, actions.WRITE_ACKNOWLEDGEMENT, name,
+                                  json.dumps([version]), message_builder.typed(None))
+
+    # Presence
+
+    def handle_presence(self, session, action, data):
+        send = session.protocol.send
+        if action == actions.SUBSCRIBE:
+            self.presence_subscribers.add(session)
+            send(topics.PRESENCE, actions.ACK, actions.SUBSCRIBE, *data)
+        elif action == actions.UNSUBSCRIBE:
+            self.presence_subscribers.discard(session)
+            send(topics.PRESENCE, actions.ACK, actions.UNSUBSCRIBE, *data)
+        elif action == actions.QUERY:
+            online = [other.username for other in self.sessions.values()
+                      if other is not session and other.username is not None]
+            if data and data[0] != actions.QUERY:
+                online = [username for username in online if username in data]
+            send(topics.PRESENCE, actions.QUERY, *sorted(online))
+
+    def _broadcast_presence(self, session, action):
+        for subscriber in list(self.presence_subscribers):
+            if subscriber is not session:
+                subscriber.protocol.send(topics.PRESENCE, action, session.username)
+
+
+def listen(port=0, interface='127.0.0.1', reactor=None, **kwargs):
+    '''
+    Start a DeepstreamServerFactory on a TCP port; 0 picks a free one. Returns the factory
+    and the listening port, whose getHost().port gives the port number.
+    '''
+    if reactor is None:
+        from twisted.internet import reactor
+    factory = DeepstreamServerFactory(reactor=reactor, **kwargs)
+    listening = reactor.listenTCP(port, factory, interface=interface)
+    return factory, listening
@@ -0,0 +1,125 @@
+"""Hashed timing wheel for large numbers of coarse timeouts."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import itertools
+import math
+import time
+
+from twisted.internet import task
+
+from deepstreampy_twisted import log
+
+# Wall-clock jumps must not look like missed heartbeats; Python 2 has no monotonic clock.
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+def _seq(timer):
+    return timer.seq
+
+
+class WheelTimer(object):
+    '''A timeout scheduled on a TimingWheel; mirrors the parts of IDelayedCall callers need.'''
+    __slots__ = ('_wheel', 'slot', 'rounds', 'seq', 'func', 'args', 'cancelled', 'called')
+
+    def __init__(self, wheel, slot, rounds, seq, func, args):
+        self._wheel = wheel
+        self.slot = slot
+        self.rounds = rounds
+        self.seq = seq
+        self.func = func
+        self.args = args
+        self.cancelled = False
+        self.called = False
+
+    def cancel(self):
+        self._wheel.cancel(self)
+
+    def active(self):
+        return not (self.cancelled or self.called)
+
+
+class TimingWheel(object):
+    '''
+    Schedules timeouts into a ring of slots advanced by a single LoopingCall.
+
+    add() and cancel() are O(1) and never touch the reactor's delayed-call heap, which makes
+    the wheel suited to ack timeouts: many of them, almost all cancelled, none needing more
+    precision than the resolution (in seconds). The LoopingCall only runs while timers are
+    pending. Timers due in the same slot fire in the order they were added.
+    '''
+    def __init__(self, reactor, resolution=0.1, slots=512):
+        self.resolution = resolution
+        self._reactor = reactor
+        self._slots = [set() for _ in range(slots)]
+        self._seq = itertools.count()
+        self._cursor = 0
+        self._pending = 0
+        self._looper = None
+
+    def __len__(self):
+        return self._pending
+
+    def add(self, delay, func, *args):
+        ticks = max(1, int(math.ceil(delay / self.resolution)))
+        slot = (self._cursor + ticks) % len(self._slots)
+        rounds = (ticks - 1) // len(self._slots)
+        timer = WheelTimer(self, slot, rounds, next(self._seq), func, args)
+        self._slots[slot].add(timer)
+        self._pending += 1
+        if self._looper is None:
+            self._looper = task.LoopingCall.withCount(self._advance)
+            self._looper.clock = self._reactor
+            self._looper.start(self.resolution, now=False).addErrback(self._looper_failed, self._looper)
+        return timer
+
+    def cancel(self, timer):
+        if not timer.active():
+            return
+        timer.cancelled = True
+        bucket = self._slots[timer.slot]
+        if timer in bucket:
+            bucket.remove(timer)
+            self._pending -= 1
+            if not self._pending:
+                self._stop()
+
+    def _stop(self):
+        if self._looper is not None:
+            if self._looper.running:
+                self._looper.stop()
+            self._looper = None
+
+    def _looper_failed(self, failure, looper):
+        # _advance guards every callback, so this is a bug in the wheel itself; let the next
+        # add() start a fresh LoopingCall rather than leave timers that never fire.
+        log.failure("Timing wheel stopped", failure)
+        if self._looper is looper:
+            self._looper = None
+
+    def _advance(self, ticks):
+        # withCount reports every interval that elapsed, so a stalled reactor catches up
+        # instead of silently stretching every pending timeout.
+        slots = self._slots
+        for _ in range(ticks):
+            self._cursor = (self._cursor + 1) % len(slots)
+            bucket = slots[self._cursor]
+            if not bucket:
+                continue
+            expired = sorted((timer for timer in bucket if timer.rounds == 0), key=_seq)
+            for timer in bucket:
+                timer.rounds -= 1
+            for timer in expired:
+                bucket.remove(timer)
+                self._pending -= 1
+            for timer in expired:
+                # An earlier callback in this slot may have cancelled it.
+                if not timer.cancelled:
+                    timer.called = True
+                    try:
+                        timer.func(*timer.args)
+                    except Exception:
+                        log.failure("Timeout callback {func} raised", func=timer.func)
+            if not self._pending:
+                break
+        if not self._pending:
+            self._stop()
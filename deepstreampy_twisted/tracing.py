@@ -0,0 +1,90 @@
+"""Connection tracing: a sampled ring buffer of wire events and state transitions, dumped on demand or on error."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+from collections import deque
+
+from deepstreampy import constants
+
+from deepstreampy_twisted import log
+from deepstreampy_twisted.timing import monotonic
+
+SEND = 'send'
+RECEIVE = 'recv'
+STATE = 'state'
+ERROR = 'error'
+
+_AUTH_REQUEST = (constants.topic.AUTH + constants.message.MESSAGE_PART_SEPERATOR +
+                 constants.actions.REQUEST + constants.message.MESSAGE_PART_SEPERATOR).encode('utf-8')
+_REDACTED = _AUTH_REQUEST + b'<redacted>' + constants.message.MESSAGE_SEPERATOR.encode('utf-8')
+_READABLE = {ord(constants.message.MESSAGE_PART_SEPERATOR): u'|', ord(constants.message.MESSAGE_SEPERATOR): u'+'}
+
+
+class Tracer(object):
+    '''
+    Keeps the last size events, each a (timestamp, kind, detail) tuple. Only one in every sample wire
+    events (frames sent and received) is kept; state transitions and errors always are. Recording
+    stores the frame as is, so formatting costs nothing until dump(); only authentication requests
+    are rewritten, with the credentials left out.
+
+    Protocols check factory.tracer is not None before calling in, so a client without a tracer only
+    pays for that check.
+    '''
+    def __init__(self, size=1024, sample=1, dump_on_error=True, clock=monotonic):
+        self.events = deque(maxlen=size)
+        self.sample = max(int(sample), 1)
+        self.dump_on_error = dump_on_error
+        self.clock = clock
+        self.wire_count = 0
+
+    def __len__(self):
+        return len(self.events)
+
+    def wire(self, kind, payload):
+        self.wire_count += 1
+        if self.wire_count % self.sample == 0:
+            self.events.append((self.clock(), kind, redact(payload)))
+
+    def state(self, state):
+        self.events.append((self.clock(), STATE, state))
+
+    def error(self, topic, event, message=None):
+        '''Records an error and, with dump_on_error, logs the buffer leading up to it.'''
+        self.events.append((self.clock(), ERROR, (topic, event, message)))
+        if self.dump_on_error:
+            self.log_dump("%s %s" % (topic, event))
+
+    def clear(self):
+        self.events.clear()
+
+    def snapshot(self):
+        return list(self.events)
+
+    def dump(self):
+        '''The buffer as text lines, oldest first, timed in milliseconds relative to the newest event.'''
+        events = list(self.events)
+        if not events:
+            return []
+        end = events[-1][0]
+        return ['%+10.3fms %-5s %s' % ((timestamp - end) * 1000.0, kind, readable(detail))
+                for timestamp, kind, detail in events]
+
+    def log_dump(self, reason=None):
+        lines = self.dump()
+        log.warn("Trace ({reason}), last {count} events:\n{lines}",
+                 reason=reason or 'requested', count=len(lines), lines='\n'.join(lines))
+
+
+def readable(detail):
+    '''Text for a frame or detail, with the message separators shown as | and +.'''
+    if isinstance(detail, bytes):
+        detail = detail.decode('utf-8', 'replace')
+    elif not isinstance(detail, type(u'')):
+        detail = repr(detail) if isinstance(detail, tuple) else u'%s' % (detail,)
+    return detail.translate(_READABLE)
+
+
+def redact(frame):
+    '''The frame, or for an authentication request (whose data are the credentials), a placeholder.'''
+    if frame.startswith(_AUTH_REQUEST):
+        return _REDACTED
+    return frame
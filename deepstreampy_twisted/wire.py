@@ -0,0 +1,147 @@
+"""Parsing of inbound deepstream messages straight from bytes, decoding large payloads lazily."""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import codecs
+import inspect
+
+from deepstreampy import constants
+from deepstreampy.constants import actions
+from deepstreampy.constants import event as event_constants
+from deepstreampy.constants import topic as topic_constants
+
+SEPARATOR = constants.message.MESSAGE_SEPERATOR.encode('ascii')
+PART_SEPARATOR = constants.message.MESSAGE_PART_SEPERATOR.encode('ascii')
+_TEXT_PART_SEPARATOR = constants.message.MESSAGE_PART_SEPERATOR
+
+# Messages at least this long keep their data as bytes until a handler reads message['data'].
+# For shorter ones, per-message work costs more than decoding, so frames whose messages average
+# less than this are decoded in one go instead.
+LAZY_THRESHOLD = 1024
+
+_text_type = type(u'')
+_decode = codecs.utf_8_decode
+_string_types = (str, _text_type)
+
+
+def _names(module):
+    return [value for name, value in inspect.getmembers(module) if name.isupper() and isinstance(value, _string_types)]
+
+
+# Topics and actions are looked up as bytes and mapped to the strings the handlers compare
+# against, so they are never decoded.
+_TOPICS = dict((name.encode('ascii'), name) for name in _names(topic_constants))
+_ACTIONS = dict((name.encode('ascii'), name) for name in _names(actions))
+_TEXT_ACTIONS = frozenset(_names(actions))
+
+
+_LAZY_KEYS = frozenset(('raw', 'data'))
+
+
+class Message(dict):
+    '''
+    A parsed message whose 'raw' text and 'data' list are only decoded out of the frame when first
+    read, through [], get() or in. The message holds a view of the frame, keeping it in memory
+    while the message is referenced.
+    '''
+    __slots__ = ('_view', '_data_offset')
+
+    def __missing__(self, key):
+        if key == 'data':
+            data = _decode(self._view[self._data_offset:])[0].split(_TEXT_PART_SEPARATOR)
+        elif key == 'raw':
+            data = _decode(self._view)[0]
+        else:
+            raise KeyError(key)
+        self[key] = data
+        return data
+
+    def get(self, key, default=None):
+        if key in _LAZY_KEYS:
+            return self[key]
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        return key in _LAZY_KEYS or dict.__contains__(self, key)
+
+
+def parse(raw_messages, client):
+    '''
+    Like message_parser.parse, for bytes.
+
+    Frames of large messages are scanned as bytes: topic and action are looked up without
+    decoding, and payloads are neither copied nor decoded until read (see Message). Frames of small
+    messages, the common case, are decoded once and split as text, which is cheaper than any
+    per-message work.
+    '''
+    if isinstance(raw_messages, _text_type):
+        return _parse_text(raw_messages, client)
+    count = raw_messages.count(SEPARATOR)
+    if count and len(raw_messages) < LAZY_THRESHOLD * count:
+        return _parse_text(raw_messages.decode('utf-8'), client)
+    return _parse_bytes(raw_messages, client)
+
+
+def _parse_error(client, message):
+    client._on_error(topic_constants.ERROR, event_constants.MESSAGE_PARSE_ERROR, message)
+
+
+def _parse_text(raw_messages, client, _actions=_TEXT_ACTIONS, _separator=_TEXT_PART_SEPARATOR):
+    parsed_messages = []
+    append = parsed_messages.append
+    for message in raw_messages.split(constants.message.MESSAGE_SEPERATOR):
+        if not message:
+            continue
+        parts = message.split(_separator)
+        if len(parts) < 2:
+            _parse_error(client, 'Insufficient message parts')
+            append(None)
+        elif parts[1] not in _actions:
+            _parse_error(client, 'Unknown action {0}'.format(parts[1]))
+            append(None)
+        else:
+            append({'raw': message, 'topic': parts[0], 'action': parts[1], 'data': parts[2:]})
+    return parsed_messages
+
+
+def _parse_bytes(raw_messages, client):
+    parsed_messages = []
+    append = parsed_messages.append
+    find = raw_messages.find
+    view = memoryview(raw_messages)
+    size = len(raw_messages)
+    start = 0
+    while start < size:
+        end = find(SEPARATOR, start)
+        if end < 0:
+            end = size
+        if end == start:
+            start += 1
+            continue
+        first = find(PART_SEPARATOR, start, end)
+        if first < 0:
+            _parse_error(client, 'Insufficient message parts')
+            append(None)
+            start = end + 1
+            continue
+        second = find(PART_SEPARATOR, first + 1, end)
+        action = _ACTIONS.get(raw_messages[first + 1:second if second >= 0 else end])
+        if action is None:
+            _parse_error(client, 'Unknown action {0}'.format(
+                raw_messages[first + 1:second if second >= 0 else end].decode('utf-8', 'replace')))
+            append(None)
+            start = end + 1
+            continue
+        topic = _TOPICS.get(raw_messages[start:first])
+        if topic is None:
+            topic = raw_messages[start:first].decode('utf-8', 'replace')
+        if end - start < LAZY_THRESHOLD:
+            message = raw_messages[start:end].decode('utf-8')
+            append({'raw': message, 'topic': topic, 'action': action,
+                    'data': message.split(_TEXT_PART_SEPARATOR)[2:]})
+        else:
+            lazy = Message(topic=topic, action=action)
+            lazy._view = view[start:end]
+            lazy._data_offset = second + 1 - start
+            append(lazy)
+        start = end + 1
+    return parsed_messages
@@ -95,9 +95,9 @@ setup(
     # If your package is a single module, use this instead of 'packages':
     # py_modules=['mypackage'],
 
-    # entry_points={
-    #     'console_scripts': ['mycli=mymodule:cli'],
-    # },
+    entry_points={
+        'console_scripts': ['deepstream-loadgen=deepstreampy_twisted.loadgen:main'],
+    },
     install_requires=requirements(),
     dependency_links=['git+https://github.com/sapid/deepstreampy.git@patch-1#egg=deepstreampy-0.1.1'],
     include_package_data=True,
@@ -108,6 +108,7 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python',
         'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
         'Programming Language :: Python :: Implementation :: CPython',
         'Programming Language :: Python :: Implementation :: PyPy',
         'Intended Audience :: Developers'
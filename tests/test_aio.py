@@ -0,0 +1,177 @@
+from __future__ import absolute_import, division, print_function, with_statement
+
+import asyncio
+import os
+import subprocess
+import sys
+
+from twisted.internet import defer, reactor
+from twisted.trial import unittest
+
+from deepstreampy_twisted import aio
+from deepstreampy_twisted import server
+
+
+class SubscriptionTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def collect(self, subscription):
+        async def collect():
+            return [item async for item in subscription]
+        return self.loop.run_until_complete(collect())
+
+    def test_iterates_until_closed(self):
+        closed = []
+        subscription = aio.Subscription(self.loop)
+        subscription._unsubscribe = lambda: closed.append(True)
+        subscription._put(1)
+        subscription._put(2)
+        self.loop.call_soon(subscription._put, 3)
+        self.loop.call_soon(subscription.close)
+        self.assertEqual(self.collect(subscription), [1, 2, 3])
+        self.assertEqual(closed, [True])
+        subscription._put(4)
+        self.assertEqual(len(subscription), 0)
+
+    def test_drops_oldest_past_maxsize(self):
+        subscription = aio.Subscription(self.loop, maxsize=2)
+        for item in range(5):
+            subscription._put(item)
+        subscription.close()
+        self.assertEqual(self.collect(subscription), [3, 4])
+        self.assertEqual(subscription.dropped, 3)
+
+    def test_await_returns_subscription_once_acked(self):
+        subscription = aio.Subscription(self.loop)
+        self.loop.call_soon(subscription._ack, True)
+        self.assertIs(self.loop.run_until_complete(self.await_(subscription)), subscription)
+        self.assertTrue(subscription.acked.result())
+
+    async def await_(self, awaitable):
+        return await awaitable
+
+    def test_needs_asyncio_reactor(self):
+        self.assertRaises(TypeError, aio._event_loop, object())
+
+
+# Run in a fresh interpreter, since installing a reactor is once per process. The stand-in
+# uvloop module records whether a loop was made from it.
+_INSTALL_IN_RUNNING_LOOP = '''
+import asyncio, sys, types
+uvloop = types.ModuleType('uvloop')
+uvloop.created = []
+def new_event_loop():
+    uvloop.created.append(True)
+    return asyncio.new_event_loop()
+uvloop.new_event_loop = new_event_loop
+sys.modules['uvloop'] = uvloop
+from deepstreampy_twisted import aio
+
+async def main():
+    reactor = aio.install_reactor()
+    assert reactor._asyncioEventloop is asyncio.get_running_loop()
+    assert not uvloop.created
+    d = reactor.callLater(0, lambda: None)
+    await asyncio.sleep(0.01)
+    assert d.called
+    print('ok')
+
+asyncio.run(main())
+'''
+
+
+class InstallReactorTest(unittest.TestCase):
+    def test_uses_running_loop(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        output = subprocess.check_output([sys.executable, '-c', _INSTALL_IN_RUNNING_LOOP], env=env)
+        self.assertEqual(output.strip(), b'ok')
+
+
+class AsyncClientTest(unittest.TestCase):
+    '''AsyncDeepstreamClient against the in-process server; run with trial --reactor=asyncio.'''
+    timeout = 10
+
+    if not hasattr(reactor, '_asyncioEventloop'):
+        skip = "needs the asyncio reactor (trial --reactor=asyncio)"
+
+    def setUp(self):
+        self.server, self.port = server.listen(reactor=reactor)
+        self.url = 'ws://127.0.0.1:%d/deepstream' % self.port.getHost().port
+        self.clients = []
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        for client in self.clients:
+            yield client.client.disconnect()
+        yield self.port.stopListening()
+
+    def run_async(self, coroutine):
+        return defer.Deferred.fromFuture(asyncio.ensure_future(coroutine))
+
+    async def login(self, username):
+        client = aio.AsyncDeepstreamClient(self.url, reactor=reactor)
+        client.on('error', lambda *args: None)
+        self.clients.append(client)
+        result = await client.login({'username': username})
+        self.assertTrue(result['success'])
+        return client
+
+    async def wait_until(self, predicate):
+        while not predicate():
+            await asyncio.sleep(0.01)
+
+    def test_rpc(self):
+        async def scenario():
+            alice = await self.login('alice')
+            bob = await self.login('bob')
+
+            async def add(data):
+                await asyncio.sleep(0)
+                return data['a'] + data['b']
+            async def fail(data):
+                raise ValueError('no')
+            bob.rpc.provide('add', add)
+            bob.rpc.provide('fail', fail)
+            await self.wait_until(lambda: self.server.providers.get('fail'))
+            self.assertEqual(await alice.rpc.make('add', {'a': 2, 'b': 3}), 5)
+            with self.assertRaises(Exception):
+                await alice.rpc.make('fail', None)
+        return self.run_async(scenario())
+
+    def test_events(self):
+        async def scenario():
+            alice = await self.login('alice')
+            bob = await self.login('bob')
+            received = []
+            async with await bob.event.subscribe('news') as news:
+                alice.event.emit('news', 'one')
+                alice.event.emit('news', 'two')
+                async for data in news:
+                    received.append(data)
+                    if len(received) == 2:
+                        break
+            self.assertEqual(received, ['one', 'two'])
+            self.assertTrue(news.closed)
+            await self.wait_until(lambda: not bob.client._timer_wheel)
+        return self.run_async(scenario())
+
+    def test_presence_query(self):
+        async def scenario():
+            alice = await self.login('alice')
+            await self.login('bob')
+            self.assertEqual(await alice.presence.get_all(), ['bob'])
+            self.assertEqual(await alice.presence.get(['carol']), [])
+        return self.run_async(scenario())
+
+    def test_records(self):
+        async def scenario():
+            alice = await self.login('alice')
+            bob = await self.login('bob')
+            record = await alice.record.get_record('profile')
+            async with await bob.record.subscribe('profile', 'city') as cities:
+                record.set('Lisbon', 'city')
+                self.assertEqual(await cities.__anext__(), 'Lisbon')
+            self.assertEqual(await bob.record.snapshot('profile'), {'city': 'Lisbon'})
+        return self.run_async(scenario())
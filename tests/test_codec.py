@@ -0,0 +1,77 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from deepstreampy_twisted import codec
+from deepstreampy.message import message_builder, message_parser
+from deepstreampy import record
+from twisted.internet import task
+from twisted.trial import unittest
+import json
+
+URL = "ws://localhost:7777/deepstream"
+
+PAYLOADS = [
+    {'id': 17, 'price': 101.25, 'tags': ['a/b', 'c'], 'ok': True, 'none': None},
+    {'name': '\u00e9t\u00e9', 'nested': {'z': [1, 2.5, {'k': 'v'}], 'a': -3}},
+    {'big': 2 ** 70, 'small': -2 ** 70},
+    [0.1, 1e-07, 1e+300, 'text', ''],
+    'plain string',
+]
+
+
+class CodecTest(unittest.TestCase):
+    def tearDown(self):
+        codec.install('json')
+
+    def check_codec(self, name):
+        try:
+            impl = codec.get_codec(name)
+        except ImportError:
+            raise unittest.SkipTest("%s is not installed" % name)
+        for payload in PAYLOADS:
+            for sort_keys in (True, False):
+                encoded = impl.dumps(payload, separators=(',', ':'), sort_keys=sort_keys)
+                self.assertEqual(json.loads(encoded), payload)
+                self.assertEqual(impl.loads(encoded), payload)
+            expected = json.dumps(payload, separators=(',', ':'), sort_keys=True)
+            self.assertEqual(impl.loads(expected), json.loads(expected))
+        self.assertEqual(impl.dumps({2: 'x', 1: 'y'}, separators=(',', ':'), sort_keys=True),
+                         '{"1":"y","2":"x"}')
+        self.assertEqual(impl.dumps({'a': 1}), json.dumps({'a': 1}))
+        self.assertRaises(ValueError, impl.loads, '{"a":')
+
+    def test_orjson(self):
+        self.check_codec('orjson')
+
+    def test_ujson(self):
+        self.check_codec('ujson')
+
+    def test_stdlib(self):
+        self.assertIs(codec.get_codec('json'), json)
+        self.check_codec('json')
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, codec.get_codec, 'yaml')
+
+    def test_install_patches_upstream(self):
+        impl = codec.install('auto')
+        self.assertIs(message_parser.json, impl)
+        self.assertIs(message_builder.json, impl)
+        self.assertIs(record.json, impl)
+        self.assertIs(codec.installed(), impl)
+        payload = {'b': [1, 2], 'a': 'x'}
+        self.assertEqual(message_parser.convert_typed(message_builder.typed(payload), None), payload)
+        codec.install('json')
+        self.assertIs(message_builder.json, json)
+        self.assertIs(codec.installed(), json)
+
+    def test_client_option(self):
+        reactor = task.Clock()
+        self.assertIs(message_builder.json, json)
+        DeepstreamClient(URL, reactor=reactor, factory=DeepstreamFactory, json_codec='auto')
+        self.assertIs(message_builder.json, codec.installed())
+        DeepstreamClient(URL, reactor=reactor, factory=DeepstreamFactory)
+        self.assertIs(message_builder.json, codec.installed())
+        for call in reactor.getDelayedCalls():
+            call.cancel()
@@ -0,0 +1,130 @@
+from __future__ import absolute_import, division, print_function, with_statement
+
+from deepstreampy_twisted import protocol
+from deepstreampy_twisted.delivery import DeliveryClosed, ProcessPoolDelivery, ThreadPoolDelivery
+from twisted.internet import defer, reactor, task
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+import sys
+import threading
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+
+def square(value):
+    return value * value
+
+
+def fail(value):
+    raise ValueError(value)
+
+
+class ProcessPoolDeliveryTests(unittest.TestCase):
+    def setUp(self):
+        self.transport = proto_helpers.StringTransport()
+        self.clock = task.Clock()
+        self.client = mock.Mock()
+        self.client._factory = protocol.DeepstreamFactory(
+            'ws://localhost:7777/deepstream', client=self.client, reactor=self.clock,
+            heartbeat_tolerance=1)
+        self.proto = self.client._factory.buildProtocol(('localhost', 0))
+        self.proto.makeConnection(self.transport)
+        self.client._factory._protocol_instance = self.proto
+        self.delivery = ProcessPoolDelivery(self.client, processes=1, max_in_flight=2, reactor=reactor)
+
+    def tearDown(self):
+        self.delivery.close()
+
+    @defer.inlineCallbacks
+    def test_result(self):
+        result = yield self.delivery.submit(square, 3)
+        self.assertEqual(result, 9)
+
+    def test_error(self):
+        return self.assertFailure(self.delivery.submit(fail, 'bad'), ValueError)
+
+    @defer.inlineCallbacks
+    def test_wrap(self):
+        deliver = self.delivery.wrap(square)
+        result = yield deliver(4)
+        self.assertEqual(result, 16)
+
+    @defer.inlineCallbacks
+    def test_window_pauses_connection(self):
+        deferreds = [self.delivery.submit(square, i) for i in range(5)]
+        self.assertEqual(self.delivery.in_flight, 2)
+        self.assertEqual(self.delivery.pending, 3)
+        self.assertEqual(self.transport.producerState, 'paused')
+        results = yield defer.gatherResults(deferreds)
+        self.assertEqual(results, [0, 1, 4, 9, 16])
+        self.assertEqual(self.delivery.in_flight, 0)
+        self.assertEqual(self.transport.producerState, 'producing')
+
+    def test_heartbeat_suspended_while_paused(self):
+        factory = self.client._factory
+        factory._heartbeat_last = factory._now() - 5
+        self.proto.pauseReading()
+        self.proto._heartbeat()
+        self.assertFalse(self.transport.disconnecting)
+        self.proto.resumeReading()
+        self.proto._heartbeat()
+        self.assertFalse(self.transport.disconnecting)
+        factory._heartbeat_last -= 5
+        self.proto._heartbeat()
+        self.assertTrue(self.transport.disconnecting)
+
+    def test_close_fails_unfinished_calls(self):
+        deferreds = [self.delivery.submit(square, i) for i in range(3)]
+        self.delivery.close()
+        for d in deferreds:
+            self.failureResultOf(d, DeliveryClosed)
+        self.assertEqual(self.transport.producerState, 'producing')
+        self.assertRaises(DeliveryClosed, self.delivery.submit, square, 1)
+
+
+class ThreadPoolDeliveryTests(unittest.TestCase):
+    def setUp(self):
+        self.delivery = ThreadPoolDelivery(reactor=reactor)
+
+    @defer.inlineCallbacks
+    def test_lane_is_serial(self):
+        release = threading.Event()
+        calls = []
+        def blocking(value):
+            release.wait(5)
+            calls.append(value)
+        def record(value):
+            calls.append(value)
+        first = self.delivery.submit('a', blocking, 1)
+        second = self.delivery.submit('a', record, 2)
+        self.assertEqual(self.delivery.lane_depth('a'), 2)
+        other = yield self.delivery.submit('b', lambda: 'other')
+        # Lane 'b' is not held up by the blocked call on lane 'a'.
+        self.assertEqual(other, 'other')
+        self.assertEqual(calls, [])
+        release.set()
+        yield defer.gatherResults([first, second])
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(self.delivery.lane_depths(), {})
+
+    @defer.inlineCallbacks
+    def test_error_does_not_stall_lane(self):
+        failed = self.delivery.submit('a', fail, 'bad')
+        after = self.delivery.submit('a', square, 5)
+        yield self.assertFailure(failed, ValueError)
+        result = yield after
+        self.assertEqual(result, 25)
+
+    @defer.inlineCallbacks
+    def test_wrap_and_stats(self):
+        release = threading.Event()
+        deliver = self.delivery.wrap(lambda value: release.wait(5) and value, 'name')
+        deferreds = [deliver(i) for i in range(3)]
+        self.assertEqual(self.delivery.stats(), {'lanes': 1, 'queued': 3, 'max_depth': 3})
+        release.set()
+        results = yield defer.gatherResults(deferreds)
+        self.assertEqual(results, [0, 1, 2])
+        self.assertEqual(self.delivery.stats(), {'lanes': 0, 'queued': 0, 'max_depth': 0})
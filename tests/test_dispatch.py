@@ -0,0 +1,47 @@
+from __future__ import absolute_import, division, print_function, with_statement
+
+from deepstreampy_twisted.dispatch import Dispatcher
+from twisted.trial import unittest
+import sys
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+
+class DispatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.default = mock.Mock()
+        self.dispatcher = Dispatcher(self.default)
+
+    def test_topic_handler(self):
+        handler = mock.Mock()
+        self.dispatcher.register('E', handler)
+        message = {'topic': 'E', 'action': 'S', 'data': ['a']}
+        self.dispatcher.dispatch(message)
+        handler.assert_called_once_with(message)
+        self.default.assert_not_called()
+
+    def test_action_handler_takes_precedence(self):
+        topic_handler = mock.Mock()
+        fast_path = mock.Mock()
+        self.dispatcher.register('E', topic_handler)
+        self.dispatcher.register('E', fast_path, 'EVT')
+        message = {'topic': 'E', 'action': 'EVT', 'data': ['a', 'N1']}
+        self.dispatcher.dispatch(message)
+        fast_path.assert_called_once_with(message)
+        topic_handler.assert_not_called()
+
+        self.dispatcher.unregister('E', 'EVT')
+        self.dispatcher.dispatch(message)
+        topic_handler.assert_called_once_with(message)
+
+    def test_unknown_topic_goes_to_default(self):
+        message = {'topic': 'Z', 'action': 'A', 'data': []}
+        self.dispatcher.dispatch(message)
+        self.default.assert_called_once_with(message)
+        self.assertEqual(self.dispatcher.lookup('Z', 'A'), self.default)
+
+    def test_register_requires_callable(self):
+        self.assertRaises(TypeError, self.dispatcher.register, 'E', None)
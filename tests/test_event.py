@@ -87,6 +87,51 @@ class EventsTest(unittest.TestCase):
                                                'UNSOLICITED_MESSAGE',
                                                'E')
 
+    def test_event_fast_path(self):
+        self.client.event.subscribe('myEvent', self.event_callback)
+        self.proto.onMessage(msg('E|EVT|myEvent|N23+E|EVT|myEvent|SHi+'), False)
+        self.assertEqual(self.event_callback.call_args_list, [mock.call(23), mock.call('Hi')])
+
+    def test_subscribe_ack_deferred(self):
+        self.client.on('error', self.error_callback)
+        acks = []
+        self.client.event.subscribe('myEvent', self.event_callback).addCallback(acks.append)
+        self.client.event.subscribe('myEvent', mock.Mock()).addCallback(acks.append)
+        self.assertEqual(acks, [True])
+        self.client.event.handle({'topic': 'E', 'action': 'A', 'data': ['S', 'myEvent']})
+        self.assertEqual(acks, [True, True])
+
+        self.client.event.subscribe('otherEvent', self.event_callback).addCallback(acks.append)
+        self.reactor.advance(20)
+        self.assertEqual(acks, [True, True, False])
+
+    def test_subscribe_denied(self):
+        self.client.on('error', self.error_callback)
+        acks = []
+        self.client.event.subscribe('secret', self.event_callback).addCallback(acks.append)
+        self.proto.onMessage(msg('E|E|MESSAGE_DENIED|secret|S+'), False)
+        self.assertEqual(acks, [False])
+        self.assertEqual(self.reactor.getDelayedCalls(), [])
+        self.error_callback.assert_called_once_with('secret', 'MESSAGE_DENIED', 'E')
+
+    def test_resubscribe_waits_for_ack(self):
+        acks = []
+        self.client.event.subscribe('myEvent', self.event_callback).addCallback(acks.append)
+        self.client.event.unsubscribe('myEvent', self.event_callback)
+        self.client.event.subscribe('myEvent', self.event_callback).addCallback(acks.append)
+        self.assertEqual(acks, [])
+        self.proto.onMessage(msg('E|A|S|myEvent+'), False)
+        self.assertEqual(acks, [True, True])
+
+    def test_publisher(self):
+        self.client.event.subscribe('myEvent', self.event_callback)
+        publish = self.client.event.publisher('myEvent')
+        publish.emit(6)
+        self.handler.assert_called_with(msg('E|EVT|myEvent|N6+'))
+        publish({'a': 'b'})
+        self.handler.assert_called_with(msg('E|EVT|myEvent|O{"a":"b"}+'))
+        self.assertEqual(self.event_callback.call_args_list, [mock.call(6), mock.call({'a': 'b'})])
+
     def test_accept(self):
         def listen_callback(data, is_subscribed, response):
             response.accept()
@@ -0,0 +1,39 @@
+from __future__ import absolute_import, division, print_function, with_statement
+
+from deepstreampy_twisted.framing import MessageFramer
+from twisted.trial import unittest
+
+
+class MessageFramerTests(unittest.TestCase):
+    def setUp(self):
+        self.framer = MessageFramer()
+
+    def test_complete_message(self):
+        self.assertEqual(self.framer.feed(b'C\x1fA\x1e'), b'C\x1fA\x1e')
+        self.assertEqual(len(self.framer), 0)
+
+    def test_partial_message_is_held(self):
+        self.assertEqual(self.framer.feed(b'E\x1fEVT\x1fname'), None)
+        self.assertEqual(self.framer.feed(b'\x1fSdata'), None)
+        self.assertEqual(self.framer.feed(b'\x1e'), b'E\x1fEVT\x1fname\x1fSdata\x1e')
+        self.assertEqual(len(self.framer), 0)
+
+    def test_trailing_partial_is_kept(self):
+        self.assertEqual(self.framer.feed(b'C\x1fPI\x1eE\x1fS'), b'C\x1fPI\x1e')
+        self.assertEqual(len(self.framer), 3)
+        self.assertEqual(self.framer.feed(b'\x1fname\x1eC\x1fPI\x1e'),
+                         b'E\x1fS\x1fname\x1eC\x1fPI\x1e')
+
+    def test_large_message_across_frames(self):
+        body = b'R\x1fU\x1fbig\x1f1\x1fO' + b'x' * 100000 + b'\x1e'
+        result = None
+        for i in range(0, len(body), 1000):
+            chunk = self.framer.feed(body[i:i + 1000])
+            if chunk is not None:
+                result = chunk
+        self.assertEqual(result, body)
+
+    def test_clear(self):
+        self.framer.feed(b'C\x1fP')
+        self.framer.clear()
+        self.assertEqual(self.framer.feed(b'C\x1fA\x1e'), b'C\x1fA\x1e')
@@ -0,0 +1,54 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+import argparse
+import json
+
+from deepstreampy_twisted import loadgen
+from twisted.internet import defer
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+
+
+class LoadgenTest(unittest.TestCase):
+
+    def test_parse_mix(self):
+        self.assertEqual(loadgen.parse_mix('emit=70, rpc=20,record'),
+                         [('emit', 70.0), ('rpc', 20.0), ('record', 1.0)])
+        self.assertRaises(argparse.ArgumentTypeError, loadgen.parse_mix, 'emit=1,publish=2')
+
+    def test_timed(self):
+        stats = loadgen.Stats()
+        stats.timed('subscribe', defer.succeed(True))
+        stats.timed('subscribe', defer.succeed(False))
+        stats.timed('rpc', defer.fail(Exception('NO_RPC_PROVIDER')))
+        self.assertEqual(stats.counts, {'subscribe': 1})
+        self.assertEqual(stats.errors, {'subscribe': 1, 'rpc': 1})
+
+    def test_merge(self):
+        first, second = loadgen.Stats(), loadgen.Stats()
+        first.observe('rpc', 0.001)
+        first.count('emit', 5)
+        second.observe('rpc', 0.003)
+        second.error('rpc')
+        merged = loadgen.Stats()
+        for stats in (first, second):
+            merged.merge(json.loads(json.dumps(stats.to_dict())))
+        self.assertEqual(merged.counts, {'rpc': 2, 'emit': 5})
+        self.assertEqual(merged.errors, {'rpc': 1})
+        self.assertEqual(merged.latencies['rpc'].count, 2)
+        self.assertAlmostEqual(merged.latencies['rpc'].stats()['max'], 0.003)
+
+    def test_connect_timeout(self):
+        reactor = proto_helpers.MemoryReactorClock()
+        options = argparse.Namespace(url='ws://127.0.0.1:1/deepstream', payload_bytes=8,
+                                     mix=loadgen.parse_mix('emit'))
+        stats = loadgen.Stats()
+        client = loadgen.LoadClient(0, options, stats, reactor)
+        d = client.start(timeout=5)
+        reactor.advance(4)
+        self.assertNoResult(d)
+        reactor.advance(1)
+        self.failureResultOf(d, loadgen.ConnectTimeout)
+        self.assertEqual(stats.errors, {'connect': 1})
+        client.stop()
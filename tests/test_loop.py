@@ -0,0 +1,45 @@
+from __future__ import absolute_import, division, print_function, with_statement
+
+import datetime
+
+from deepstreampy_twisted.loop import ReactorLoop
+from twisted.internet import task
+from twisted.trial import unittest
+
+
+class ReactorLoopTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.loop = ReactorLoop(self.clock)
+        self.calls = []
+
+    def test_call_later(self):
+        self.loop.call_later(2, self.calls.append, 'a')
+        self.clock.advance(1)
+        self.assertEqual(self.calls, [])
+        self.clock.advance(1)
+        self.assertEqual(self.calls, ['a'])
+
+    def test_remove_timeout(self):
+        timeout = self.loop.call_later(2, self.calls.append, 'a')
+        self.loop.remove_timeout(timeout)
+        self.clock.advance(3)
+        self.assertEqual(self.calls, [])
+        # Removing an expired or missing timeout is harmless, as with Tornado.
+        self.loop.remove_timeout(timeout)
+        self.loop.remove_timeout(None)
+
+    def test_add_timeout(self):
+        self.clock.advance(10)
+        self.loop.add_timeout(self.loop.time() + 1, self.calls.append, 'deadline')
+        self.loop.add_timeout(datetime.timedelta(seconds=2), self.calls.append, 'delta')
+        self.clock.advance(1)
+        self.assertEqual(self.calls, ['deadline'])
+        self.clock.advance(1)
+        self.assertEqual(self.calls, ['deadline', 'delta'])
+
+    def test_add_callback(self):
+        self.loop.add_callback(self.calls.append, 'soon')
+        self.assertEqual(self.calls, [])
+        self.clock.advance(0)
+        self.assertEqual(self.calls, ['soon'])
@@ -0,0 +1,143 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from deepstreampy_twisted.metrics import Histogram, Metrics, StatsDExporter, prometheus_text
+from deepstreampy.constants import connection_state
+from twisted.internet import task
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+
+URL = "ws://localhost:7777/deepstream"
+
+
+class HistogramTests(unittest.TestCase):
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.last)
+        self.assertEqual(histogram.stats()['count'], 0)
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        for value in range(1, 101):
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(0), 1)
+        self.assertEqual(histogram.percentile(50), 51)
+        self.assertEqual(histogram.percentile(100), 100)
+        stats = histogram.stats()
+        self.assertEqual(stats['p99'], 99)
+        self.assertEqual(stats['mean'], 50.5)
+        self.assertEqual(stats['last'], 100)
+
+    def test_window_rolls(self):
+        histogram = Histogram(window=3)
+        for value in (10, 1, 2, 3):
+            histogram.add(value)
+        self.assertEqual(len(histogram), 3)
+        self.assertEqual(histogram.stats()['max'], 3)
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.total, 16)
+
+
+class MetricsTests(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_counters_and_labels(self):
+        self.metrics.incr('messages_total', topic='E')
+        self.metrics.incr('messages_total', 2, topic='E')
+        self.metrics.incr('messages_total', topic='R')
+        self.assertEqual(self.metrics.counter('messages_total', topic='E'), 3)
+        self.assertEqual(self.metrics.counter('messages_total', topic='P'), 0)
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'messages_total{topic="E"}': 3,
+                                                'messages_total{topic="R"}': 1})
+
+    def test_gauges_are_read_on_demand(self):
+        depth = [0]
+        self.metrics.gauge('depth', lambda: depth[0])
+        depth[0] = 5
+        self.assertEqual(self.metrics.snapshot()['gauges'], {'depth': 5})
+
+    def test_prometheus_text(self):
+        self.metrics.incr('sent_total', 4, topic='E')
+        self.metrics.gauge('depth', lambda: 2)
+        self.metrics.observe('parse_seconds', 0.5)
+        text = prometheus_text(self.metrics)
+        self.assertEqual(text.splitlines(), [
+            '# TYPE deepstream_sent_total counter',
+            'deepstream_sent_total{topic="E"} 4.0',
+            '# TYPE deepstream_depth gauge',
+            'deepstream_depth 2.0',
+            '# TYPE deepstream_parse_seconds summary',
+            'deepstream_parse_seconds{quantile="0.5"} 0.5',
+            'deepstream_parse_seconds{quantile="0.9"} 0.5',
+            'deepstream_parse_seconds{quantile="0.99"} 0.5',
+            'deepstream_parse_seconds_sum 0.5',
+            'deepstream_parse_seconds_count 1',
+        ])
+
+    def test_statsd_sends_deltas(self):
+        exporter = StatsDExporter(self.metrics, reactor=task.Clock())
+        transport = proto_helpers.FakeDatagramTransport()
+        exporter.makeConnection(transport)
+        self.metrics.incr('sent_total', 3, topic='E')
+        self.metrics.observe('parse_seconds', 0.002)
+        exporter.flush()
+        self.assertEqual(sorted(transport.written[0][0].split(b'\n')),
+                         [b'deepstream.parse_seconds:2.000|ms', b'deepstream.sent_total.E:3|c'])
+        self.assertEqual(transport.written[0][1], ('127.0.0.1', 8125))
+        self.metrics.incr('sent_total', topic='E')
+        exporter.flush()
+        self.assertEqual(transport.written[1][0], b'deepstream.sent_total.E:1|c')
+
+
+class ClientMetricsTests(unittest.TestCase):
+    def setUp(self):
+        self.reactor = task.Clock()
+        self.client = DeepstreamClient(URL, reactor=self.reactor, factory=DeepstreamFactory, metrics=True,
+                                       rpcAckTimeout=0.1)
+        self.client.on('error', lambda *args: None)
+        self.proto = self.client._factory.buildProtocol(('localhost', 0))
+        self.client._factory._protocol_instance = self.proto
+        self.tr = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.tr)
+        self.client._factory._set_state(connection_state.OPEN)
+
+    def tearDown(self):
+        for call in self.reactor.getDelayedCalls():
+            call.cancel()
+
+    def test_disabled_by_default(self):
+        client = DeepstreamClient(URL, reactor=self.reactor, factory=DeepstreamFactory)
+        self.assertIsNone(client.metrics)
+
+    def test_messages_in_and_out(self):
+        metrics = self.client.metrics
+        self.client.event.emit('news', 'hi')
+        self.assertEqual(metrics.counter('messages_sent_total', topic='E'), 1)
+        self.assertEqual(metrics.counter('bytes_sent_total', topic='E'), len('E|EVT|news|Shi+'))
+        self.proto._dispatch_measured('E\x1fEVT\x1fnews\x1fShi\x1eC\x1fPI\x1e', metrics)
+        self.assertEqual(metrics.counter('messages_received_total', topic='E'), 1)
+        self.assertEqual(metrics.counter('messages_received_total', topic='C'), 1)
+        self.assertEqual(metrics.histogram('parse_seconds').count, 1)
+        self.assertEqual(metrics.histogram('dispatch_seconds', topic='E').count, 1)
+
+    def test_queue_and_reconnects(self):
+        factory = self.client._factory
+        factory._set_state(connection_state.RECONNECTING)
+        self.client.event.emit('news', 'hi')
+        snapshot = self.client.metrics.snapshot()
+        self.assertEqual(snapshot['gauges']['queue_depth'], 1)
+        self.assertEqual(snapshot['gauges']['queue_bytes'], len('E|EVT|news|Shi+'))
+        factory._set_state(connection_state.OPEN)
+        self.assertEqual(self.client.metrics.counter('reconnects_total'), 1)
+
+    def test_ack_timeouts(self):
+        self.client.rpc.make('slow', 1, lambda error, result: None)
+        self.reactor.advance(1)
+        self.assertEqual(self.client.metrics.counter('errors_total', topic='P', event='ACK_TIMEOUT'), 1)
+        self.client.event.subscribe('news', lambda data: None)
+        self.reactor.advance(20)
+        self.assertEqual(self.client.metrics.counter('errors_total', topic='E', event='ACK_TIMEOUT'), 1)
@@ -0,0 +1,72 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.constants import connection_state
+
+from deepstreampy_twisted import DeepstreamClientPool, DeepstreamFactory
+from deepstreampy_twisted.pool import HashRing
+from twisted.internet import task
+from twisted.test import proto_helpers
+from tests.utils import msg
+from twisted.trial import unittest
+import sys
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+URL = "ws://localhost:7777/deepstream"
+
+
+class HashRingTests(unittest.TestCase):
+    def test_stable_assignment(self):
+        ring = HashRing(range(4))
+        names = ['event/%d' % i for i in range(200)]
+        first = [ring.get(name) for name in names]
+        self.assertEqual(first, [HashRing(range(4)).get(name) for name in names])
+        self.assertEqual(set(first), set(range(4)))
+
+    def test_growing_ring_moves_few_names(self):
+        names = ['record/%d' % i for i in range(1000)]
+        small, large = HashRing(range(4)), HashRing(range(5))
+        moved = sum(1 for name in names if small.get(name) != large.get(name))
+        self.assertTrue(moved < 400, moved)
+
+
+class PoolTests(unittest.TestCase):
+    def setUp(self):
+        self.reactor = task.Clock()
+        self.pool = DeepstreamClientPool(URL, size=3, reactor=self.reactor, factory=DeepstreamFactory)
+        self.senders = []
+        for client in self.pool.clients:
+            proto = client._factory.buildProtocol(('localhost', 0))
+            client._factory._protocol_instance = proto
+            tr = proto_helpers.StringTransport()
+            proto.makeConnection(tr)
+            proto.sendMessage = mock.Mock()
+            client._factory._set_state(connection_state.OPEN)
+            self.senders.append(proto.sendMessage)
+
+    def tearDown(self):
+        for call in self.reactor.getDelayedCalls():
+            call.cancel()
+
+    def _sender_for(self, name):
+        return self.senders[self.pool.clients.index(self.pool.client_for(name))]
+
+    def test_subscribe_and_emit_share_a_connection(self):
+        for i in range(10):
+            name = 'event/%d' % i
+            self.pool.event.subscribe(name, mock.Mock())
+            self._sender_for(name).assert_called_with(msg('E|S|%s+' % name))
+            self.pool.event.emit(name, 1)
+            self._sender_for(name).assert_called_with(msg('E|EVT|%s|N1+' % name))
+
+    def test_provide_routed_by_name(self):
+        self.pool.rpc.provide('addTwo', mock.Mock())
+        self._sender_for('addTwo').assert_called_once_with(msg('P|S|addTwo+'))
+        self.assertEqual(sum(sender.call_count for sender in self.senders), 1)
+
+    def test_invalid_size(self):
+        self.assertRaises(ValueError, DeepstreamClientPool, URL, size=0)
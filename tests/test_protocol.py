@@ -1,10 +1,12 @@
 from deepstreampy_twisted import protocol
+from deepstreampy_twisted.send_queue import MessageDropped
 from deepstreampy import constants
 from twisted.trial import unittest
 
 from twisted.test import proto_helpers
 import sys
 from twisted.internet import task
+from tests.utils import msg
 
 
 if sys.version_info[0] < 3:
@@ -43,16 +45,13 @@ class ProtocolTests(unittest.TestCase):
         self.clock.advance(1)
 
     def _decode(self, message):
-        message.replace(chr(31), '|').replace(chr(30), '+')
-        if not isinstance(message,unicode) and isinstance(message, str):
+        if isinstance(message, bytes):
             message = message.decode('utf-8')
-        message = message.replace(chr(31), '|').replace(chr(30), '+')
-        # message.replace(chr(31), '|').replace(chr(30), '+')
-        return message
+        return message.replace(chr(31), '|').replace(chr(30), '+')
     def _encode(self, message):
-        if isinstance(message,unicode):
+        if not isinstance(message, bytes):
             message = message.encode('utf-8')
-        return message.replace('|', chr(31)).replace('+', chr(30))
+        return message.replace(b'|', b'\x1f').replace(b'+', b'\x1e')
     def _test(self, dataReceived, expected):
         self._server_emit(dataReceived)
         sent = self._decode(self.tr.value())
@@ -102,6 +101,14 @@ class ProtocolTests(unittest.TestCase):
         self.assertEqual(self.factory._state, constants.connection_state.OPEN)
         self.clock.advance(1)
 
+    def test_login_resolves_from_dispatch(self):
+        self.proto.makeConnection(self.tr)
+        self.factory._set_state(constants.connection_state.AWAITING_AUTHENTICATION)
+        results = []
+        self.factory.authenticate({}).addCallback(results.append)
+        self._server_emit('A|A+')
+        self.assertEqual(results, [{'message': None, 'success': True, 'error': None}])
+        self.assertIsNone(self.factory._auth_deferred)
     def test_too_many_auths(self):
         self.proto.makeConnection(self.tr)
         self.factory._state = constants.connection_state.CHALLENGING
@@ -117,6 +124,18 @@ class ProtocolTests(unittest.TestCase):
 
         self._server_emit('A|E|%s+' % constants.event.TOO_MANY_AUTH_ATTEMPTS)
         self.assertTrue(self.factory._too_many_auth_attempts)
+    def test_reconnect_drops_partial_message(self):
+        self.proto.makeConnection(self.tr)
+        self.proto.onOpen()
+        self._server_emit('E|EVT|cut-')
+        self.proto.onClose(False, 1006, 'lost')
+
+        self.proto = self.factory.buildProtocol(('localhost', 0))
+        self.tr = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.tr)
+        self.proto.onOpen()
+        self._test('C|CH+', 'C|CHR|%s+' % ProtocolTests.url)
+        self.assertEqual(len(self.factory._framer), 0)
     # def test_redirect(self):
     #     raise NotImplementedError
     #     # Still need to write this test.
@@ -126,3 +145,179 @@ class ProtocolTests(unittest.TestCase):
 
 
 
+
+class CoalescingTests(unittest.TestCase):
+    url = 'ws://localhost:0/deepstream'
+    def setUp(self):
+        self.client = mock.Mock()
+        self.clock = task.Clock()
+        self.factory = protocol.DeepstreamFactory(
+            CoalescingTests.url,
+            client=self.client,
+            reactor=self.clock,
+            coalesce_writes=True,
+            coalesce_max_bytes=64)
+        self.proto = self.factory.buildProtocol(('localhost', 0))
+        self.factory._protocol_instance = self.proto
+        self.tr = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.tr)
+        self.proto.sendMessage = mock.Mock()
+
+    def tearDown(self):
+        for call in self.clock.getDelayedCalls():
+            call.cancel()
+
+    def test_sends_in_one_tick_share_a_frame(self):
+        for i in range(3):
+            self.proto.send(msg('E|EVT|a|N%d+' % i))
+        self.proto.sendMessage.assert_not_called()
+        self.clock.advance(0)
+        self.proto.sendMessage.assert_called_once_with(
+            msg('E|EVT|a|N0+') + msg('E|EVT|a|N1+') + msg('E|EVT|a|N2+'))
+
+    def test_lone_message_flushed_next_tick(self):
+        self.proto.send(msg('C|PO+'))
+        self.clock.advance(0)
+        self.proto.sendMessage.assert_called_once_with(msg('C|PO+'))
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_max_bytes_flushes_immediately(self):
+        big = msg('E|EVT|a|S' + 'x' * 64 + '+')
+        self.proto.send(big)
+        self.proto.sendMessage.assert_called_once_with(big)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def _replay_backlog(self):
+        deferreds = [self.factory.send(msg('E|EVT|a|N%d+' % i)) for i in range(2)]
+        self.factory._set_state(constants.connection_state.OPEN)
+        self.factory._send_queued_messages()
+        return deferreds
+
+    def test_queued_messages_fire_once_written(self):
+        deferreds = self._replay_backlog()
+        self.proto.sendMessage.assert_not_called()
+        self.assertNoResult(deferreds[0])
+        self.clock.advance(0)
+        self.proto.sendMessage.assert_called_once_with(msg('E|EVT|a|N0+') + msg('E|EVT|a|N1+'))
+        for d in deferreds:
+            self.assertEqual(self.successResultOf(d), None)
+
+    def test_close_fails_buffered_messages(self):
+        deferreds = self._replay_backlog()
+        self.proto.onClose(False, 1006, 'lost')
+        for d in deferreds:
+            self.failureResultOf(d, MessageDropped)
+        self.clock.advance(0)
+        self.proto.sendMessage.assert_not_called()
+
+class QueueFlushTests(unittest.TestCase):
+    url = 'ws://localhost:0/deepstream'
+    def setUp(self):
+        self.client = mock.Mock()
+        self.clock = task.Clock()
+        self.factory = protocol.DeepstreamFactory(
+            QueueFlushTests.url,
+            client=self.client,
+            reactor=self.clock,
+            queue_flush_chunk_bytes=30,
+            queue_flush_budget=0)
+        self.proto = self.factory.buildProtocol(('localhost', 0))
+        self.tr = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.tr)
+        self.proto.sendMessage = mock.Mock()
+
+    def tearDown(self):
+        for call in self.clock.getDelayedCalls():
+            call.cancel()
+
+    def _open(self):
+        self.factory._protocol_instance = self.proto
+        self.factory._set_state(constants.connection_state.OPEN)
+
+    def test_backlog_sent_in_chunks_across_iterations(self):
+        deferreds = [self.factory.send(msg('E|EVT|a|N%d+' % i)) for i in range(9)]
+        self._open()
+        self.factory._send_queued_messages()
+        self.proto.sendMessage.assert_called_once_with(
+            msg('E|EVT|a|N0+') + msg('E|EVT|a|N1+') + msg('E|EVT|a|N2+'))
+        self.assertNoResult(deferreds[3])
+        self.clock.advance(0)
+        self.clock.advance(0)
+        self.assertEqual(self.proto.sendMessage.call_count, 3)
+        for d in deferreds:
+            self.assertEqual(self.successResultOf(d), None)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_budget_uses_factory_clock(self):
+        self.factory._queue_flush_budget = 1
+        self.factory._now = self.clock.seconds
+        deferreds = [self.factory.send(msg('E|EVT|a|N%d+' % i)) for i in range(9)]
+        self._open()
+        self.factory._send_queued_messages()
+        self.assertEqual(self.proto.sendMessage.call_count, 3)
+        for d in deferreds:
+            self.assertEqual(self.successResultOf(d), None)
+
+    def test_new_messages_wait_behind_backlog(self):
+        for i in range(6):
+            self.factory.send(msg('E|EVT|a|N%d+' % i))
+        self._open()
+        self.factory._send_queued_messages()
+        self.factory.send(msg('E|EVT|a|N6+'))
+        self.clock.advance(0)
+        self.clock.advance(0)
+        sent = b''.join(call[0][0] for call in self.proto.sendMessage.call_args_list)
+        self.assertEqual(sent, b''.join(msg('E|EVT|a|N%d+' % i) for i in range(7)))
+
+class HeartbeatTests(unittest.TestCase):
+    url = 'ws://localhost:0/deepstream'
+    def setUp(self):
+        self.client = mock.Mock()
+        self.clock = task.Clock()
+        self.factory = protocol.DeepstreamFactory(
+            HeartbeatTests.url,
+            client=self.client,
+            reactor=self.clock,
+            heartbeat_tolerance=3,
+            rtt_probe_interval=2)
+        self.factory._now = self.clock.seconds
+        self.proto = self.factory.buildProtocol(('localhost', 0))
+        self.tr = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.tr)
+        self.proto.onOpen()
+
+    def tearDown(self):
+        for call in self.clock.getDelayedCalls():
+            call.cancel()
+
+    def test_drops_silent_connection(self):
+        self.assertEqual(self.factory._heartbeat_check_interval, 0.75)
+        self.clock.advance(2.25)
+        self.assertFalse(self.tr.disconnecting)
+        self.clock.advance(0.75)
+        self.assertTrue(self.tr.disconnecting)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_any_message_keeps_connection_alive(self):
+        self.clock.advance(1.5)
+        self.proto.onMessage(msg('C|PI+'), False)
+        self.assertIn(msg('C|PO+'), self.tr.value())
+        self.clock.advance(2.25)
+        self.assertFalse(self.tr.disconnecting)
+        self.clock.advance(0.75)
+        self.assertTrue(self.tr.disconnecting)
+
+    def test_probe_pong_samples_rtt(self):
+        self.clock.advance(2)
+        self.assertEqual(self.tr.value(), msg('C|PI+'))
+        self.clock.advance(0.25)
+        self.proto.onMessage(msg('C|PO+'), False)
+        self.assertEqual(self.factory.rtt.last, 0.25)
+        self.assertEqual(self.factory.rtt.count, 1)
+        # Unsolicited PONGs are not sampled.
+        self.proto.onMessage(msg('C|PO+'), False)
+        self.assertEqual(self.factory.rtt.count, 1)
+
+    def test_close_stops_timers(self):
+        self.proto.onClose(True, 1000, 'bye')
+        self.assertEqual(self.clock.getDelayedCalls(), [])
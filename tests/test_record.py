@@ -0,0 +1,110 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from deepstreampy_twisted.patch import SnapshotError
+from deepstreampy.constants import connection_state
+from tests.utils import msg
+from twisted.internet import task
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+import sys
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+URL = "ws://localhost:7777/deepstream"
+
+
+class RecordHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.reactor = task.Clock()
+        self.client = DeepstreamClient(URL, reactor=self.reactor, factory=DeepstreamFactory)
+        self.proto = self.client._factory.buildProtocol(('localhost', 0))
+        self.client._factory._protocol_instance = self.proto
+        self.tr = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.tr)
+        self.handler = mock.Mock()
+        self.proto.sendMessage = self.handler
+        self.client._factory._set_state(connection_state.OPEN)
+        self.error_callback = mock.Mock()
+        self.client.on('error', self.error_callback)
+
+    def tearDown(self):
+        self.tr.loseConnection()
+        for call in self.reactor.getDelayedCalls():
+            call.cancel()
+
+    def test_get_record(self):
+        records = []
+        self.client.record.get_record('rec').addCallback(records.append)
+        self.handler.assert_called_with(msg('R|CR|rec+'))
+        self.assertEqual(records, [self.client.record._records['rec']])
+        self.assertEqual(records[0].name, 'rec')
+
+    def test_anonymous_record(self):
+        # The default ReactorLoop, without the Tornado bridge.
+        anonymous = []
+        self.client.record.get_anonymous_record().addCallback(anonymous.append)
+        anonymous = anonymous[0]
+        names, ready, changes = [], [], []
+        anonymous.on('nameChanged', names.append)
+        anonymous.on('ready', ready.append)
+        anonymous.subscribe(changes.append, 'city')
+
+        anonymous.name = 'first'
+        self.handler.assert_called_with(msg('R|CR|first+'))
+        self.assertEqual(names, ['first'])
+        self.client.record.handle({'topic': 'R', 'action': 'R', 'data': ['first', '1', '{"city":"Lisbon"}']})
+        self.assertEqual(anonymous.get(), {'city': 'Lisbon'})
+        self.assertEqual(ready, [self.client.record._records['first']])
+        self.assertEqual(changes, ['Lisbon'])
+
+        anonymous.name = 'second'
+        self.handler.assert_called_with(msg('R|CR|second+'))
+        self.client.record.handle({'topic': 'R', 'action': 'R', 'data': ['second', '1', '{"city":"Porto"}']})
+        self.assertEqual(names, ['first', 'second'])
+        self.assertEqual(anonymous.get('city'), 'Porto')
+        self.assertEqual(changes, ['Lisbon', 'Porto'])
+        anonymous.set('Faro', 'city')
+        self.handler.assert_called_with(msg('R|P|second|2|city|SFaro+'))
+
+    def test_snapshot(self):
+        results = []
+        self.client.record.snapshot('rec').addCallback(results.append)
+        self.handler.assert_called_with(msg('R|SN|rec+'))
+        self.client.record.handle({'topic': 'R', 'action': 'R', 'data': ['rec', '3', '{"a":1}']})
+        self.assertEqual(results, [{'a': 1}])
+
+    def test_snapshot_of_ready_record(self):
+        self.client.record.get_record('rec')
+        self.client.record.handle({'topic': 'R', 'action': 'R', 'data': ['rec', '3', '{"a":1}']})
+        self.handler.reset_mock()
+        results = []
+        self.client.record.snapshot('rec').addCallback(results.append)
+        self.handler.assert_not_called()
+        self.assertEqual(results, [{'a': 1}])
+
+    def test_snapshot_error(self):
+        d = self.client.record.snapshot('missing')
+        self.client.record.handle({'topic': 'R', 'action': 'E',
+                                   'data': ['SN', 'missing', 'RECORD_NOT_FOUND']})
+        return self.assertFailure(d, SnapshotError)
+
+    def test_snapshot_timeout(self):
+        d = self.client.record.snapshot('slow')
+        self.reactor.advance(20)
+        self.error_callback.assert_called_with(
+            'No response received in time for R|SN|slow', 'RESPONSE_TIMEOUT', 'R')
+        # A late response is ignored.
+        self.client.record.handle({'topic': 'R', 'action': 'E',
+                                   'data': ['SN', 'slow', 'RECORD_NOT_FOUND']})
+        return self.assertFailure(d, SnapshotError)
+
+    def test_snapshot_callback(self):
+        callback = mock.Mock()
+        self.assertIsNone(self.client.record.snapshot('rec', callback))
+        self.client.record.handle({'topic': 'R', 'action': 'R', 'data': ['rec', '3', '{"a":1}']})
+        callback.assert_called_once_with(None, {'a': 1})
@@ -0,0 +1,149 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from deepstreampy_twisted import codec
+from deepstreampy_twisted.record_cache import RecordCache
+from deepstreampy.constants import connection_state
+from twisted.internet import task
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+import sys
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+URL = "ws://localhost:7777/deepstream"
+
+
+class RecordCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = self.mktemp()
+
+    def test_get_put(self):
+        cache = RecordCache()
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 3, {'x': 1})
+        self.assertEqual(cache.get('a'), (3, {'x': 1}))
+        self.assertEqual(cache.version('a'), 3)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_uses_installed_codec(self):
+        calls = []
+        class RecordingCodec(object):
+            def loads(self, s):
+                calls.append('loads')
+                return codec.json.loads(s)
+            def dumps(self, obj, **kwargs):
+                calls.append('dumps')
+                return codec.json.dumps(obj, **kwargs)
+        self.addCleanup(codec.install, codec.installed())
+        codec.install(RecordingCodec())
+        cache = RecordCache()
+        cache.put('a', 3, {'x': 1})
+        self.assertEqual(cache.get('a'), (3, {'x': 1}))
+        self.assertEqual(calls, ['dumps', 'loads'])
+
+    def test_lru_eviction(self):
+        cache = RecordCache(max_bytes=30)
+        cache.put('a', 1, {'v': 'aaaa'})
+        cache.put('b', 1, {'v': 'bbbb'})
+        cache.get('a')
+        cache.put('c', 1, {'v': 'cccc'})
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.size, 30)
+
+    def test_snapshot_round_trip(self):
+        cache = RecordCache(self.path)
+        cache.put('a', 1, {'x': [1, 2]})
+        cache.put('b', 7, {'y': 'z\u00e9'})
+        cache.snapshot()
+
+        restored = RecordCache(self.path)
+        self.assertEqual(len(restored), 2)
+        self.assertEqual(restored.size, cache.size)
+        self.assertEqual(restored.get('b'), (7, {'y': 'z\u00e9'}))
+        self.assertEqual(restored.get('a'), (1, {'x': [1, 2]}))
+        # Snapshots keep LRU order, least recently used first.
+        restored.snapshot()
+        self.assertEqual(list(RecordCache(self.path)._entries), ['b', 'a'])
+
+    def test_corrupt_snapshot_is_ignored(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot')
+        cache = RecordCache(self.path)
+        self.assertEqual(len(cache), 0)
+
+    def test_periodic_snapshot(self):
+        clock = task.Clock()
+        cache = RecordCache(self.path, snapshot_interval=10)
+        source = mock.Mock(side_effect=lambda: cache.put('a', 1, {}))
+        cache.add_source(source)
+        cache.start(clock)
+        clock.advance(10)
+        source.assert_called_once_with()
+        self.assertEqual(RecordCache(self.path).get('a'), (1, {}))
+        cache.stop()
+
+
+class WarmRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.reactor = task.Clock()
+        self.cache = RecordCache()
+        self.cache.put('rec', 4, {'name': 'cached'})
+        self.client = DeepstreamClient(URL, reactor=self.reactor, factory=DeepstreamFactory,
+                                       record_cache=self.cache)
+        self.proto = self.client._factory.buildProtocol(('localhost', 0))
+        self.client._factory._protocol_instance = self.proto
+        self.tr = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.tr)
+        self.proto.sendMessage = mock.Mock()
+        self.client._factory._set_state(connection_state.OPEN)
+        self.error_callback = mock.Mock()
+        self.client.on('error', self.error_callback)
+
+    def tearDown(self):
+        self.tr.loseConnection()
+        for call in self.reactor.getDelayedCalls():
+            call.cancel()
+
+    def test_served_from_cache_then_reconciled(self):
+        self.client.record.get_record('rec')
+        record = self.client.record._records['rec']
+        self.assertTrue(record.is_ready)
+        self.assertEqual(record.get(), {'name': 'cached'})
+        self.assertEqual(record.version, 4)
+
+        callback = mock.Mock()
+        record.subscribe(callback, 'name')
+        self.client.record.handle({'topic': 'R', 'action': 'R',
+                                   'data': ['rec', '6', '{"name":"remote"}']})
+        self.assertEqual(record.version, 6)
+        callback.assert_called_once_with('remote')
+
+        # The reconciling read clears the read timeout; the subscription ack clears the other.
+        self.client.record.handle({'topic': 'R', 'action': 'A', 'data': ['S', 'rec']})
+        self.reactor.advance(20)
+        self.error_callback.assert_not_called()
+
+    def test_unchanged_version_emits_nothing(self):
+        self.client.record.get_record('rec')
+        record = self.client.record._records['rec']
+        callback = mock.Mock()
+        record.subscribe(callback)
+        self.client.record.handle({'topic': 'R', 'action': 'R',
+                                   'data': ['rec', '4', '{"name":"cached"}']})
+        callback.assert_not_called()
+
+    def test_snapshot_collects_live_records(self):
+        self.client.record.get_record('other')
+        self.client.record.handle({'topic': 'R', 'action': 'R',
+                                   'data': ['other', '1', '{"a":1}']})
+        self.cache.path = self.mktemp()
+        self.cache.snapshot()
+        self.assertEqual(self.cache.get('other'), (1, {'a': 1}))
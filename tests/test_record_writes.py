@@ -0,0 +1,83 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from deepstreampy.constants import connection_state
+from tests.utils import msg
+from twisted.internet import task
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+import sys
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+URL = "ws://localhost:7777/deepstream"
+
+
+class BatchedWritesTest(unittest.TestCase):
+    def setUp(self):
+        self.reactor = task.Clock()
+        self.client = DeepstreamClient(URL, reactor=self.reactor, factory=DeepstreamFactory,
+                                       recordWriteBatchWindow=0)
+        self.proto = self.client._factory.buildProtocol(('localhost', 0))
+        self.client._factory._protocol_instance = self.proto
+        self.tr = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.tr)
+        self.handler = mock.Mock()
+        self.proto.sendMessage = self.handler
+        self.client._factory._set_state(connection_state.OPEN)
+
+        self.client.record.get_record('rec')
+        self.record = self.client.record._records['rec']
+        self.client.record.handle({'topic': 'R', 'action': 'R',
+                                   'data': ['rec', '1', '{"a":1,"b":{"c":"x"},"d":"' + 'y' * 50 + '"}']})
+        self.handler.reset_mock()
+
+    def tearDown(self):
+        self.tr.loseConnection()
+        for call in self.reactor.getDelayedCalls():
+            call.cancel()
+
+    def test_one_path_sends_one_patch(self):
+        self.record.set(2, 'a')
+        self.record.set(3, 'a')
+        self.handler.assert_not_called()
+        self.assertEqual(self.record.get('a'), 3)
+        self.reactor.advance(0)
+        self.handler.assert_called_once_with(msg('R|P|rec|2|a|N3+'))
+        self.assertEqual(self.record.version, 2)
+
+    def test_small_record_sends_one_update(self):
+        self.record.set(2, 'a')
+        self.record.set('z', 'b.c')
+        self.record.set('w', 'd')
+        self.reactor.advance(0)
+        self.handler.assert_called_once_with(
+            msg('R|U|rec|2|{"a":2,"b":{"c":"z"},"d":"w"}+'))
+        self.assertEqual(self.record.version, 2)
+
+    def test_patches_when_smaller_than_update(self):
+        self.record.set(2, 'a')
+        self.record.set('z', 'b.c')
+        self.reactor.advance(0)
+        self.assertEqual(self.handler.call_args_list,
+                         [mock.call(msg('R|P|rec|2|a|N2+')), mock.call(msg('R|P|rec|3|b.c|Sz+'))])
+        self.assertEqual(self.record.version, 3)
+
+    def test_incoming_update_flushes_first(self):
+        self.record.set(2, 'a')
+        self.client.record.handle({'topic': 'R', 'action': 'P',
+                                   'data': ['rec', '3', 'd', 'Sremote']})
+        self.handler.assert_called_once_with(msg('R|P|rec|2|a|N2+'))
+        self.assertEqual(self.record.version, 3)
+        self.assertEqual(self.record.get('d'), 'remote')
+
+    def test_write_callback_flushes_first(self):
+        self.record.set(2, 'a')
+        self.record.set(4, 'a', callback=lambda error: None)
+        self.assertEqual(self.handler.call_args_list[0], mock.call(msg('R|P|rec|2|a|N2+')))
+        self.assertIn(3, self.record._write_callbacks)
+        self.assertEqual(self.record.version, 3)
@@ -93,6 +93,7 @@ class RPCHandlerTest(RPCParent):
         self.assertEquals(self.rpc_calls, 0)
 
         # Timeout error emitted if no ack message received on time
+        self.reactor.advance(1)
         self.wait()
         expected_error = ('No ACK message received in time for addTwo',
                           'ACK_TIMEOUT',
@@ -138,6 +139,7 @@ class RPCHandlerTest(RPCParent):
         # Timeout emitted after no ACK message received for the unprovide
         self.client_errors = []
         self.connection._io_loop.call_later(3.5, self.stop)
+        self.reactor.advance(1)
         self.wait()
         expected_error = ('No ACK message received in time for addTwo',
                           'ACK_TIMEOUT',
@@ -189,10 +191,29 @@ class RPCHandlerTest(RPCParent):
                          msg('P|REQ|addTwo|1|O{"numB":8,"numA":3}+')))
 
         self.connection._io_loop.call_later(2, self.stop)
+        self.reactor.advance(1)
         self.wait()
         rpc_callback.assert_called_with('ACK_TIMEOUT', None)
 
 
+    def test_make_deferred(self):
+        results = []
+        self.client.rpc.make('addTwo', {'numA': 3, 'numB': 8}).addCallback(results.append)
+        self.client.rpc.handle({'topic': 'RPC',
+                                'action': 'RES',
+                                'data': ['addTwo', '1', 'N11']})
+        self.assertEqual(results, [11])
+
+        failures = []
+        self.client.rpc.make('addTwo', {'numA': 3, 'numB': 8}).addErrback(failures.append)
+        self.client.rpc.handle({'topic': 'RPC',
+                                'action': 'E',
+                                'data': ['NO_PROVIDER', 'addTwo', '1']})
+        self.assertTrue(failures[0].check(rpc.RPCException))
+        self.assertEqual(str(failures[0].value), 'NO_PROVIDER')
+        self.assertEqual(self.client.rpc._rpcs, {})
+
+
 class RPCResponseTest(RPCParent):
 
     def setUp(self):
@@ -246,3 +267,79 @@ class RPCResponseTest(RPCParent):
         self.handler.assert_called_with(
             msg('P|E|Error message|addTwo|123+'))
         self.assertRaises(ValueError, functools.partial(response.send, 'abc'))
+
+
+class ProviderLimitTest(RPCParent):
+
+    def setUp(self):
+        super(ProviderLimitTest, self).setUp({})
+        self.responses = []
+
+    def _error_callback(self, *args):
+        self.client_errors.append(args)
+
+    def _hold(self, data, response):
+        self.responses.append((data, response))
+
+    def _request(self, correlation_id):
+        self.client.rpc.handle({'topic': 'P', 'action': 'REQ',
+                                'data': ['slow', correlation_id, 'N1']})
+
+    def test_queue_and_reject(self):
+        self.client.rpc.provide('slow', self._hold, max_concurrency=1, max_queue=1)
+        self._request('1')
+        self._request('2')
+        self.assertEqual(len(self.responses), 1)
+        self._request('3')
+        self.handler.assert_called_with(msg('P|REJ|slow|3+'))
+        self.assertEqual(self.client.rpc.provider_stats('slow'),
+                         {'in_flight': 1, 'queued': 1, 'completed': 0, 'errors': 0, 'rejected': 1,
+                          'latency_total': 0.0, 'latency_max': 0.0, 'latency_mean': 0.0})
+
+        self.reactor.advance(2)
+        self.responses[0][1].send(5)
+        self.handler.assert_called_with(msg('P|RES|slow|1|N5+'))
+        self.assertEqual(len(self.responses), 2)
+        stats = self.client.rpc.provider_stats()['slow']
+        self.assertEqual((stats['in_flight'], stats['queued'], stats['completed']), (1, 0, 1))
+        self.assertEqual(stats['latency_max'], 2)
+
+    def test_long_queue_drains_without_recursion(self):
+        self.client.rpc.provide('slow', self._hold, max_concurrency=1)
+        self._request('0')
+        # Everything queued behind the held request responds synchronously.
+        self.client.rpc._providers['slow'].callback = lambda data, response: response.send(data)
+        count = sys.getrecursionlimit() * 2
+        for i in range(count):
+            self._request(str(i + 1))
+        self.assertEqual(self.client.rpc.provider_stats('slow')['queued'], count)
+        self.responses[0][1].send(0)
+        stats = self.client.rpc.provider_stats('slow')
+        self.assertEqual((stats['in_flight'], stats['queued'], stats['completed']), (0, 0, count + 1))
+
+    def test_outcomes_counted_separately(self):
+        self.client.rpc.provide('slow', self._hold)
+        for i in range(3):
+            self._request(str(i))
+        self.responses[0][1].send(1)
+        self.responses[1][1].error('bad')
+        self.responses[2][1].reject()
+        stats = self.client.rpc.provider_stats('slow')
+        self.assertEqual((stats['completed'], stats['errors'], stats['rejected']), (1, 1, 1))
+
+    def test_unprovide_rejects_queued(self):
+        self.client.rpc.provide('slow', self._hold, max_concurrency=1)
+        self._request('1')
+        self._request('2')
+        self.client.rpc.unprovide('slow')
+        self.handler.assert_called_with(msg('P|REJ|slow|2+'))
+
+    def test_provider_exception_frees_slot(self):
+        def broken(data, response):
+            raise ValueError('broken')
+        self.client.rpc.provide('slow', broken, max_concurrency=1)
+        with mock.patch('deepstreampy_twisted.provider.log') as log:
+            self._request('1')
+        self.assertTrue(log.failure.called)
+        self.handler.assert_called_with(msg('P|E|broken|slow|1+'))
+        self.assertEqual(self.client.rpc.provider_stats('slow')['in_flight'], 0)
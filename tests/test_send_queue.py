@@ -0,0 +1,73 @@
+from __future__ import absolute_import, division, print_function, with_statement
+
+from deepstreampy_twisted import send_queue
+from deepstreampy_twisted.send_queue import SendQueue, QueueFullError, MessageDropped
+from twisted.trial import unittest
+
+
+class SendQueueTests(unittest.TestCase):
+    def _fill(self, queue, count):
+        return [queue.put(b'message%d' % i) for i in range(count)]
+
+    def _drain(self, queue):
+        sent = []
+        while queue:
+            raw_message, deferred = queue.popleft()
+            deferred.callback(None)
+            sent.append(raw_message)
+        return sent
+
+    def test_unbounded_by_default(self):
+        queue = SendQueue()
+        self._fill(queue, 1000)
+        self.assertEqual(len(queue), 1000)
+        self.assertEqual(queue.stats()['dropped'], 0)
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, SendQueue, policy='sometimes')
+
+    def test_drop_oldest(self):
+        queue = SendQueue(max_messages=2, policy=send_queue.DROP_OLDEST)
+        deferreds = self._fill(queue, 3)
+        self.failureResultOf(deferreds[0], MessageDropped)
+        self.assertNoResult(deferreds[2])
+        self.assertEqual(self._drain(queue), [b'message1', b'message2'])
+        self.assertEqual(queue.dropped, 1)
+
+    def test_drop_newest(self):
+        queue = SendQueue(max_bytes=16, policy=send_queue.DROP_NEWEST)
+        deferreds = self._fill(queue, 3)
+        self.failureResultOf(deferreds[2], MessageDropped)
+        self.assertEqual(self._drain(queue), [b'message0', b'message1'])
+        self.assertEqual(queue.stats()['dropped'], 1)
+        self.assertEqual(queue.stats()['bytes'], 0)
+
+    def test_reject(self):
+        queue = SendQueue(max_messages=1, policy=send_queue.REJECT)
+        deferreds = self._fill(queue, 2)
+        self.failureResultOf(deferreds[1], QueueFullError)
+        self.assertEqual(queue.rejected, 1)
+        self.assertEqual(self._drain(queue), [b'message0'])
+
+    def test_block(self):
+        queue = SendQueue(max_messages=1, policy=send_queue.BLOCK)
+        self._fill(queue, 3)
+        space = queue.wait_for_space()
+        self.assertNoResult(space)
+        self.assertEqual(queue.stats()['blocked'], 2)
+        self.assertEqual(self._drain(queue), [b'message0', b'message1', b'message2'])
+        self.assertEqual(self.successResultOf(space), None)
+
+    def test_block_is_capped(self):
+        queue = SendQueue(max_messages=1, policy=send_queue.BLOCK, max_blocked=2)
+        deferreds = self._fill(queue, 4)
+        self.failureResultOf(deferreds[3], QueueFullError)
+        self.assertEqual(queue.stats()['blocked'], 2)
+        self.assertEqual(queue.rejected, 1)
+        self.assertEqual(self._drain(queue), [b'message0', b'message1', b'message2'])
+
+    def test_oversized_message_fits_empty_queue(self):
+        queue = SendQueue(max_bytes=4, policy=send_queue.REJECT)
+        d = queue.put(b'much too large')
+        self.assertNoResult(d)
+        self.assertEqual(len(queue), 1)
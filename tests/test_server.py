@@ -0,0 +1,130 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy_twisted import DeepstreamClient
+from deepstreampy_twisted import server
+from twisted.internet import defer, reactor
+from twisted.trial import unittest
+
+
+class ServerIntegrationTest(unittest.TestCase):
+    '''Real clients talking to the in-process server over loopback WebSockets.'''
+    timeout = 10
+
+    def setUp(self):
+        self.server, self.port = server.listen(reactor=reactor)
+        self.url = 'ws://127.0.0.1:%d/deepstream' % self.port.getHost().port
+        self.clients = []
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        for client in self.clients:
+            client._factory._deliberate_close = True
+            yield client._service.stopService()
+        yield self.port.stopListening()
+
+    def connect(self, username):
+        client = DeepstreamClient(self.url, reactor=reactor)
+        client.on('error', lambda *args: None)
+        self.clients.append(client)
+        d = defer.Deferred()
+        client.connect(lambda: client.login({'username': username}).chainDeferred(d))
+        return d.addCallback(lambda result: (self.assertTrue(result['success']), client)[1])
+
+    @defer.inlineCallbacks
+    def test_events(self):
+        alice = yield self.connect('alice')
+        bob = yield self.connect('bob')
+        received = defer.Deferred()
+        acked = yield bob.event.subscribe('news', received.callback)
+        self.assertTrue(acked)
+        alice.event.emit('news', {'headline': 'hello'})
+        data = yield received
+        self.assertEqual(data, {'headline': 'hello'})
+
+    @defer.inlineCallbacks
+    def test_rpc(self):
+        alice = yield self.connect('alice')
+        bob = yield self.connect('bob')
+        bob.rpc.provide('add', lambda data, response: response.send(data['a'] + data['b']))
+        yield self.wait_until(lambda: self.server.providers.get('add'))
+        result = yield alice.rpc.make('add', {'a': 2, 'b': 3})
+        self.assertEqual(result, 5)
+        with self.assertRaises(Exception):
+            yield alice.rpc.make('missing', None)
+
+    @defer.inlineCallbacks
+    def test_records(self):
+        alice = yield self.connect('alice')
+        bob = yield self.connect('bob')
+        record = yield alice.record.get_record('profile')
+        changed = defer.Deferred()
+        other = yield bob.record.get_record('profile')
+        yield self.wait_until(lambda: other.version is not None and record.version is not None)
+        other.subscribe(changed.callback, 'city')
+        record.set('Lisbon', 'city')
+        city = yield changed
+        self.assertEqual(city, 'Lisbon')
+        self.assertEqual(self.server.records['profile'], [1, {'city': 'Lisbon'}])
+        snapshot = yield bob.record.snapshot('profile')
+        self.assertEqual(snapshot, {'city': 'Lisbon'})
+
+    @defer.inlineCallbacks
+    def test_presence_query(self):
+        alice = yield self.connect('alice')
+        yield self.connect('bob')
+        yield self.connect('carol')
+        everyone = yield alice.presence.get_all()
+        self.assertEqual(everyone, ['bob', 'carol'])
+        some = yield alice.presence.get(['carol', 'dave'])
+        self.assertEqual(some, ['carol'])
+
+    @defer.inlineCallbacks
+    def test_presence(self):
+        alice = yield self.connect('alice')
+        joined = defer.Deferred()
+        alice.presence.subscribe(lambda user, online: joined.callback((user, online)))
+        yield self.wait_until(lambda: self.server.presence_subscribers)
+        yield self.connect('bob')
+        event = yield joined
+        self.assertEqual(event, ('bob', True))
+
+    def wait_until(self, predicate, interval=0.01):
+        d = defer.Deferred()
+        def check():
+            if predicate():
+                d.callback(None)
+            else:
+                reactor.callLater(interval, check)
+        check()
+        return d
+
+
+class CompressionIntegrationTest(ServerIntegrationTest):
+    '''The same flows with permessage-deflate negotiated.'''
+
+    def setUp(self):
+        self.server, self.port = server.listen(reactor=reactor, compression=True)
+        self.url = 'ws://127.0.0.1:%d/deepstream' % self.port.getHost().port
+        self.clients = []
+
+    def connect(self, username):
+        client = DeepstreamClient(self.url, reactor=reactor, compression=True, compression_window_bits=10,
+                                  compression_min_bytes=64)
+        client.on('error', lambda *args: None)
+        self.clients.append(client)
+        d = defer.Deferred()
+        client.connect(lambda: client.login({'username': username}).chainDeferred(d))
+        return d.addCallback(lambda result: (self.assertTrue(result['success']), client)[1])
+
+    @defer.inlineCallbacks
+    def test_negotiated(self):
+        alice = yield self.connect('alice')
+        compressor = alice._factory._protocol_instance._perMessageCompress
+        self.assertIsNotNone(compressor)
+        self.assertEqual(compressor.client_max_window_bits, 10)
+        received = defer.Deferred()
+        yield alice.event.subscribe('big', received.callback)
+        alice.event.emit('big', 'x' * 10000)
+        data = yield received
+        self.assertEqual(data, 'x' * 10000)
@@ -0,0 +1,90 @@
+from __future__ import absolute_import, division, print_function, with_statement
+
+from deepstreampy_twisted.timing import TimingWheel
+from twisted.internet import task
+from twisted.trial import unittest
+
+
+class TimingWheelTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.wheel = TimingWheel(self.clock, resolution=0.1, slots=8)
+        self.fired = []
+
+    def tearDown(self):
+        for call in self.clock.getDelayedCalls():
+            call.cancel()
+
+    def test_fires_after_delay(self):
+        self.wheel.add(0.3, self.fired.append, 'a')
+        self.clock.advance(0.2)
+        self.assertEqual(self.fired, [])
+        self.clock.advance(0.1)
+        self.assertEqual(self.fired, ['a'])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_delay_longer_than_one_revolution(self):
+        self.wheel.add(2.05, self.fired.append, 'a')
+        self.clock.pump([0.1] * 20)
+        self.assertEqual(self.fired, [])
+        self.clock.advance(0.1)
+        self.assertEqual(self.fired, ['a'])
+
+    def test_same_slot_fires_in_order(self):
+        for name in 'abcdefgh':
+            self.wheel.add(0.1, self.fired.append, name)
+        self.clock.advance(0.1)
+        self.assertEqual(self.fired, list('abcdefgh'))
+
+    def test_cancel_from_same_slot(self):
+        later = []
+        self.wheel.add(0.1, lambda: later[0].cancel())
+        later.append(self.wheel.add(0.1, self.fired.append, 'b'))
+        self.clock.advance(0.1)
+        self.assertEqual(self.fired, [])
+        self.assertFalse(later[0].active())
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_cancel(self):
+        timer = self.wheel.add(0.5, self.fired.append, 'a')
+        self.assertTrue(timer.active())
+        timer.cancel()
+        self.assertFalse(timer.active())
+        self.clock.advance(1)
+        self.assertEqual(self.fired, [])
+
+    def test_only_ticks_while_timers_pending(self):
+        timer = self.wheel.add(0.5, self.fired.append, 'a')
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        timer.cancel()
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_catches_up_after_stall(self):
+        self.wheel.add(0.3, self.fired.append, 'a')
+        self.wheel.add(0.6, self.fired.append, 'b')
+        self.clock.advance(5)
+        self.assertEqual(self.fired, ['a', 'b'])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_raising_callback_does_not_stop_wheel(self):
+        def fail():
+            raise ValueError("no error listener")
+        self.wheel.add(0.1, fail)
+        self.wheel.add(0.1, self.fired.append, 'a')
+        self.clock.advance(0.1)
+        self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+        self.assertEqual(self.fired, ['a'])
+        self.wheel.add(0.2, self.fired.append, 'b')
+        self.clock.advance(0.2)
+        self.assertEqual(self.fired, ['a', 'b'])
+
+    def test_restarts_after_looper_failure(self):
+        advance = self.wheel._advance
+        self.wheel._advance = lambda ticks: 1 // 0
+        self.wheel.add(0.1, self.fired.append, 'a')
+        self.clock.advance(0.1)
+        self.assertEqual(len(self.flushLoggedErrors(ZeroDivisionError)), 1)
+        self.wheel._advance = advance
+        self.wheel.add(0.1, self.fired.append, 'b')
+        self.clock.advance(0.1)
+        self.assertIn('b', self.fired)
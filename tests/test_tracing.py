@@ -0,0 +1,85 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy_twisted import DeepstreamClient, DeepstreamFactory
+from deepstreampy_twisted.tracing import Tracer, RECEIVE, SEND, STATE, ERROR
+from deepstreampy.constants import connection_state
+from twisted.internet import task
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+
+URL = "ws://localhost:7777/deepstream"
+
+
+class TracerTests(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.tracer = Tracer(size=3, clock=lambda: self.now[0], dump_on_error=False)
+
+    def test_ring_buffer(self):
+        for i in range(5):
+            self.now[0] = i
+            self.tracer.wire(SEND, b'E\x1fEVT\x1fname%d\x1e' % i)
+        self.assertEqual(len(self.tracer), 3)
+        self.assertEqual([event[0] for event in self.tracer.snapshot()], [2, 3, 4])
+        self.assertEqual(self.tracer.dump()[0].split(), ['-2000.000ms', 'send', 'E|EVT|name2+'])
+        self.assertEqual(self.tracer.dump()[-1].split(), ['+0.000ms', 'send', 'E|EVT|name4+'])
+
+    def test_sampling_keeps_state_and_errors(self):
+        tracer = Tracer(sample=10, dump_on_error=False)
+        for i in range(25):
+            tracer.wire(RECEIVE, b'frame')
+        tracer.state(connection_state.OPEN)
+        tracer.error('C', 'CONNECTION_ERROR', 'refused')
+        self.assertEqual([event[1] for event in tracer.snapshot()], [RECEIVE, RECEIVE, STATE, ERROR])
+
+    def test_dump_on_error(self):
+        dumped = []
+        tracer = Tracer()
+        tracer.log_dump = dumped.append
+        tracer.error('X', 'MESSAGE_PARSE_ERROR')
+        self.assertEqual(dumped, ['X MESSAGE_PARSE_ERROR'])
+
+
+class ClientTracingTests(unittest.TestCase):
+    def test_off_by_default(self):
+        client = DeepstreamClient(URL, reactor=task.Clock(), factory=DeepstreamFactory)
+        self.assertIsNone(client.tracer)
+
+    def test_wire_and_state_events(self):
+        client = DeepstreamClient(URL, reactor=task.Clock(), factory=DeepstreamFactory, trace=True)
+        client.on('error', lambda *args: None)
+        tracer = client.tracer
+        tracer.dump_on_error = False
+        factory = client._factory
+        proto = factory.buildProtocol(('localhost', 0))
+        factory._protocol_instance = proto
+        proto.makeConnection(proto_helpers.StringTransport())
+        factory._set_state(connection_state.OPEN)
+        client.event.emit('news', 'hello')
+        proto.onMessage(b'E\x1fEVT\x1fnews\x1fShi\x1e', False)
+        client._on_error('E', 'MESSAGE_DENIED', 'news')
+        kinds = [(kind, detail) for _, kind, detail in tracer.snapshot()]
+        self.assertIn((STATE, connection_state.OPEN), kinds)
+        self.assertIn((SEND, b'E\x1fEVT\x1fnews\x1fShello\x1e'), kinds)
+        self.assertIn((RECEIVE, b'E\x1fEVT\x1fnews\x1fShi\x1e'), kinds)
+        self.assertEqual(kinds[-1], (ERROR, ('E', 'MESSAGE_DENIED', 'news')))
+
+    def test_auth_params_are_redacted(self):
+        reactor = task.Clock()
+        client = DeepstreamClient(URL, reactor=reactor, factory=DeepstreamFactory, trace=True)
+        client.on('error', lambda *args: None)
+        tracer = client.tracer
+        tracer.dump_on_error = False
+        factory = client._factory
+        proto = factory.buildProtocol(('localhost', 0))
+        factory._protocol_instance = proto
+        proto.makeConnection(proto_helpers.StringTransport())
+        factory._set_state(connection_state.AWAITING_AUTHENTICATION)
+        client.login({'username': 'alice', 'password': 'hunter2'})
+        reactor.advance(0)
+        client._on_error('A', 'INVALID_AUTH_DATA', 'denied')
+        dump = '\n'.join(tracer.dump())
+        self.assertIn('A|REQ|<redacted>+', dump)
+        self.assertNotIn('hunter2', dump)
+        self.assertNotIn('alice', dump)
@@ -0,0 +1,61 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+import json
+import sys
+
+from deepstreampy.constants import event, topic
+from deepstreampy.message import message_parser
+from deepstreampy_twisted import wire
+from twisted.trial import unittest
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+
+class ParseTests(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+
+    def test_matches_text_parser(self):
+        raw = 'E\x1fEVT\x1fnews\x1fShéllo\x1eC\x1fPI\x1eR\x1fP\x1frec\x1f2\x1fa.b\x1f\x1e'
+        expected = message_parser.parse(raw, self.client)
+        parsed = wire.parse(raw.encode('utf-8'), self.client)
+        self.assertEqual([(m['topic'], m['action'], m['data']) for m in parsed],
+                         [(m['topic'], m['action'], m['data']) for m in expected])
+        self.assertEqual([m['raw'] for m in parsed], [m['raw'] for m in expected])
+
+    def test_large_payload_decoded_on_read(self):
+        body = json.dumps({'text': 'é' * wire.LAZY_THRESHOLD})
+        raw = ('R\x1fR\x1fbig\x1f3\x1f' + body + '\x1e').encode('utf-8')
+        message, = wire.parse(raw, self.client)
+        self.assertIsInstance(message, wire.Message)
+        self.assertFalse(dict.__contains__(message, 'data'))
+        self.assertEqual(message['data'], ['big', '3', body])
+        self.assertEqual(message['raw'], raw[:-1].decode('utf-8'))
+        self.assertRaises(KeyError, lambda: message['other'])
+
+    def test_lazy_get_and_contains(self):
+        body = 'x' * wire.LAZY_THRESHOLD
+        raw = ('P\x1fRES\x1fname\x1fid\x1fS' + body + '\x1e').encode('utf-8')
+        message, = wire.parse(raw, self.client)
+        self.assertIn('raw', message)
+        self.assertEqual(message.get('raw', ''), raw[:-1].decode('utf-8'))
+        self.assertEqual(message.get('data'), ['name', 'id', 'S' + body])
+        self.assertIn('topic', message)
+        self.assertNotIn('other', message)
+        self.assertEqual(message.get('other', 1), 1)
+
+    def test_large_frame_of_small_messages(self):
+        raw = b''.join(b'E\x1fEVT\x1fname\x1fS' + b'x' * 600 + b'\x1e' for _ in range(3))
+        expected = message_parser.parse(raw.decode('utf-8'), self.client)
+        self.assertEqual(wire._parse_bytes(raw, self.client), expected)
+
+    def test_parse_errors(self):
+        self.assertEqual(wire.parse(b'X\x1e', self.client), [None])
+        self.client._on_error.assert_called_with(topic.ERROR, event.MESSAGE_PARSE_ERROR,
+                                                 'Insufficient message parts')
+        self.assertEqual(wire.parse(b'E\x1fNOPE\x1fname\x1e', self.client), [None])
+        self.client._on_error.assert_called_with(topic.ERROR, event.MESSAGE_PARSE_ERROR, 'Unknown action NOPE')
@@ -1,15 +1,13 @@
 def _decode(message):
-    message.replace(chr(31), '|').replace(chr(30), '+')
-    if not isinstance(message, unicode) and isinstance(message, str):
+    if isinstance(message, bytes):
         message = message.decode('utf-8')
-    message = message.replace(chr(31), '|').replace(chr(30), '+')
-    return message
+    return message.replace(chr(31), '|').replace(chr(30), '+')
 
 
 def _encode(message):
-    if isinstance(message, unicode):
+    if not isinstance(message, bytes):
         message = message.encode('utf-8')
-    return message.replace('|', chr(31)).replace('+', chr(30))
+    return message.replace(b'|', b'\x1f').replace(b'+', b'\x1e')
 
 def msg(message):
-    return _encode(message)
\ No newline at end of file
+    return _encode(message)